@@ -0,0 +1,87 @@
+"""Compare per-user scoring with shard scoring on a synthetic user base.
+
+    python -m src.benchmarks.batch_scoring --users 20000
+
+Times the request path (candidates, features and predict for one user at a
+time) on a sample of users, then ``score_users`` on whole shards, checks both
+give the same top-K and extrapolates the shard rate to ``--project`` users.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks.userxproduct_features import synthetic_priors
+from src.utils.batch_scoring import score_users
+from src.utils.candidates import generate_candidates
+from src.utils.cooccurrence import CooccurrenceIndex
+from src.utils.feature_store import DataMarker, FeatureStore
+from src.utils.features import get_all_features
+from src.utils.models import RecommendationModel
+from src.utils.model_registry import BASELINE_MODEL_PATH
+
+
+def synthetic_store(users: int, products: int = 50000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    priors = synthetic_priors(users * 100, users=users, products=products, seed=seed)
+    orders = priors.drop_duplicates("order_id")[["order_id", "user_id", "order_number"]].reset_index(drop=True)
+    orders["days_since_prior_order"] = rng.integers(0, 31, len(orders)).astype(np.float32)
+    catalog = pd.DataFrame({
+        "product_id": np.arange(1, products + 1, dtype=np.int32),
+        "aisle_id": rng.integers(1, 135, products).astype(np.int16),
+        "department_id": rng.integers(1, 22, products).astype(np.int16),
+    })
+    store = FeatureStore.build(DataMarker(0, 0, 0, 0), orders, priors.drop(columns=["order_number", "user_id"]), catalog)
+    cooccurrence = CooccurrenceIndex.build(priors["order_id"].to_numpy(), priors["product_id"].to_numpy())
+    return store, cooccurrence
+
+
+def score_one(user_id: int, store: FeatureStore, cooccurrence, model: RecommendationModel, top_k: int):
+    orders, users, userXproduct = store.user_slice(user_id)
+    pairs = generate_candidates(user_id, store, cooccurrence)
+    features = get_all_features(pairs.copy(), orders, userXproduct, users, store.products)
+    pairs["score"] = model.predict(features)
+    return pairs.sort_values("score", ascending=False, kind="stable").head(top_k)
+
+
+def run(users: int, shard_size: int, sample: int, top_k: int, threads: int, project: int):
+    start = time.perf_counter()
+    store, cooccurrence = synthetic_store(users)
+    model = RecommendationModel(BASELINE_MODEL_PATH)
+    print(f"users:      {len(store.users):,} (built in {time.perf_counter() - start:.1f} s)")
+
+    sample_ids = store.users.index.to_numpy()[:sample]
+    start = time.perf_counter()
+    single = {user_id: score_one(user_id, store, cooccurrence, model, top_k) for user_id in sample_ids}
+    per_user = (time.perf_counter() - start) / len(sample_ids)
+    print(f"per user:   {per_user * 1000:6.1f} ms/user   {1 / per_user:7.0f} users/s")
+
+    start = time.perf_counter()
+    shards = []
+    for first in range(0, users + 1, shard_size):
+        shards.append(score_users(store, model, first, first + shard_size, cooccurrence, top_k, num_threads=threads))
+    elapsed = time.perf_counter() - start
+    batch = pd.concat(shards, ignore_index=True)
+    rate = batch["user_id"].nunique() / elapsed
+    print(f"shards:     {elapsed / batch['user_id'].nunique() * 1000:6.1f} ms/user   {rate:7.0f} users/s")
+    print(f"projected:  {project:,} users in {project / rate / 60:.1f} min per worker process")
+
+    mismatches = sum(
+        not np.allclose(batch.loc[batch["user_id"] == user_id, "score"].to_numpy(), top["score"].to_numpy(), atol=1e-6)
+        for user_id, top in single.items()
+    )
+    print(f"parity:     {'ok' if not mismatches else f'{mismatches} users differ'} on {len(single)} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--shard-size", type=int, default=2000)
+    parser.add_argument("--sample", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--project", type=int, default=200000)
+    args = parser.parse_args()
+
+    run(args.users, args.shard_size, args.sample, args.top_k, args.threads, args.project)
@@ -0,0 +1,87 @@
+"""Compare candidate generation with the old global top-1000 reorder_rate list.
+
+    python -m src.benchmarks.candidates [--count 300]
+
+For every user with a ``train`` order, both candidate sets are scored with
+the LightGBM model; reported are the share of the train basket that made it
+into the candidates, recall@10 of the ranked list, rows scored and time per
+user. Point ``--csv-dir`` at the full Instacart CSVs for meaningful numbers.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.utils.candidates import generate_candidates
+from src.utils.cooccurrence import CooccurrenceIndex
+from src.utils.data_processing import ORDER_COLUMNS, PRIOR_COLUMNS, PRODUCT_COLUMNS
+from src.utils.feature_store import DataMarker, FeatureStore
+from src.utils.features import get_all_features, select_pairs_for_user
+from src.utils.models import RecommendationModel
+
+MODEL_PATH = "./src/baseline.txt"
+
+
+def read_csv(path: str, columns: dict, renames: dict = None) -> pd.DataFrame:
+    df = pd.read_csv(path).rename(columns=renames or {})
+    return df[list(columns)].astype({name: dtype for name, (_, dtype) in columns.items()})
+
+
+def load_csvs(csv_dir: str):
+    orders = read_csv(os.path.join(csv_dir, "orders.csv"), ORDER_COLUMNS)
+    priors = read_csv(os.path.join(csv_dir, "order_products__prior.csv"), PRIOR_COLUMNS)
+    train = pd.read_csv(os.path.join(csv_dir, "order_products__train.csv"))
+    products = read_csv(os.path.join(csv_dir, "products.csv"), PRODUCT_COLUMNS)
+    return orders, priors, train, products
+
+
+def rank(model: RecommendationModel, pairs: pd.DataFrame, store: FeatureStore) -> list:
+    orders, users, userXproduct = store.user_slice(int(pairs["user_id"].iloc[0]))
+    features = get_all_features(pairs.copy(), orders, userXproduct, users, store.products)
+    pairs = pairs.assign(preds=model.predict(features))
+    return pairs.sort_values("preds", ascending=False)["product_id"].head(10).tolist()
+
+
+def run(csv_dir: str, count: int, max_users: int):
+    orders, priors, train, products = load_csvs(csv_dir)
+    store = FeatureStore.build(DataMarker(0, 0, 0, 0), orders, priors, products)
+    cooccurrence = CooccurrenceIndex.build(priors["order_id"].to_numpy(), priors["product_id"].to_numpy())
+    model = RecommendationModel(model_path=MODEL_PATH)
+
+    baskets = train.merge(orders[["order_id", "user_id"]], on="order_id").groupby("user_id")["product_id"].apply(set)
+    baskets = baskets.head(max_users)
+
+    generators = {
+        "top1000": lambda user_id: select_pairs_for_user(user_id, store.products_by_reorder_rate, top_n=1000),
+        f"candidates({count})": lambda user_id: generate_candidates(user_id, store, cooccurrence, count),
+    }
+    for name, generate in generators.items():
+        coverage, recall, rows, elapsed = [], [], [], 0.0
+        for user_id, basket in baskets.items():
+            start = time.perf_counter()
+            pairs = generate(user_id)
+            top = rank(model, pairs, store)
+            elapsed += time.perf_counter() - start
+
+            candidates = set(pairs["product_id"].tolist())
+            coverage.append(len(basket & candidates) / len(basket))
+            recall.append(len(basket & set(top)) / len(basket))
+            rows.append(len(pairs))
+
+        print(
+            f"{name:<16} users {len(baskets):>6,}   basket coverage {np.mean(coverage):6.1%}"
+            f"   recall@10 {np.mean(recall):6.1%}   rows/user {np.mean(rows):7.1f}"
+            f"   {elapsed / len(baskets) * 1000:6.1f} ms/user"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv-dir", default="src/database/csvs")
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--max-users", type=int, default=2000)
+    args = parser.parse_args()
+
+    run(args.csv_dir, args.count, args.max_users)
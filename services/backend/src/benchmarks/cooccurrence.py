@@ -0,0 +1,61 @@
+"""Benchmark the co-occurrence build and lookups on synthetic baskets.
+
+    python -m src.benchmarks.cooccurrence --rows 5000000 --workers 4
+
+Builds once in-process and once with ``--workers`` processes, checks both
+give the same index, then times single-product and basket lookups on the
+memory-mapped build.
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from src.benchmarks.userxproduct_features import synthetic_priors
+from src.utils.cooccurrence import CooccurrenceIndex
+
+
+def run(rows: int, workers: int, top_k: int, lookups: int):
+    priors = synthetic_priors(rows)
+    order_ids, product_ids = priors["order_id"].to_numpy(), priors["product_id"].to_numpy()
+    print(f"rows:           {rows:,}")
+
+    builds = {}
+    for count in sorted({1, workers}):
+        start = time.perf_counter()
+        builds[count] = CooccurrenceIndex.build(order_ids, product_ids, top_k=top_k, workers=count)
+        print(f"build, {count} worker(s): {time.perf_counter() - start:6.1f} s")
+
+    single, parallel = builds[1], builds[workers]
+    for name in ("product_ids", "indptr", "neighbours", "counts"):
+        np.testing.assert_array_equal(getattr(single, name), getattr(parallel, name))
+    print(f"parity:         ok ({len(single):,} products, {len(single.neighbours):,} links)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        parallel.save(directory)
+        index = CooccurrenceIndex.load(directory)
+
+        rng = np.random.default_rng(0)
+        probes = rng.choice(index.product_ids, lookups)
+        start = time.perf_counter()
+        for product_id in probes:
+            index.lookup(product_id, 10)
+        print(f"lookup:         {(time.perf_counter() - start) / lookups * 1e6:6.1f} us")
+
+        baskets = rng.choice(index.product_ids, (lookups // 10, 10))
+        start = time.perf_counter()
+        for basket in baskets:
+            index.suggest(basket, np.ones(len(basket)), 10)
+        print(f"10-item basket: {(time.perf_counter() - start) / len(baskets) * 1e6:6.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    run(args.rows, args.workers, args.top_k, args.lookups)
@@ -0,0 +1,79 @@
+"""Compare LightGBM inference paths on real-shaped feature rows.
+
+    python -m src.benchmarks.inference [--model src/baseline.txt]
+
+Features come from candidate pairs of a synthetic user base, so they carry
+the same dtypes and missing values as a request. Checks that the float32
+matrix path and the NumPy tree traversal match the original DataFrame call,
+then reports p50/p99 latency for 100, 1000 and 10000 rows.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks.batch_scoring import synthetic_store
+from src.utils.candidates import generate_candidates
+from src.utils.features import feature_matrix, get_all_features
+from src.utils.model_registry import BASELINE_MODEL_PATH
+from src.utils.models import RecommendationModel
+
+SIZES = (100, 1000, 10000)
+
+
+def sample_features(rows: int) -> pd.DataFrame:
+    store, cooccurrence = synthetic_store(2000)
+    frames, total = [], 0
+    for user_id in store.users.index:
+        orders, users, userXproduct = store.user_slice(user_id)
+        pairs = generate_candidates(user_id, store, cooccurrence)
+        frames.append(get_all_features(pairs, orders, userXproduct, users, store.products))
+        total += len(pairs)
+        if total >= rows:
+            break
+    return pd.concat(frames, ignore_index=True)
+
+
+def timings(predict, features, repeats: int) -> str:
+    predict(features)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict(features)
+        samples.append(time.perf_counter() - start)
+    p50, p99 = np.percentile(np.array(samples) * 1000, [50, 99])
+    return f"p50 {p50:7.3f} ms  p99 {p99:7.3f} ms"
+
+
+def run(model_path: str, repeats: int):
+    features = sample_features(max(SIZES))
+    lightgbm = RecommendationModel(model_path)
+    numpy = RecommendationModel(model_path, inference="numpy")
+    booster = lightgbm.clf_model
+
+    # by the names stored in the model, which is how it was trained
+    reference = booster.predict(features[booster.feature_name()])
+    matrix = feature_matrix(features)
+    print(f"rows with missing values: {np.isnan(matrix).any(axis=1).mean():.0%}")
+    print(f"parity, float32 matrix:   max |diff| {np.abs(lightgbm.predict(matrix) - reference).max():.2e}")
+    print(f"parity, numpy traversal:  max |diff| {np.abs(numpy.predict(matrix) - reference).max():.2e}")
+
+    paths = {
+        "DataFrame -> Booster": lambda rows: booster.predict(rows[booster.feature_name()]),
+        "float32 -> Booster": lambda rows: lightgbm.predict(feature_matrix(rows)),
+        "numpy traversal": lambda rows: numpy.predict(feature_matrix(rows)),
+    }
+    for size in SIZES:
+        rows = features.iloc[:size]
+        for name, predict in paths.items():
+            print(f"{size:>6} rows  {name:<21} {timings(predict, rows, repeats if size < 10000 else repeats // 5)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=BASELINE_MODEL_PATH)
+    parser.add_argument("--repeats", type=int, default=500)
+    args = parser.parse_args()
+
+    run(args.model, args.repeats)
@@ -0,0 +1,368 @@
+"""Drive the API with a mix of shopper sessions and report latency per route.
+
+    python -m src.benchmarks.load_test --url http://localhost:8000 --duration 60 --concurrency 16
+    python -m src.benchmarks.load_test --serve --database-url postgresql+asyncpg://... --seed-csv-dir /tmp/instacart
+
+Every worker thread repeatedly logs in as a seeded user (``user<N>``, whose
+password is the username unless ``--password`` says otherwise), runs a
+weighted mix of catalog, cart, purchase history and recommendation requests
+and logs out. Throughput and p50/p95/p99 are reported per route template.
+
+``--out`` writes the results as JSON; ``--baseline`` compares them with an
+earlier file and exits non-zero when a route's p95 or the total throughput
+got worse by more than ``--tolerance``. ``--serve`` starts uvicorn against
+``--database-url`` for the run (seeding it from ``--seed-csv-dir`` first),
+so SQLite and PostgreSQL can be compared with the same command.
+
+Only the standard library is used on the client side, so the numbers are
+for a single client process; on small machines keep the client and the
+server on separate cores.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SEARCH_TERMS = ["milk", "banana", "organic", "yogurt", "chips", "water", "cheese", "bread", "coffee", "apple"]
+ACTIONS_PER_SESSION = 20
+MIN_SAMPLES_TO_COMPARE = 20
+
+
+class Client:
+    """Keep-alive HTTP connection with a cookie jar, timing every request."""
+
+    def __init__(self, url: str, timeout: float):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self.cookies: Dict[str, str] = {}
+        self.connection: Optional[http.client.HTTPConnection] = None
+
+    def request(self, method: str, path: str, params: dict = None, form: dict = None) -> Tuple[int, bytes, float]:
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params, doseq=True)}"
+        headers = {}
+        body = None
+        if form is not None:
+            body = urllib.parse.urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+
+        start = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, b"", time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+
+        for header in response.headers.get_all("Set-Cookie") or []:
+            cookie = SimpleCookie(header)
+            for name, morsel in cookie.items():
+                self.cookies[name] = morsel.value
+        return response.status, data, elapsed
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.recording = False
+
+    def record(self, route: str, status: int, elapsed: float):
+        if not self.recording:
+            return
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            self.statuses[route][status] += 1
+
+
+class Shopper:
+    """One worker's session loop; ``route`` names are the FastAPI route templates."""
+
+    def __init__(self, client: Client, recorder: Recorder, user_ids: List[int], product_ids: Tuple[int, int], password: Optional[str]):
+        self.client = client
+        self.recorder = recorder
+        self.user_ids = user_ids
+        self.product_ids = product_ids
+        self.password = password
+        self.user_id = None
+        self.cart: List[int] = []
+        self.actions: List[Tuple[int, Callable]] = [
+            (10, self.list_products),
+            (10, self.search),
+            (12, self.add_to_cart),
+            (8, self.get_cart),
+            (4, self.delete_from_cart),
+            (8, self.purchase_history),
+            (3, self.purchase_history_summary),
+            (10, self.recommendations),
+            (6, self.also_bought),
+            (3, self.get_user),
+        ]
+        self.weights = np.array([weight for weight, _ in self.actions], dtype=float)
+        self.weights /= self.weights.sum()
+
+    def call(self, route: str, method: str, path: str, **kwargs):
+        status, _, elapsed = self.client.request(method, path, **kwargs)
+        self.recorder.record(route, status, elapsed)
+
+    def product(self) -> int:
+        return random.randint(*self.product_ids)
+
+    def login(self):
+        self.user_id = random.choice(self.user_ids)
+        username = f"user{self.user_id}"
+        self.cart = []
+        self.call("POST /auth/login", "POST", "/auth/login", form={"username": username, "password": self.password or username})
+
+    def logout(self):
+        self.call("GET /auth/logout", "GET", "/auth/logout")
+
+    def list_products(self):
+        self.call("GET /products/list", "GET", "/products/list", params={"after_id": self.product() // 2, "limit": 50})
+
+    def search(self):
+        self.call("GET /products/search", "GET", "/products/search", params={"q": random.choice(SEARCH_TERMS)})
+
+    def add_to_cart(self):
+        product_id = self.product()
+        self.cart.append(product_id)
+        self.call("POST /cart/add_to_cart", "POST", "/cart/add_to_cart", form={"product_id": product_id, "quantity": 1})
+
+    def get_cart(self):
+        self.call("GET /cart/get_cart", "GET", "/cart/get_cart")
+
+    def delete_from_cart(self):
+        if self.cart:
+            product_id = self.cart.pop(random.randrange(len(self.cart)))
+            self.call("POST /cart/delete_from_cart", "POST", "/cart/delete_from_cart", form={"product_id": product_id})
+
+    def purchase_history(self):
+        self.call("GET /user/purchase_history_{user_id}", "GET", f"/user/purchase_history_{self.user_id}")
+
+    def purchase_history_summary(self):
+        self.call(
+            "GET /user/purchase_history_{user_id}?summary",
+            "GET",
+            f"/user/purchase_history_{self.user_id}",
+            params={"summary": "true", "limit": 50},
+        )
+
+    def recommendations(self):
+        self.call("GET /recommendations/user_{user_id}", "GET", f"/recommendations/user_{self.user_id}")
+
+    def also_bought(self):
+        self.call("GET /recommendations/product_{product_id}", "GET", f"/recommendations/product_{self.product()}")
+
+    def get_user(self):
+        self.call("GET /auth/get_user", "GET", "/auth/get_user")
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            self.login()
+            for index in np.random.choice(len(self.actions), ACTIONS_PER_SESSION, p=self.weights):
+                if stop.is_set():
+                    break
+                self.actions[index][1]()
+            # leave the cart as found, so repeated runs see the same data
+            for product_id in self.cart:
+                self.call("POST /cart/delete_from_cart", "POST", "/cart/delete_from_cart", form={"product_id": product_id})
+            self.logout()
+        self.client.close()
+
+
+def percentiles(samples: List[float]) -> dict:
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2), "max_ms": round(values.max(), 2)}
+
+
+def summarize(recorder: Recorder, duration: float) -> dict:
+    routes = {}
+    for route, samples in sorted(recorder.latencies.items()):
+        statuses = recorder.statuses[route]
+        routes[route] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / duration, 2),
+            "errors": sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+            **percentiles(samples),
+        }
+    everything = [sample for samples in recorder.latencies.values() for sample in samples]
+    total = {"requests": len(everything), "rps": round(len(everything) / duration, 2)}
+    if everything:
+        total.update(percentiles(everything))
+    total["errors"] = sum(route["errors"] for route in routes.values())
+    return {"routes": routes, "total": total}
+
+
+def print_report(results: dict):
+    print(f"{'route':<46} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for route, stats in list(results["routes"].items()) + [("total", results["total"])]:
+        if not stats.get("requests"):
+            continue
+        print(
+            f"{route:<46} {stats['requests']:>7} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} "
+            f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>7}"
+        )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline``, as readable lines."""
+    regressions = []
+    for route, stats in results["routes"].items():
+        base = baseline["routes"].get(route)
+        if base is None or min(base["requests"], stats["requests"]) < MIN_SAMPLES_TO_COMPARE:
+            continue
+        if stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+        if stats["errors"] > base["errors"]:
+            regressions.append(f"{route}: errors {base['errors']} -> {stats['errors']}")
+    if results["total"]["rps"] < baseline["total"]["rps"] * (1 - tolerance):
+        regressions.append(f"total: {baseline['total']['rps']:.1f} -> {results['total']['rps']:.1f} req/s")
+    return regressions
+
+
+def run_load(url: str, concurrency: int, duration: float, warmup: float, user_ids: List[int], product_ids: Tuple[int, int], password: Optional[str], timeout: float) -> dict:
+    recorder = Recorder()
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=Shopper(Client(url, timeout), recorder, user_ids, product_ids, password).run, args=(stop,), daemon=True)
+        for _ in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(warmup)
+    recorder.recording = True
+    start = time.perf_counter()
+    time.sleep(duration)
+    recorder.recording = False
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for worker in workers:
+        worker.join(timeout + 5)
+    return summarize(recorder, elapsed)
+
+
+def wait_ready(url: str, timeout: float):
+    client = Client(url, 5)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status, data, _ = client.request("GET", "/ready")
+        if status == 200 and json.loads(data).get("status") == "ready":
+            client.close()
+            return
+        time.sleep(1)
+    raise SystemExit(f"{url} did not become ready within {timeout:.0f} s")
+
+
+def serve(database_url: str, port: int, seed_csv_dir: Optional[str]) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    if seed_csv_dir:
+        env["SEED_CSV_DIR"] = seed_csv_dir
+        subprocess.run([sys.executable, "-m", "src.database.seed"], env=env, check=True)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+
+
+def parse_range(value: str) -> Tuple[int, int]:
+    first, _, last = value.partition("-")
+    return int(first), int(last or first)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds before measuring starts")
+    parser.add_argument("--users", default="1-1000", help="range of seeded user ids to log in as")
+    parser.add_argument("--products", default="1-49688", help="range of product ids to use")
+    parser.add_argument("--password", help="password of every user (default: the username)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--label", help="what was measured, e.g. the dataset; stored with the results")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--serve", action="store_true", help="start uvicorn for the run")
+    parser.add_argument("--database-url", help="DATABASE_URL of the server started by --serve")
+    parser.add_argument("--seed-csv-dir", help="seed the --serve database from these CSVs first")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if args.serve:
+        if not args.database_url:
+            parser.error("--serve needs --database-url")
+        server = serve(args.database_url, args.port, args.seed_csv_dir)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_ready(url, 600 if args.serve else 10)
+        first, last = parse_range(args.users)
+        results = run_load(
+            url, args.concurrency, args.duration, args.warmup,
+            list(range(first, last + 1)), parse_range(args.products), args.password, args.timeout,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results["meta"] = {
+        "label": args.label,
+        "url": url,
+        "database": (args.database_url or "").split("://")[0] or None,
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "users": args.users,
+        "products": args.products,
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    print_report(results)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nregressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            print("\n".join(f"  {line}" for line in regressions))
+            sys.exit(1)
+        print(f"\nno regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Benchmark ProductSearchIndex on a synthetic catalog.
+
+    python -m src.benchmarks.search_index --products 1000000
+
+Product names are drawn from the words of the real catalog plus generated
+pseudo-words with a long-tailed frequency (the most common word lands in
+roughly one name in fifteen, like "organic" in the real catalog). Queries
+mix exact, autocomplete-prefix and misspelled terms taken from those names,
+plus a worst case of pairs of the most common words.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.utils.search_index import ProductSearchIndex, tokenize
+
+PRODUCTS_CSV = "src/database/csvs/products.csv"
+AISLES_CSV = "src/database/csvs/aisles.csv"
+DEPARTMENTS_CSV = "src/database/csvs/departments.csv"
+
+
+def synthetic_catalog(products: int, words: int = 50000, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    real = sorted({token for name in pd.read_csv(PRODUCTS_CSV)["product_name"] for token in tokenize(name)})
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    fake = ["".join(rng.choice(letters, rng.integers(4, 11))) for _ in range(words)]
+    vocabulary = rng.permutation(np.array(real + fake))
+    frequency = 1 / (np.arange(len(vocabulary)) + 10) ** 1.1
+
+    aisles = dict(pd.read_csv(AISLES_CSV).itertuples(index=False, name=None))
+    departments = dict(pd.read_csv(DEPARTMENTS_CSV).itertuples(index=False, name=None))
+    aisle_ids = rng.choice(list(aisles), products)
+    department_ids = rng.choice(list(departments), products)
+
+    lengths = rng.integers(2, 7, products)
+    word_ids = rng.choice(len(vocabulary), lengths.sum(), p=frequency / frequency.sum())
+    names = [" ".join(chunk) for chunk in np.split(vocabulary[word_ids], np.cumsum(lengths)[:-1])]
+
+    rows = list(zip(
+        range(1, products + 1),
+        names,
+        rng.uniform(1, 20, products).round(2).tolist(),
+        aisle_ids.tolist(),
+        department_ids.tolist(),
+    ))
+    popularity = pd.Series(rng.zipf(1.5, products).astype(np.float64), index=np.arange(1, products + 1))
+    return rows, aisles, departments, popularity
+
+
+def misspell(word: str, rng) -> str:
+    if len(word) < 4:
+        return word
+    i = int(rng.integers(1, len(word) - 1))
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def sample_queries(rows, index: ProductSearchIndex, count: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    queries = {"exact": [], "prefix": [], "typo": [], "common": []}
+    common = [index._tokens[token_id] for token_id in np.argsort(-index._df)[:20]]
+    for row in rng.choice(len(rows), count):
+        words = tokenize(rows[row][1])[:2]
+        queries["exact"].append(" ".join(words))
+        queries["prefix"].append(" ".join(words[:-1] + [words[-1][:3]]))
+        queries["typo"].append(" ".join(misspell(word, rng) for word in words))
+        queries["common"].append(" ".join(rng.choice(common, 2, replace=False)))
+    return queries
+
+
+def run(products: int, queries: int, limit: int):
+    rows, aisles, departments, popularity = synthetic_catalog(products)
+
+    start = time.perf_counter()
+    index = ProductSearchIndex.build(rows, aisles, departments)
+    index.set_popularity(popularity)
+    print(f"products:   {products:,}")
+    print(f"vocabulary: {len(index._tokens):,} tokens")
+    print(f"build:      {time.perf_counter() - start:.1f} s")
+
+    for kind, texts in sample_queries(rows, index, queries).items():
+        timings, hits = [], 0
+        for text in texts:
+            start = time.perf_counter()
+            hits += bool(index.search(text, limit))
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        print(
+            f"{kind:<7} p50 {np.percentile(timings, 50):6.2f} ms   p99 {np.percentile(timings, 99):6.2f} ms"
+            f"   max {timings.max():6.2f} ms   with results {hits / len(texts):.0%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    run(args.products, args.queries, args.limit)
@@ -0,0 +1,224 @@
+"""Generate an Instacart-shaped dataset at any scale.
+
+    python -m src.benchmarks.synthetic_data --orders 1000000 --out /tmp/instacart
+
+Writes the same CSV files as ``src/database/csvs`` (aisles, departments,
+products, orders, order_products__prior/train), so the result seeds with
+
+    SEED_CSV_DIR=/tmp/instacart python -m src.database.seed
+
+The shape follows the public dataset: 4-100 orders per user with a long
+tail, each user's last order in the train (70%) or test (30%) set,
+baskets around 10 products, a Zipf-like product popularity, a per-user
+repertoire of favourite products that drives a reorder rate near 60%,
+weekday/hour peaks and days_since_prior_order capped at 30. Users are
+generated in chunks, so memory stays flat for millions of orders.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+USERS_PER_CHUNK = 5000
+# aisles and departments are taken from the real files, which are small
+REFERENCE_CSV_DIR = "src/database/csvs"
+
+ADJECTIVES = [
+    "Organic", "Natural", "Fresh", "Whole", "Classic", "Original", "Light", "Sweet", "Spicy", "Smoked",
+    "Roasted", "Unsweetened", "Gluten Free", "Low Fat", "Sparkling", "Baby", "Frozen", "Creamy", "Crunchy", "Wild",
+]
+NOUNS = [
+    "Banana", "Strawberries", "Spinach", "Avocado", "Milk", "Yogurt", "Cheddar", "Eggs", "Bread", "Tortillas",
+    "Chicken Breast", "Salmon", "Ground Beef", "Tofu", "Hummus", "Salsa", "Pasta", "Rice", "Oats", "Granola",
+    "Almond Butter", "Peanut Butter", "Honey", "Coffee", "Green Tea", "Orange Juice", "Sparkling Water", "Soda",
+    "Chips", "Crackers", "Cookies", "Popcorn", "Ice Cream", "Pizza", "Soup", "Beans", "Tomatoes", "Onions",
+    "Potatoes", "Apples", "Lemons", "Blueberries", "Butter", "Cream Cheese", "Mozzarella", "Bagels", "Cereal",
+    "Dish Soap", "Paper Towels", "Diapers",
+]
+FLAVOURS = ["", "", "", " with Sea Salt", " Vanilla", " Chocolate", " Original", " Family Size", " Variety Pack", " Lightly Salted"]
+
+# share of orders per weekday (0 = Sunday) and hour of day, shaped like the public data
+DOW_WEIGHTS = np.array([19, 17, 13, 12, 12, 13, 14], dtype=float)
+HOUR_WEIGHTS = np.array([1, 0.5, 0.3, 0.2, 0.2, 0.5, 1.5, 4, 7, 9, 10, 10, 9.5, 9.5, 9.5, 9, 8.5, 7, 5.5, 4, 3, 2.5, 2, 1.5])
+
+
+def _categories(rng: np.random.Generator):
+    aisles = pd.read_csv(os.path.join(REFERENCE_CSV_DIR, "aisles.csv"))
+    departments = pd.read_csv(os.path.join(REFERENCE_CSV_DIR, "departments.csv"))
+    # keep the real aisle -> department pairs where the sample products show them
+    known = pd.read_csv(
+        os.path.join(REFERENCE_CSV_DIR, "products.csv"), usecols=["aisle_id", "department_id"]
+    ).drop_duplicates("aisle_id")
+    aisle_department = aisles[["aisle_id"]].merge(known, on="aisle_id", how="left")
+    missing = aisle_department["department_id"].isna()
+    aisle_department.loc[missing, "department_id"] = rng.choice(departments["department_id"].to_numpy(), missing.sum())
+    return aisles, departments, aisle_department["department_id"].astype(int).to_numpy()
+
+
+def make_products(count: int, rng: np.random.Generator, aisle_ids: np.ndarray, aisle_departments: np.ndarray) -> pd.DataFrame:
+    names = (
+        np.array(ADJECTIVES, dtype=object)[rng.integers(0, len(ADJECTIVES), count)]
+        + " "
+        + np.array(NOUNS, dtype=object)[rng.integers(0, len(NOUNS), count)]
+        + np.array(FLAVOURS, dtype=object)[rng.integers(0, len(FLAVOURS), count)]
+    )
+    aisle_index = rng.integers(0, len(aisle_ids), count)
+    return pd.DataFrame({
+        "product_id": np.arange(1, count + 1),
+        "product_name": names,
+        "product_price": np.round(rng.uniform(1, 10, count), 2),
+        "aisle_id": aisle_ids[aisle_index],
+        "department_id": aisle_departments[aisle_index],
+    })
+
+
+def popularity(count: int, rng: np.random.Generator) -> np.ndarray:
+    """Cumulative product distribution: Zipf-like over a shuffled id order."""
+    weights = 1.0 / (np.arange(count) + 20.0) ** 1.1
+    weights = weights[rng.permutation(count)]
+    return np.cumsum(weights / weights.sum())
+
+
+def users_for(orders: int, rng: np.random.Generator) -> np.ndarray:
+    """Orders per user (4-100, mean around 16) adding up to roughly ``orders``."""
+    counts = []
+    total = 0
+    while total < orders:
+        batch = np.clip(4 + rng.geometric(1 / 13, 10000), 4, 100)
+        counts.append(batch)
+        total += batch.sum()
+    counts = np.concatenate(counts)
+    return counts[: np.searchsorted(np.cumsum(counts), orders) + 1]
+
+
+def generate_chunk(
+    rng: np.random.Generator,
+    first_user: int,
+    order_counts: np.ndarray,
+    order_ids: np.ndarray,
+    product_cdf: np.ndarray,
+    test_share: float,
+):
+    users = len(order_counts)
+    user_ids = np.arange(first_user, first_user + users)
+
+    # orders
+    order_user = np.repeat(np.arange(users), order_counts)
+    starts = np.repeat(np.cumsum(order_counts) - order_counts, order_counts)
+    order_number = np.arange(len(order_user)) - starts + 1
+    last = order_number == order_counts[order_user]
+    test_user = rng.random(users) < test_share
+    eval_set = np.where(last, np.where(test_user[order_user], "test", "train"), "prior")
+
+    user_gap = rng.gamma(2.0, 5.0, users)
+    days = np.minimum(np.round(rng.exponential(user_gap[order_user])), 30).astype(float)
+    days[order_number == 1] = np.nan
+
+    orders = pd.DataFrame({
+        "order_id": order_ids,
+        "user_id": user_ids[order_user],
+        "eval_set": eval_set,
+        "order_number": order_number,
+        "order_dow": rng.choice(7, len(order_user), p=DOW_WEIGHTS / DOW_WEIGHTS.sum()),
+        "order_hour_of_day": rng.choice(24, len(order_user), p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum()),
+        "days_since_prior_order": days,
+    })
+
+    # baskets: test orders have no products, as in the public data
+    basket_mean = rng.lognormal(np.log(10.5), 0.5, users)
+    sizes = np.clip(1 + rng.poisson(np.maximum(basket_mean[order_user] - 1, 0)), 1, 80)
+    sizes[eval_set == "test"] = 0
+    line_order = np.repeat(np.arange(len(order_user)), sizes)
+    line_user = order_user[line_order]
+
+    # every user keeps coming back to a repertoire of favourites, most often the first few
+    repertoire_size = np.clip(np.round(basket_mean * 2.5), 5, 200).astype(np.int64)
+    repertoire_start = np.cumsum(repertoire_size) - repertoire_size
+    repertoire = np.searchsorted(product_cdf, rng.random(repertoire_size.sum())) + 1
+    loyalty = rng.beta(6, 2, users)
+
+    from_repertoire = rng.random(len(line_user)) < loyalty[line_user]
+    favourite = (repertoire_size[line_user] * rng.random(len(line_user)) ** 2).astype(np.int64)
+    product_id = np.where(
+        from_repertoire,
+        repertoire[repertoire_start[line_user] + favourite],
+        np.searchsorted(product_cdf, rng.random(len(line_user))) + 1,
+    )
+
+    lines = pd.DataFrame({
+        "order": line_order,
+        "user": line_user,
+        "order_number": order_number[line_order],
+        "product_id": product_id,
+    }).drop_duplicates(["order", "product_id"])
+    lines["add_to_cart_order"] = lines.groupby("order").cumcount() + 1
+    # reordered: the user bought the product in an earlier order
+    first = lines.groupby(["user", "product_id"])["order_number"].transform("min")
+    lines["reordered"] = (lines["order_number"] > first).astype(int)
+    lines["order_id"] = order_ids[lines["order"].to_numpy()]
+    lines["train"] = eval_set[lines["order"].to_numpy()] == "train"
+
+    return orders, lines
+
+
+def generate(orders: int, products: int, out: str, seed: int, test_share: float):
+    rng = np.random.default_rng(seed)
+    os.makedirs(out, exist_ok=True)
+    start = time.perf_counter()
+
+    aisles, departments, aisle_departments = _categories(rng)
+    aisles.to_csv(os.path.join(out, "aisles.csv"), index=False)
+    departments.to_csv(os.path.join(out, "departments.csv"), index=False)
+    open(os.path.join(out, "admins.csv"), "w").close()
+    make_products(products, rng, aisles["aisle_id"].to_numpy(), aisle_departments).to_csv(
+        os.path.join(out, "products.csv"), index=False
+    )
+    product_cdf = popularity(products, rng)
+
+    order_counts = users_for(orders, rng)
+    # order ids are not grouped by user in the public data either
+    order_ids = rng.permutation(int(order_counts.sum())) + 1
+
+    paths = {name: os.path.join(out, f"{name}.csv") for name in ("orders", "order_products__prior", "order_products__train")}
+    line_columns = ["order_id", "product_id", "add_to_cart_order", "reordered"]
+    totals = {"orders": 0, "prior": 0, "train": 0, "reordered": 0}
+    offset = 0
+    for chunk_start in range(0, len(order_counts), USERS_PER_CHUNK):
+        counts = order_counts[chunk_start:chunk_start + USERS_PER_CHUNK]
+        chunk_orders, lines = generate_chunk(
+            rng, chunk_start + 1, counts, order_ids[offset:offset + counts.sum()], product_cdf, test_share
+        )
+        offset += counts.sum()
+
+        header = chunk_start == 0
+        mode = "w" if header else "a"
+        chunk_orders.to_csv(paths["orders"], mode=mode, header=header, index=False)
+        lines.loc[~lines["train"], line_columns].to_csv(paths["order_products__prior"], mode=mode, header=header, index=False)
+        lines.loc[lines["train"], line_columns].to_csv(paths["order_products__train"], mode=mode, header=header, index=False)
+
+        totals["orders"] += len(chunk_orders)
+        totals["train"] += int(lines["train"].sum())
+        totals["prior"] += int((~lines["train"]).sum())
+        totals["reordered"] += int(lines["reordered"].sum())
+        print(f"  {totals['orders']:,} orders, {totals['prior'] + totals['train']:,} lines ({time.perf_counter() - start:.0f} s)")
+
+    lines_total = totals["prior"] + totals["train"]
+    print(f"users:      {len(order_counts):,}")
+    print(f"orders:     {totals['orders']:,} ({totals['orders'] / len(order_counts):.1f} per user)")
+    print(f"lines:      {totals['prior']:,} prior, {totals['train']:,} train ({lines_total / totals['orders']:.1f} per order)")
+    print(f"reordered:  {totals['reordered'] / lines_total:.1%}")
+    print(f"written to {out} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100000, help="approximate number of orders (10k-3M)")
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--out", default="./synthetic_csvs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--test-share", type=float, default=0.3, help="share of users whose last order is a test order")
+    args = parser.parse_args()
+
+    generate(args.orders, args.products, args.out, args.seed, args.test_share)
@@ -0,0 +1,94 @@
+"""Benchmark get_userXproduct_features on a synthetic prior table.
+
+    python -m src.benchmarks.userxproduct_features --rows 10000000
+
+Also checks the result against the original itertuples implementation on
+a smaller sample (``--parity-rows``).
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.utils.features import get_userXproduct_features
+
+
+def legacy_userXproduct_features(priors: pd.DataFrame) -> pd.DataFrame:
+    priors["user_product"] = priors["product_id"] + priors["user_id"] * 100000
+    d = {}
+    for row in priors.itertuples():
+        key = row.user_product
+        if key not in d:
+            d[key] = (1, (row.order_number, row.order_id), row.add_to_cart_order)
+        else:
+            old_val = d[key]
+            new_count = old_val[0] + 1
+            new_last = max(old_val[1], (row.order_number, row.order_id))
+            new_pos_sum = old_val[2] + row.add_to_cart_order
+            d[key] = (new_count, new_last, new_pos_sum)
+
+    userXproduct = pd.DataFrame.from_dict(d, orient="index")
+    userXproduct.columns = ["nb_orders", "last_order_tuple", "sum_pos_in_cart"]
+    userXproduct["nb_orders"] = userXproduct["nb_orders"].astype(np.int16)
+    userXproduct["last_order_id"] = userXproduct["last_order_tuple"].map(lambda x: x[1]).astype(np.int32)
+    userXproduct["sum_pos_in_cart"] = userXproduct["sum_pos_in_cart"].astype(np.int16)
+    userXproduct.drop("last_order_tuple", axis=1, inplace=True)
+    return userXproduct
+
+
+def synthetic_priors(rows: int, users: int = 200000, products: int = 50000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    basket = 10
+    n_orders = max(rows // basket, 1)
+
+    order_user = rng.integers(1, users + 1, n_orders).astype(np.int32)
+    order_number = rng.integers(1, 100, n_orders).astype(np.int16)
+    order_idx = np.repeat(np.arange(n_orders), basket)[:rows]
+
+    return pd.DataFrame({
+        "order_id": (order_idx + 1).astype(np.int32),
+        "product_id": rng.zipf(1.3, rows).clip(1, products).astype(np.int32),
+        "add_to_cart_order": (np.arange(rows) % basket + 1).astype(np.int16),
+        "reordered": rng.random(rows) < 0.6,
+        "order_number": order_number[order_idx],
+        "user_id": order_user[order_idx],
+    })
+
+
+def check_parity(rows: int):
+    priors = synthetic_priors(rows, users=max(rows // 50, 1), seed=1)
+    expected = legacy_userXproduct_features(priors.copy()).sort_index()
+    actual = get_userXproduct_features(priors.copy())
+    pd.testing.assert_frame_equal(actual, expected[actual.columns])
+    print(f"parity: ok on {rows:,} rows ({len(actual):,} user x product pairs)")
+
+
+def run(rows: int):
+    priors = synthetic_priors(rows)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = get_userXproduct_features(priors)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"rows:          {rows:,}")
+    print(f"pairs:         {len(result):,}")
+    print(f"elapsed:       {elapsed:.2f} s")
+    print(f"throughput:    {rows / elapsed:,.0f} rows/s")
+    print(f"peak memory:   {peak / 2**20:,.1f} MiB")
+    print(f"result memory: {result.memory_usage(index=True).sum() / 2**20:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--parity-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.parity_rows:
+        check_parity(args.parity_rows)
+    run(args.rows)
@@ -2,11 +2,16 @@ import os
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from src.database.instrumentation import db_metrics
+
 DATABASE_URL = os.getenv("DATABASE_URL")
+# statement logging to stdout is for debugging only; timings are in /metrics
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
 
 Base = declarative_base()
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO)
+db_metrics.instrument(engine)
 async_session = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 
 from ..database.db_init import Base
@@ -56,7 +56,7 @@ class Department(Base):
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     eval_set = Column(String, nullable=False)
     order_number = Column(Integer, nullable=False)
     order_dow = Column(Integer, nullable=False)
@@ -66,14 +66,70 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     order_products = relationship("OrderProduct", back_populates="order", cascade="all, delete-orphan")
 
+    # created by migrations, declared here so the metadata matches the database
+    __table_args__ = (
+        Index("ix_orders_user_order_number", "user_id", "order_number"),
+        Index(
+            "ix_orders_prior", "id", "user_id", "order_number",
+            postgresql_where=text("eval_set = 'prior'"),
+            sqlite_where=text("eval_set = 'prior'"),
+        ),
+    )
+
 class OrderProduct(Base):
     __tablename__ = "order_products"
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
     add_to_cart_order = Column(Integer, nullable=False)
     reordered = Column(Boolean, nullable=False)
     quantity = Column(Integer, nullable=False, default=1)
 
     order = relationship("Order", back_populates="order_products")
-    product = relationship("Product", back_populates="order_products")
\ No newline at end of file
+    product = relationship("Product", back_populates="order_products")
+
+    __table_args__ = (
+        Index("ix_order_products_order_product", "order_id", "product_id"),
+    )
+
+class SeedManifest(Base):
+    __tablename__ = "seed_manifest"
+    table_name = Column(String, primary_key=True)
+    checksum = Column(String, nullable=False)
+    rows = Column(Integer, nullable=False, default=0)
+    rows_done = Column(Integer, nullable=False, default=0)
+    completed = Column(Boolean, nullable=False, default=False)
+
+# analytics rollups, maintained incrementally by src.utils.analytics
+
+class ProductRollup(Base):
+    __tablename__ = "product_rollup"
+    product_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    reorders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    sum_add_to_cart_order = Column(Integer, nullable=False, default=0)
+    first_in_cart = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+class SalesRollup(Base):
+    __tablename__ = "sales_rollup"
+    order_dow = Column(Integer, primary_key=True)
+    order_hour_of_day = Column(Integer, primary_key=True)
+    department_id = Column(Integer, primary_key=True)
+    aisle_id = Column(Integer, primary_key=True)
+    items = Column(Integer, nullable=False, default=0)
+    reorders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+
+class OrderHourRollup(Base):
+    __tablename__ = "order_hour_rollup"
+    order_dow = Column(Integer, primary_key=True)
+    order_hour_of_day = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
@@ -1,19 +1,27 @@
-import csv
+import dataclasses
+import logging
+import os
+
+import pandas as pd
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, insert
-from passlib.context import CryptContext
 
+from ..database.db_init import engine
 from ..database.db_models import User, Product, Department, Aisle, Order, OrderProduct
+from ..database.ingest import DEFAULT_CHUNK_SIZE, TableSpec, ingest_table, select_existing
+from ..database.migrations import pending_migrations
+from ..utils.security import pwd_context, hash_seed_passwords, seed_hash_pool
 
-PRODUCTS_PATH = "src/database/csvs/products.csv"
-DEPARTMENTS_PATH = "src/database/csvs/departments.csv"
-AISLES_PATH = "src/database/csvs/aisles.csv"
-ORDERS_PATH = "src/database/csvs/orders.csv"
-ORDER_PRODUCTS_PATH = "src/database/csvs/order_products__prior.csv" 
-ORDER_PRODUCTS_TRAIN_PATH = "src/database/csvs/order_products__train.csv"
+logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# another Instacart-shaped dataset, e.g. from src.benchmarks.synthetic_data
+SEED_CSV_DIR = os.getenv("SEED_CSV_DIR", "src/database/csvs")
+PRODUCTS_PATH = os.path.join(SEED_CSV_DIR, "products.csv")
+DEPARTMENTS_PATH = os.path.join(SEED_CSV_DIR, "departments.csv")
+AISLES_PATH = os.path.join(SEED_CSV_DIR, "aisles.csv")
+ORDERS_PATH = os.path.join(SEED_CSV_DIR, "orders.csv")
+ORDER_PRODUCTS_PATH = os.path.join(SEED_CSV_DIR, "order_products__prior.csv")
+ORDER_PRODUCTS_TRAIN_PATH = os.path.join(SEED_CSV_DIR, "order_products__train.csv")
 
 async def create_default_user(db: AsyncSession):
     result = await db.execute(select(User).where(User.username == "admin"))
@@ -26,139 +34,104 @@ async def create_default_user(db: AsyncSession):
         db.add(new_user)
         await db.commit()
 
-async def create_users_from_orders(db: AsyncSession):
-    user_ids = set()
-
-    with open(ORDERS_PATH, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            user_id = row.get('user_id')
-            if user_id:
-                try:
-                    user_ids.add(int(user_id))
-                except ValueError:
-                    continue
-
-    for user_id in user_ids:
-        if user_id == 0:
-            continue
-
-        result = await db.execute(select(User).where(User.id == user_id))
-        user = result.scalars().first()
-
-        if user is None:
-            username = f"user{user_id}"
-            default_password = f"user{user_id}"
-            hashed_password = pwd_context.hash(default_password)
-            new_user = User(
-                username=username,
-                hashed_password=hashed_password,
-                is_admin=False
-            )
-            db.add(new_user)
-
-    await db.commit()
-
-async def create_departments(db: AsyncSession):
-    with open(DEPARTMENTS_PATH, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            result = await db.execute(select(Department).where(Department.id == int(row['department_id'])))
-            department = result.scalars().first()
-
-            if department is None:
-                new_department = Department(
-                    id=int(row['department_id']),
-                    name=row['department']
-                )
-                db.add(new_department)
-
-    await db.commit()
-
-async def create_aisles(db: AsyncSession):
-    with open(AISLES_PATH, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            result = await db.execute(select(Aisle).where(Aisle.id == int(row['aisle_id'])))
-            aisle = result.scalars().first()
-
-            if aisle is None:
-                new_aisle = Aisle(
-                    id=int(row['aisle_id']),
-                    name=row['aisle']
-                )
-                db.add(new_aisle)
-
-    await db.commit()
-
-async def create_products(db: AsyncSession):
-    with open(PRODUCTS_PATH, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        if 'product_id' not in reader.fieldnames:
-            raise ValueError(f"'product_id' column is missing in {PRODUCTS_PATH}")
-        for row in reader:
-            result = await db.execute(select(Product).where(Product.id == int(row['product_id'])))
-            product = result.scalars().first()
-
-            if product is None:
-                new_product = Product(
-                    id=int(row['product_id']),
-                    name=row['product_name'],
-                    price=float(row['product_price']),
-                    department_id=int(row['department_id']),
-                    aisle_id=int(row['aisle_id'])
-                )
-                db.add(new_product)
-
-    await db.commit()
-
-async def create_orders(db: AsyncSession):
-    with open(ORDERS_PATH, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            result = await db.execute(select(Order).where(Order.id == int(row['order_id'])))
-            order = result.scalars().first()
-
-            if order is None:
-                days_since_prior_order = row['days_since_prior_order'].strip()
-                days_since_prior_order = float(days_since_prior_order) if days_since_prior_order else None
-
-                new_order = Order(
-                    id=int(row['order_id']),
-                    user_id=int(row['user_id']),
-                    eval_set=row['eval_set'],
-                    order_number=int(row['order_number']),
-                    order_dow=int(row['order_dow']),
-                    order_hour_of_day=int(row['order_hour_of_day']),
-                    days_since_prior_order=days_since_prior_order
-                )
-                db.add(new_order)
-
-    await db.commit()
-
-async def create_order_products(db: AsyncSession):
-    for path in [ORDER_PRODUCTS_PATH, ORDER_PRODUCTS_TRAIN_PATH]:
-        with open(path, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                result = await db.execute(select(OrderProduct).where(
-                    and_(
-                        OrderProduct.order_id == int(row['order_id']),
-                        OrderProduct.product_id == int(row['product_id'])
-                    )
-                ))
-                order_product = result.scalars().first()
-
-                if order_product is None:
-                    reordered = row['reordered']
-                    reordered = bool(int(reordered)) if reordered else False
-
-                    new_order_product = OrderProduct(
-                        order_id=int(row['order_id']),
-                        product_id=int(row['product_id']),
-                        add_to_cart_order=int(row['add_to_cart_order']),
-                        reordered=reordered
-                    )
-                    db.add(new_order_product)
-
-    await db.commit()
\ No newline at end of file
+async def _user_rows(db: AsyncSession, chunk: pd.DataFrame, pool) -> pd.DataFrame:
+    """One row per user id of an orders chunk that is not stored yet, with its seed password hashed."""
+    user_ids = chunk["id"].drop_duplicates()
+    user_ids = user_ids[user_ids != 0]
+    existing = await select_existing(db, [User.id], User.id, user_ids.tolist())
+    user_ids = user_ids[~user_ids.isin([row.id for row in existing])].tolist()
+
+    usernames = [f"user{user_id}" for user_id in user_ids]
+    return pd.DataFrame({
+        "id": user_ids,
+        "username": usernames,
+        "hashed_password": await hash_seed_passwords(usernames, pool=pool),
+        "is_admin": False,
+    })
+
+async def create_users_from_orders(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    # one pool for the whole run: worker processes start once, not per chunk
+    with seed_hash_pool() as pool:
+        spec = dataclasses.replace(USERS_SPEC, prepare=lambda session, chunk: _user_rows(session, chunk, pool))
+        await ingest_table(db, "users", spec, chunk_size)
+
+DEPARTMENTS_SPEC = TableSpec(
+    model=Department,
+    paths=[DEPARTMENTS_PATH],
+    columns={"department_id": ("id", "int"), "department": ("name", "str")},
+)
+
+AISLES_SPEC = TableSpec(
+    model=Aisle,
+    paths=[AISLES_PATH],
+    columns={"aisle_id": ("id", "int"), "aisle": ("name", "str")},
+)
+
+PRODUCTS_SPEC = TableSpec(
+    model=Product,
+    paths=[PRODUCTS_PATH],
+    columns={
+        "product_id": ("id", "int"),
+        "product_name": ("name", "str"),
+        "product_price": ("price", "float"),
+        "department_id": ("department_id", "int"),
+        "aisle_id": ("aisle_id", "int"),
+    },
+)
+
+# every user id in orders.csv, password "user<id>"; rows are built by _user_rows
+USERS_SPEC = TableSpec(
+    model=User,
+    paths=[ORDERS_PATH],
+    columns={"user_id": ("id", "int")},
+)
+
+ORDERS_SPEC = TableSpec(
+    model=Order,
+    paths=[ORDERS_PATH],
+    columns={
+        "order_id": ("id", "int"),
+        "user_id": ("user_id", "int"),
+        "eval_set": ("eval_set", "str"),
+        "order_number": ("order_number", "int"),
+        "order_dow": ("order_dow", "int"),
+        "order_hour_of_day": ("order_hour_of_day", "int"),
+        "days_since_prior_order": ("days_since_prior_order", "nullable_float"),
+    },
+)
+
+ORDER_PRODUCTS_SPEC = TableSpec(
+    model=OrderProduct,
+    paths=[ORDER_PRODUCTS_PATH, ORDER_PRODUCTS_TRAIN_PATH],
+    columns={
+        "order_id": ("order_id", "int"),
+        "product_id": ("product_id", "int"),
+        "add_to_cart_order": ("add_to_cart_order", "int"),
+        "reordered": ("reordered", "bool"),
+    },
+    key=("order_id", "product_id"),
+    constants={"quantity": 1},
+)
+
+async def create_departments(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await ingest_table(db, "departments", DEPARTMENTS_SPEC, chunk_size)
+
+async def create_aisles(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await ingest_table(db, "aisles", AISLES_SPEC, chunk_size)
+
+async def create_products(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await ingest_table(db, "products", PRODUCTS_SPEC, chunk_size)
+
+async def create_orders(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await ingest_table(db, "orders", ORDERS_SPEC, chunk_size)
+
+async def create_order_products(db: AsyncSession, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await ingest_table(db, "order_products", ORDER_PRODUCTS_SPEC, chunk_size)
+
+async def check_schema():
+    pending = await pending_migrations(engine)
+    if pending:
+        raise RuntimeError(
+            f"Database schema is not up to date (pending migrations: {', '.join(pending)}); "
+            "run `python -m src.database.seed` or `python -m src.database.migrations` first"
+        )
@@ -0,0 +1,116 @@
+"""Fail when a hot query would scan a large table end to end.
+
+    python -m src.database.explain_check [--verbose]
+
+Runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for the statements behind
+purchase history, receipts, the cart, login, the feature store refresh and
+the seed's duplicate check, with ids sampled from the database. It exits
+non-zero if any plan sequentially scans one of LARGE_TABLES. Run it against
+a seeded and migrated database: on a nearly empty PostgreSQL database the
+planner may rightly prefer sequential scans.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.future import select
+
+from src.database.db_init import engine
+from src.database.db_models import Cart, Order, OrderProduct, User
+from src.routes.user import order_page_query, order_products_query, order_summary_query
+from src.utils.data_processing import EXTENDED_PRIOR_COLUMNS, ORDER_COLUMNS, select_columns
+
+LARGE_TABLES = {"orders", "order_products", "users", "cart"}
+
+
+async def sample_ids(conn) -> Dict[str, int]:
+    user_id = await conn.scalar(select(Order.user_id).order_by(Order.id).limit(1))
+    order_ids = (await conn.execute(select(Order.id).where(Order.user_id == user_id).limit(5))).scalars().all()
+    return {
+        "user_id": user_id,
+        "username": await conn.scalar(select(User.username).where(User.id == user_id)),
+        "order_ids": list(order_ids),
+        "product_id": await conn.scalar(select(OrderProduct.product_id).where(OrderProduct.order_id == order_ids[0])),
+        "max_order_id": await conn.scalar(select(func.max(Order.id))),
+        "max_order_product_id": await conn.scalar(select(func.max(OrderProduct.id))),
+    }
+
+
+def hot_queries(ids: Dict[str, int]) -> List[Tuple[str, object]]:
+    user_id, order_ids = ids["user_id"], ids["order_ids"]
+    return [
+        ("login", select(User).where(User.username == ids["username"])),
+        ("purchase history page", order_page_query(user_id, None, 10)),
+        ("purchase history next page", order_page_query(user_id, 3, 10)),
+        ("purchase history summary", order_summary_query(user_id, 3, 10)),
+        ("order lines", order_products_query(order_ids)),
+        # as in routes/cart.py order_receipts
+        ("order receipts", select(Order.id, Order.order_number).where(Order.user_id == user_id, Order.id.in_(order_ids)).order_by(Order.order_number)),
+        ("cart", select(Cart.product_id, Cart.quantity).where(Cart.user_id == user_id)),
+        ("cart line", select(Cart.id).where(Cart.user_id == user_id, Cart.product_id == ids["product_id"])),
+        ("new orders", select_columns(ORDER_COLUMNS).where(Order.id > ids["max_order_id"] - 100)),
+        (
+            "new prior lines",
+            select_columns(EXTENDED_PRIOR_COLUMNS)
+            .join(Order, Order.id == OrderProduct.order_id)
+            .where(Order.eval_set == "prior", OrderProduct.id > ids["max_order_product_id"] - 1000),
+        ),
+        (
+            "seed duplicate check",
+            select(OrderProduct.order_id, OrderProduct.product_id).where(
+                OrderProduct.order_id >= order_ids[0], OrderProduct.order_id <= order_ids[0] + 1000
+            ),
+        ),
+    ]
+
+
+def _postgres_scans(plan: dict) -> List[str]:
+    scans = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        scans.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        scans.extend(_postgres_scans(child))
+    return scans
+
+
+async def explain(conn, stmt) -> Tuple[List[str], List[str]]:
+    """(plan lines, large tables scanned in full)."""
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "postgresql":
+        plan = json.loads((await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar())
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]["Plan"]
+        lines = (await conn.execute(text(f"EXPLAIN {sql}"))).scalars().all()
+        return lines, _postgres_scans(root)
+
+    rows = (await conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))).all()
+    lines = [row[3] for row in rows]
+    # "SCAN t" and "SCAN t USING [COVERING] INDEX i" both read every row; lookups are "SEARCH t ..."
+    scans = [line.split()[1] for line in lines if line.startswith("SCAN ") and line.split()[1] in LARGE_TABLES]
+    return lines, scans
+
+
+async def main(verbose: bool) -> int:
+    failures = 0
+    async with engine.connect() as conn:
+        ids = await sample_ids(conn)
+        for name, stmt in hot_queries(ids):
+            lines, scans = await explain(conn, stmt)
+            failures += bool(scans)
+            print(f"{'FAIL' if scans else 'ok':<5} {name}" + (f"  (full scan of {', '.join(scans)})" if scans else ""))
+            if verbose or scans:
+                print("".join(f"        {line}\n" for line in lines), end="")
+    await engine.dispose()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the query plans of hot queries.")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args.verbose)))
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ..database.db_models import SeedManifest
+from ..database.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100000
+# values per IN list when looking up rows already stored; stays under SQLite's bound parameter limit
+IN_BATCH_SIZE = 10000
+
+
+@dataclass
+class TableSpec:
+    """How a set of CSV files maps onto one table.
+
+    ``columns`` maps a CSV header to ``(db column, kind)`` where kind is one of
+    ``int``, ``float``, ``nullable_float``, ``bool`` or ``str``. ``key`` lists the
+    columns identifying an already-present row. ``prepare``, if set, turns each
+    converted chunk into the rows to insert (it may drop rows and add columns).
+    """
+
+    model: type
+    paths: List[str]
+    columns: Dict[str, Tuple[str, str]]
+    key: Tuple[str, ...] = ("id",)
+    constants: Dict[str, object] = field(default_factory=dict)
+    prepare: Optional[Callable[[AsyncSession, pd.DataFrame], Awaitable[pd.DataFrame]]] = None
+
+    @property
+    def table(self):
+        return self.model.__table__
+
+    @property
+    def db_columns(self) -> List[str]:
+        return [db_column for db_column, _ in self.columns.values()] + list(self.constants)
+
+
+def files_checksum(paths: List[str]) -> str:
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _convert(df: pd.DataFrame, spec: TableSpec) -> pd.DataFrame:
+    converted = {}
+    for csv_column, (db_column, kind) in spec.columns.items():
+        values = df[csv_column].str.strip()
+        if kind == "int":
+            converted[db_column] = values.astype(np.int64)
+        elif kind == "float":
+            converted[db_column] = values.astype(np.float64)
+        elif kind == "nullable_float":
+            numbers = pd.to_numeric(values.replace("", np.nan))
+            converted[db_column] = numbers.astype(object).where(numbers.notna(), None)
+        elif kind == "bool":
+            converted[db_column] = values.replace("", "0").astype(np.int64).astype(bool)
+        else:
+            converted[db_column] = df[csv_column]
+    for db_column, value in spec.constants.items():
+        converted[db_column] = value
+    return pd.DataFrame(converted, index=df.index)[spec.db_columns]
+
+
+def read_csv_chunks(spec: TableSpec, chunk_size: int = DEFAULT_CHUNK_SIZE, skip: int = 0):
+    """Yield converted chunks, dropping the first ``skip`` data rows across all files."""
+    for path in spec.paths:
+        reader = pd.read_csv(
+            path,
+            usecols=list(spec.columns),
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_size,
+        )
+        for chunk in reader:
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            yield _convert(chunk.iloc[skip:], spec)
+            skip = 0
+
+
+async def _table_is_empty(db: AsyncSession, spec: TableSpec) -> bool:
+    result = await db.execute(select(spec.table.c[spec.key[0]]).limit(1))
+    return result.first() is None
+
+
+async def select_existing(db: AsyncSession, columns: list, lead, values: list) -> list:
+    """Stored rows of ``columns`` whose ``lead`` column is one of ``values``, in IN batches."""
+    rows = []
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        result = await db.execute(select(*columns).where(lead.in_(values[start:start + IN_BATCH_SIZE])))
+        rows += result.all()
+    return rows
+
+
+async def _drop_existing(db: AsyncSession, spec: TableSpec, chunk: pd.DataFrame) -> pd.DataFrame:
+    if spec.key == ("id",):
+        return chunk
+
+    # keys without a unique constraint: filter against the stored rows sharing the chunk's
+    # leading key values (not their min..max range: the CSVs are not sorted by it)
+    lead = spec.key[0]
+    key_columns = [spec.table.c[name] for name in spec.key]
+    rows = await select_existing(db, key_columns, spec.table.c[lead], chunk[lead].unique().tolist())
+    existing = pd.DataFrame(rows, columns=list(spec.key))
+    if existing.empty:
+        return chunk
+
+    merged = chunk.merge(existing.drop_duplicates(), on=list(spec.key), how="left", indicator=True)
+    return chunk[(merged["_merge"] == "left_only").to_numpy()]
+
+
+async def _copy_records(db: AsyncSession, spec: TableSpec, chunk: pd.DataFrame):
+    conn = await db.connection()
+    raw_conn = await conn.get_raw_connection()
+    await raw_conn.driver_connection.copy_records_to_table(
+        spec.table.name,
+        records=chunk.itertuples(index=False, name=None),
+        columns=list(chunk.columns),
+    )
+
+
+async def _insert_records(db: AsyncSession, spec: TableSpec, chunk: pd.DataFrame):
+    stmt = dialect_insert(db, spec.table)
+    if spec.key == ("id",) and hasattr(stmt, "on_conflict_do_nothing"):
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(spec.key))
+    records = [dict(zip(chunk.columns, row)) for row in chunk.itertuples(index=False, name=None)]
+    await db.execute(stmt, records)
+
+
+async def reset_id_sequence(db: AsyncSession, table):
+    """Move a PostgreSQL id sequence past rows inserted with explicit ids."""
+    if db.bind.dialect.name != "postgresql":
+        return
+    await db.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE(MAX(id), 1)) FROM {table.name}"
+    ))
+
+
+async def ingest_table(db: AsyncSession, name: str, spec: TableSpec, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Bulk-load ``spec``'s CSV files unless the manifest says they are already seeded.
+
+    Every chunk is committed together with a checkpoint (CSV rows consumed), so
+    an interrupted run resumes where it stopped. Empty tables on PostgreSQL are
+    filled with ``COPY``; otherwise rows go in as batched multi-row inserts that
+    skip rows already present.
+    """
+    checksum = files_checksum(spec.paths)
+    manifest = await db.get(SeedManifest, name)
+    if manifest is not None and manifest.checksum == checksum and manifest.completed:
+        logger.info("%s: already seeded (%d rows), skipping", name, manifest.rows)
+        return 0
+
+    if manifest is not None and manifest.checksum == checksum:
+        resume_from = manifest.rows_done
+        dedupe = True
+        logger.info("%s: resuming after %d rows", name, resume_from)
+    else:
+        resume_from = 0
+        dedupe = not await _table_is_empty(db, spec)
+        if manifest is None:
+            manifest = SeedManifest(table_name=name)
+            db.add(manifest)
+        manifest.checksum = checksum
+        manifest.rows_done = 0
+        manifest.completed = False
+    use_copy = not dedupe and db.bind.dialect.name == "postgresql"
+
+    start = time.perf_counter()
+    consumed = resume_from
+    loaded = 0
+    for chunk in read_csv_chunks(spec, chunk_size, skip=resume_from):
+        consumed += len(chunk)
+        if dedupe:
+            chunk = await _drop_existing(db, spec, chunk)
+        if spec.prepare is not None and not chunk.empty:
+            chunk = await spec.prepare(db, chunk)
+
+        if not chunk.empty:
+            if use_copy:
+                await _copy_records(db, spec, chunk)
+            else:
+                await _insert_records(db, spec, chunk)
+            loaded += len(chunk)
+
+        manifest.rows_done = consumed
+        await db.commit()
+
+        elapsed = time.perf_counter() - start
+        logger.info("%s: %d rows loaded (%.0f rows/s)", name, loaded, loaded / max(elapsed, 1e-9))
+
+    if "id" in spec.db_columns:
+        await reset_id_sequence(db, spec.table)
+
+    manifest.rows = await db.scalar(select(func.count()).select_from(spec.table))
+    manifest.completed = True
+    await db.commit()
+
+    elapsed = time.perf_counter() - start
+    logger.info("%s: done, %d new rows in %.1f s (%.0f rows/s)", name, loaded, elapsed, loaded / max(elapsed, 1e-9))
+    return loaded
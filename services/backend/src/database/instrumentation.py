@@ -0,0 +1,212 @@
+"""Query and connection-pool metrics from SQLAlchemy engine events.
+
+Every statement is timed between ``before_cursor_execute`` and
+``after_cursor_execute`` and recorded in a histogram keyed by its
+normalized SQL (literals and bound values replaced by ``?``, IN lists and
+multi-row VALUES collapsed) and by the route that issued it. Statements
+slower than SLOW_QUERY_MS go to the ``src.database.slow_queries`` logger
+with parameter values replaced by their types.
+"""
+import functools
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.utils.metrics import Histogram, format_histograms, format_metric
+
+slow_query_logger = logging.getLogger("src.database.slow_queries")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# distinct (statement, route) series kept; the rest are counted under "<other>"
+MAX_QUERY_SERIES = int(os.getenv("MAX_QUERY_SERIES", "2000"))
+MAX_LOGGED_SQL = 2000
+
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b", re.IGNORECASE)
+_NUMBERED_PARAM = re.compile(r"\$\d+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROW_LIST = re.compile(r"(\(\?, \.\.\.\)|\(\?\))(?:\s*,\s*\1)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    sql = _WHITESPACE.sub(" ", statement).strip()
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBERED_PARAM.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?, ...)", sql)
+    return _ROW_LIST.sub(r"\1, ...", sql)
+
+
+def redact_parameters(parameters, executemany: bool) -> str:
+    """Types of the bound values, never the values themselves."""
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in parameters or ()) + ")"
+
+
+def current_route() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return "-"
+    # FastAPI puts the matched route into the scope during routing, after the middleware ran
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "-")
+
+
+class QueryRouteMiddleware:
+    """Makes the current request's scope visible to the engine event handlers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+class DatabaseMetrics:
+    def __init__(self, slow_query_ms: float, max_series: int):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.max_series = max_series
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.slow_queries = 0
+        self.pool_wait = Histogram()
+        self.pool_timeouts = 0
+        self.connections_opened = 0
+        self._engine: Optional[AsyncEngine] = None
+
+    def _series(self, statement: str) -> Tuple[str, str]:
+        key = (normalize_sql(statement), current_route())
+        if key not in self.queries and len(self.queries) >= self.max_series:
+            return ("<other>", key[1])
+        return key
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        key = self._series(statement)
+        histogram = self.queries.get(key)
+        if histogram is None:
+            histogram = self.queries[key] = Histogram()
+        histogram.observe(elapsed)
+
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries += 1
+            slow_query_logger.warning(
+                "slow query %.1f ms route=%s params=%s sql=%s",
+                elapsed * 1000,
+                key[1],
+                redact_parameters(parameters, executemany),
+                key[0][:MAX_LOGGED_SQL],
+            )
+
+    def _handle_error(self, context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        if context.statement is not None:
+            key = self._series(context.statement)
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connections_opened += 1
+
+    def _time_pool_waits(self, pool):
+        # the pool has no "waiting for a connection" event, so its getter is wrapped directly
+        do_get = pool._do_get
+
+        def timed_do_get():
+            start = time.perf_counter()
+            try:
+                return do_get()
+            except Exception:
+                self.pool_timeouts += 1
+                raise
+            finally:
+                self.pool_wait.observe(time.perf_counter() - start)
+
+        pool._do_get = timed_do_get
+
+    def instrument(self, engine: AsyncEngine):
+        self._engine = engine
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(sync_engine, "handle_error", self._handle_error)
+        event.listen(sync_engine, "connect", self._on_connect)
+        # dispose() replaces the pool
+        event.listen(sync_engine, "engine_disposed", lambda conn: self._time_pool_waits(sync_engine.pool))
+        self._time_pool_waits(sync_engine.pool)
+
+    def pool_status(self) -> dict:
+        pool = self._engine.sync_engine.pool if self._engine is not None else None
+        status = {"pool": type(pool).__name__ if pool is not None else None}
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            getter = getattr(pool, name, None)
+            if getter is not None:
+                status[name] = getter()
+        return status
+
+    def snapshot(self, top: int = 20) -> dict:
+        ranked = sorted(self.queries.items(), key=lambda item: item[1].sum, reverse=True)
+        return {
+            "statements": len({statement for statement, _ in self.queries}),
+            "slow_queries": self.slow_queries,
+            "slow_query_ms": self.slow_query_seconds * 1000,
+            "errors": sum(self.errors.values()),
+            "pool": {
+                **self.pool_status(),
+                "wait": self.pool_wait.summary(),
+                "timeouts": self.pool_timeouts,
+                "connections_opened": self.connections_opened,
+            },
+            "top_queries": [
+                {"sql": statement, "route": route, **histogram.summary()}
+                for (statement, route), histogram in ranked[:top]
+            ],
+        }
+
+    def prometheus(self) -> list:
+        pool = self.pool_status()
+        lines = format_histograms(
+            "db_query_duration_seconds",
+            "Statement execution time by normalized SQL and route.",
+            {(("statement", statement), ("route", route)): histogram for (statement, route), histogram in self.queries.items()},
+        )
+        lines += format_metric(
+            "db_query_errors_total",
+            "counter",
+            "Statements that raised, by normalized SQL and route.",
+            [((("statement", statement), ("route", route)), count) for (statement, route), count in self.errors.items()],
+        )
+        lines += format_metric("db_slow_queries_total", "counter", "Statements slower than SLOW_QUERY_MS.", [((), self.slow_queries)])
+        lines += format_histograms("db_pool_wait_seconds", "Time spent waiting for a pooled connection.", {(): self.pool_wait})
+        lines += format_metric("db_pool_timeouts_total", "counter", "Connection checkouts that failed.", [((), self.pool_timeouts)])
+        lines += format_metric("db_pool_connections_opened_total", "counter", "New DBAPI connections.", [((), self.connections_opened)])
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            if name in pool:
+                lines += format_metric(f"db_pool_{name}", "gauge", f"Connection pool {name}.", [((), pool[name])])
+        return lines
+
+
+db_metrics = DatabaseMetrics(SLOW_QUERY_MS, MAX_QUERY_SERIES)
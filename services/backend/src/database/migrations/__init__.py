@@ -0,0 +1,81 @@
+"""Versioned schema migrations.
+
+    python -m src.database.migrations [upgrade|status]
+
+A migration is a module ``mNNNN_<name>.py`` in this package with an
+``upgrade(conn)`` function taking a synchronous SQLAlchemy Connection.
+Pending migrations run in version order, each in its own transaction, and
+are recorded in ``schema_migrations``. A module that sets
+``TRANSACTIONAL = False`` gets an autocommit connection instead (PostgreSQL
+cannot run CREATE INDEX CONCURRENTLY in a transaction) and must be safe to
+re-run after a partial failure. Migrations are frozen once shipped:
+schema changes to ``db_models`` come with a new migration, never an edit to
+an old one.
+"""
+import importlib
+import logging
+import pkgutil
+import time
+from typing import List, Tuple
+
+from sqlalchemy import Column, Float, MetaData, String, Table, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    metadata,
+    Column("version", String, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", Float, nullable=False),
+)
+
+
+def available_migrations() -> List[Tuple[str, str, object]]:
+    """(version, name, module) of every migration in this package, oldest first."""
+    migrations = []
+    for info in pkgutil.iter_modules(__path__):
+        prefix, _, name = info.name.partition("_")
+        if info.ispkg or not prefix.startswith("m") or not prefix[1:].isdigit():
+            continue
+        migrations.append((prefix[1:], name, importlib.import_module(f"{__name__}.{info.name}")))
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+def _applied(sync_conn) -> set:
+    schema_migrations.create(sync_conn, checkfirst=True)
+    return set(sync_conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+async def pending_migrations(engine: AsyncEngine) -> List[str]:
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(_applied)
+    return [f"{version}_{name}" for version, name, _ in available_migrations() if version not in applied]
+
+
+async def migrate(engine: AsyncEngine) -> List[str]:
+    """Apply pending migrations; returns the ones applied."""
+    async with engine.begin() as conn:
+        applied = await conn.run_sync(_applied)
+
+    done = []
+    for version, name, module in available_migrations():
+        if version in applied:
+            continue
+        start = time.perf_counter()
+        record = schema_migrations.insert().values(version=version, name=name, applied_at=time.time())
+        if getattr(module, "TRANSACTIONAL", True):
+            async with engine.begin() as conn:
+                await conn.run_sync(module.upgrade)
+                await conn.execute(record)
+        else:
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.run_sync(module.upgrade)
+                await conn.execute(record)
+        logger.info("migration %s_%s applied in %.1f s", version, name, time.perf_counter() - start)
+        done.append(f"{version}_{name}")
+    return done
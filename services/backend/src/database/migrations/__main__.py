@@ -0,0 +1,27 @@
+import argparse
+import asyncio
+import logging
+
+from src.database.db_init import engine
+from src.database.migrations import available_migrations, migrate, pending_migrations
+
+
+async def main(command: str):
+    if command == "status":
+        pending = set(await pending_migrations(engine))
+        for version, name, _ in available_migrations():
+            migration = f"{version}_{name}"
+            print(f"{migration:<40} {'pending' if migration in pending else 'applied'}")
+    else:
+        applied = await migrate(engine)
+        print(f"{len(applied)} migrations applied" + (f": {', '.join(applied)}" if applied else ""))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations.")
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(args.command))
@@ -0,0 +1,88 @@
+"""The schema as ``Base.metadata.create_all`` used to create it.
+
+Tables that already exist are left alone, so databases created before
+migrations existed adopt this version as is.
+"""
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, MetaData, String, Table, UniqueConstraint
+
+metadata = MetaData()
+
+Table(
+    "departments",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("name", String, nullable=False, unique=True),
+)
+
+Table(
+    "aisles",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("name", String, nullable=False, unique=True),
+)
+
+Table(
+    "products",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("name", String, nullable=False),
+    Column("price", Float, nullable=False),
+    Column("department_id", Integer, ForeignKey("departments.id", ondelete="CASCADE"), nullable=False),
+    Column("aisle_id", Integer, ForeignKey("aisles.id", ondelete="CASCADE"), nullable=False),
+)
+
+Table(
+    "users",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("username", String, unique=True, index=True, nullable=False),
+    Column("hashed_password", String, nullable=False),
+    Column("is_admin", Boolean),
+)
+
+Table(
+    "cart",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("quantity", Integer),
+    Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True),
+    UniqueConstraint("product_id", "user_id", name="unique_cart_item"),
+)
+
+Table(
+    "orders",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("eval_set", String, nullable=False),
+    Column("order_number", Integer, nullable=False),
+    Column("order_dow", Integer, nullable=False),
+    Column("order_hour_of_day", Integer, nullable=False),
+    Column("days_since_prior_order", Float, nullable=True),
+)
+
+Table(
+    "order_products",
+    metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("order_id", Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("product_id", Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("add_to_cart_order", Integer, nullable=False),
+    Column("reordered", Boolean, nullable=False),
+    Column("quantity", Integer, nullable=False),
+)
+
+Table(
+    "seed_manifest",
+    metadata,
+    Column("table_name", String, primary_key=True),
+    Column("checksum", String, nullable=False),
+    Column("rows", Integer, nullable=False),
+    Column("rows_done", Integer, nullable=False),
+    Column("completed", Boolean, nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,51 @@
+"""Rollup tables for the seller analytics (src.utils.analytics).
+
+All four start empty; the first refresh fills them from the fact tables.
+"""
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "product_rollup",
+    metadata,
+    Column("product_id", Integer, primary_key=True),
+    Column("orders", Integer, nullable=False),
+    Column("reorders", Integer, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("sum_add_to_cart_order", Integer, nullable=False),
+    Column("first_in_cart", Integer, nullable=False),
+    Column("revenue", Float, nullable=False),
+)
+
+Table(
+    "sales_rollup",
+    metadata,
+    Column("order_dow", Integer, primary_key=True),
+    Column("order_hour_of_day", Integer, primary_key=True),
+    Column("department_id", Integer, primary_key=True),
+    Column("aisle_id", Integer, primary_key=True),
+    Column("items", Integer, nullable=False),
+    Column("reorders", Integer, nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("revenue", Float, nullable=False),
+)
+
+Table(
+    "order_hour_rollup",
+    metadata,
+    Column("order_dow", Integer, primary_key=True),
+    Column("order_hour_of_day", Integer, primary_key=True),
+    Column("orders", Integer, nullable=False),
+)
+
+Table(
+    "rollup_watermarks",
+    metadata,
+    Column("name", String, primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
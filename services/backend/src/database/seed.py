@@ -0,0 +1,79 @@
+"""Migrate the schema and seed the Instacart dataset.
+
+    python -m src.database.seed [--chunk-size N] [--sequential]
+
+Each table is checkpointed in ``seed_manifest`` after every chunk, so the
+command can be interrupted and rerun; finished tables are skipped. Tables
+that do not depend on each other are seeded concurrently (except on SQLite,
+which allows a single writer). The analytics rollups are brought up to date
+last, so the API workers start with nothing to backfill.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from ..database.db_init import engine, async_session
+from ..database.db_startup import (
+    create_default_user,
+    create_departments,
+    create_aisles,
+    create_products,
+    create_orders,
+    create_order_products,
+    create_users_from_orders,
+)
+from ..database.ingest import DEFAULT_CHUNK_SIZE
+from ..database.migrations import migrate
+from ..utils import analytics
+
+logger = logging.getLogger(__name__)
+
+
+async def create_users(db, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    await create_default_user(db)
+    await create_users_from_orders(db, chunk_size)
+
+
+# every level only references tables seeded by the levels before it
+SEED_LEVELS = [
+    [create_departments, create_aisles, create_users],
+    [create_products, create_orders],
+    [create_order_products],
+]
+
+
+async def _run_step(step, chunk_size: int):
+    async with async_session() as db:
+        await step(db, chunk_size=chunk_size)
+
+
+async def seed(chunk_size: int = DEFAULT_CHUNK_SIZE, parallel: bool = True):
+    start = time.perf_counter()
+    await migrate(engine)
+
+    parallel = parallel and engine.dialect.name != "sqlite"
+    for level in SEED_LEVELS:
+        if parallel:
+            await asyncio.gather(*(_run_step(step, chunk_size) for step in level))
+        else:
+            for step in level:
+                await _run_step(step, chunk_size)
+
+    async with async_session() as db:
+        rollup_start = time.perf_counter()
+        applied = await analytics.refresh(db)
+        logger.info("analytics rollups: applied %s in %.1f s", applied, time.perf_counter() - rollup_start)
+
+    await engine.dispose()
+    logger.info("seeding finished in %.1f s", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--sequential", action="store_true", help="seed one table at a time")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(seed(chunk_size=args.chunk_size, parallel=not args.sequential))
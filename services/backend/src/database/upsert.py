@@ -0,0 +1,12 @@
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_insert(db, table):
+    """``INSERT`` construct of the session's dialect, so ``ON CONFLICT`` clauses are available."""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    return insert(table)
@@ -1,19 +1,23 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 
-from src.routes import auth, products, cart, user, recommendations
-
-from src.database.db_init import engine, Base, async_session
-from src.database.db_startup import (
-    create_default_user,
-    create_departments,
-    create_aisles,
-    create_products,
-    create_orders,
-    create_order_products,
-    create_users_from_orders
-)
+from src.routes import auth, products, cart, user, recommendations, metrics, analytics
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import get_db
+from src.database.db_models import SeedManifest
+from src.database.db_startup import check_schema
+from src.database.instrumentation import QueryRouteMiddleware
+from src.utils.analytics import analytics_refresher
+from src.utils.performance import PerformanceMiddleware, loop_lag_monitor
+from src.utils.receipts import receipt_archive
+from src.utils.recommendation_workers import recommendation_workers
+from src.utils.security import PasswordPoolSaturated
+from src.utils.sessions import SessionUserError
 
 app = FastAPI()
 
@@ -25,24 +29,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(SessionMiddleware, secret_key="supersecretkey")
+app.add_middleware(QueryRouteMiddleware)
+# outermost, so its timings include the other middleware
+app.add_middleware(PerformanceMiddleware)
 
 app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(cart.router, prefix="/cart", tags=["Cart"])
 app.include_router(user.router, prefix="/user", tags=["User"])
 app.include_router(recommendations.router, prefix="/recommendations", tags=["Recommendations"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
+app.include_router(analytics.router, prefix="/analytics", tags=["Analytics"])
+
+@app.exception_handler(PasswordPoolSaturated)
+async def password_pool_saturated(request: Request, exc: PasswordPoolSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Too many authentication requests, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(SessionUserError)
+async def session_user_error(request: Request, exc: SessionUserError):
+    return JSONResponse(content={"error": exc.message})
 
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    
-    async with async_session() as db:
-        await create_default_user(db)
-        await create_departments(db)
-        await create_aisles(db)
-        await create_products(db)
-        await create_users_from_orders(db)
-        await create_orders(db)
-        await create_order_products(db)
+    await check_schema()
+    loop_lag_monitor.start()
+    analytics_refresher.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    loop_lag_monitor.stop()
+    analytics_refresher.stop()
+    recommendation_workers.shutdown()
+    receipt_archive.shutdown()
+
+@app.get("/ready", tags=["Health"])
+async def ready(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(SeedManifest))
+    tables = {
+        manifest.table_name: {"rows": manifest.rows_done, "completed": manifest.completed}
+        for manifest in result.scalars().all()
+    }
+    seeded = bool(tables) and all(table["completed"] for table in tables.values())
 
+    return {"status": "ready" if seeded else "seeding", "tables": tables}
@@ -0,0 +1,78 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db_init import get_db
+from src.utils.analytics import (
+    FUNNEL_ORDERINGS, TIME_GROUPINGS, product_detail, product_funnel, refresh, revenue_breakdown, sales_by_time,
+    status,
+)
+from src.utils.sessions import SessionUser, get_admin_user
+
+router = APIRouter()
+
+@router.get("/funnel")
+async def get_product_funnel(
+    order_by: str = Query("orders", description=", ".join(FUNNEL_ORDERINGS)),
+    limit: int = Query(20, ge=1, le=500),
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+    min_orders: int = Query(1, ge=1),
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if order_by not in FUNNEL_ORDERINGS:
+        return {"error": f"order_by must be one of: {', '.join(FUNNEL_ORDERINGS)}"}
+    return {"products": await product_funnel(db, order_by, limit, department_id, aisle_id, min_orders)}
+
+@router.get("/products/{product_id}")
+async def get_product_analytics(
+    product_id: int,
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    product = await product_detail(db, product_id)
+    if product is None:
+        return {"error": "Product not found"}
+    return product
+
+@router.get("/sales_by_time")
+async def get_sales_by_time(
+    group_by: str = Query("dow_hour", description=", ".join(TIME_GROUPINGS)),
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if group_by not in TIME_GROUPINGS:
+        return {"error": f"group_by must be one of: {', '.join(TIME_GROUPINGS)}"}
+    return {"buckets": await sales_by_time(db, group_by, department_id, aisle_id)}
+
+@router.get("/revenue")
+async def get_revenue(
+    group_by: str = Query("department", description="department or aisle"),
+    dow: Optional[List[int]] = Query(None),
+    hour_from: int = Query(0, ge=0, le=23),
+    hour_to: int = Query(23, ge=0, le=23),
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if group_by not in ("department", "aisle"):
+        return {"error": "group_by must be department or aisle"}
+    return {"groups": await revenue_breakdown(db, group_by, dow, hour_from, hour_to)}
+
+@router.get("/status")
+async def get_rollup_status(
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """How far the rollups lag behind the fact tables."""
+    return await status(db)
+
+@router.post("/refresh")
+async def refresh_rollups(
+    user: SessionUser = Depends(get_admin_user),
+    db: AsyncSession = Depends(get_db),
+):
+    return {"applied": await refresh(db)}
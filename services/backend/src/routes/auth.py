@@ -1,29 +1,18 @@
 from fastapi import APIRouter, Request, Form, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from passlib.context import CryptContext
 
 from src.database.db_models import User
 from src.database.db_init import get_db
+from src.utils.security import password_hasher
+from src.utils.sessions import (
+    SessionUser, get_current_user, remember_user, forget_user, user_cache
+)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 @router.get("/get_user")
-async def get_user_from_session(
-    request: Request,
-    db: AsyncSession = Depends(get_db),
-):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
-
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-
-    if not user:
-        return {"error": "User not found"}
-
+async def get_user_from_session(user: SessionUser = Depends(get_current_user)):
     return {
         "username": user.username,
         "is_admin": user.is_admin,
@@ -39,10 +28,10 @@ async def login(
     result = await db.execute(select(User).where(User.username == username))
     user = result.scalars().first()
 
-    if not user or not pwd_context.verify(password, user.hashed_password):
+    if not user or not await password_hasher.verify(password, user.hashed_password):
         return {"error": "Invalid credentials"}
 
-    request.session["user"] = username
+    remember_user(request, SessionUser(user.id, user.username, bool(user.is_admin)))
     return {
         "username": username,
         "is_admin": user.is_admin,
@@ -55,13 +44,14 @@ async def register(
     password: str = Form(...),
     db: AsyncSession = Depends(get_db),
 ):
-    hashed_password = pwd_context.hash(password)
     result = await db.execute(select(User).where(User.username == username))
     existing_user = result.scalars().first()
 
     if existing_user:
         return {"error": "User already exists"}
 
+    hashed_password = await password_hasher.hash(password)
+
     new_user = User(
         username=username,
         hashed_password=hashed_password,
@@ -69,12 +59,16 @@ async def register(
     )
     db.add(new_user)
     await db.commit()
+    user_cache.invalidate(username)
 
     return {"message": "Registration successful"}
 
 @router.get("/logout")
 async def logout(request: Request):
-    user = request.session.get("user")
-    request.session.pop("user", None)
+    user = forget_user(request)
+
+    return {"message": f"{user} has logged off"}
 
-    return {"message": f"{user} has logged off"}
\ No newline at end of file
+@router.get("/password_pool")
+async def get_password_pool_stats():
+    return password_hasher.stats()
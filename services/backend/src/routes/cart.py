@@ -1,64 +1,85 @@
-from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+from collections import defaultdict
+
+from fastapi import APIRouter, Request, Form, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import Integer, delete, literal, literal_column, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
-from fpdf import FPDF
-from io import BytesIO
 from datetime import datetime
+from typing import Dict, List, Optional
 
-from src.database.db_models import Cart, Product, User
+from src.database.db_models import Cart, Order, OrderProduct, Product
 from src.database.db_init import get_db
+from src.database.upsert import dialect_insert
+from src.utils.receipts import receipt_archive, receipt_key, stream_zip
+from src.utils.sessions import SessionUser, get_current_user
 
 router = APIRouter()
 
+MAX_BULK_RECEIPTS = 100
+
+class CartLine(BaseModel):
+    product_id: int
+    delta: int
+
+def _add_on_conflict(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=["product_id", "user_id"],
+        set_={"quantity": Cart.__table__.c.quantity + stmt.excluded.quantity},
+    )
+
+async def upsert_cart_lines(db: AsyncSession, user_id: int, deltas: Dict[int, int]):
+    """Add ``deltas`` (product_id -> quantity change) to the user's cart in one statement.
+
+    Relies on the ``unique_cart_item`` constraint, so concurrent calls for the same
+    line add up instead of overwriting each other. Lines go in product order, so two
+    concurrent batches lock shared lines in the same order and cannot deadlock.
+    """
+    stmt = dialect_insert(db, Cart.__table__).values([
+        {"user_id": user_id, "product_id": product_id, "quantity": delta}
+        for product_id, delta in sorted(deltas.items())
+    ])
+    return await db.execute(_add_on_conflict(stmt).returning(Cart.product_id, Cart.quantity))
+
+async def add_cart_line(db: AsyncSession, user_id: int, product_id: int, quantity: int) -> Optional[str]:
+    """Add one line in a single round trip; returns the product name, or None if the product does not exist.
+
+    The line is inserted from a SELECT on products, so an unknown product inserts
+    nothing (SQLite does not enforce the foreign key).
+    """
+    source = select(literal(user_id, Integer), Product.id, literal(quantity, Integer)).where(Product.id == product_id)
+    stmt = dialect_insert(db, Cart.__table__).from_select(["user_id", "product_id", "quantity"], source)
+    # RETURNING may only name the inserted table's columns directly; the name comes from a subquery
+    name = literal_column(
+        f"(SELECT {Product.__tablename__}.name FROM {Product.__tablename__} "
+        f"WHERE {Product.__tablename__}.id = {Cart.__tablename__}.product_id)"
+    )
+    return await db.scalar(_add_on_conflict(stmt).returning(name))
+
 @router.post("/add_to_cart")
 async def add_to_cart(
     request: Request,
     product_id: int = Form(...),
     quantity: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
-
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-    if not user:
-        return {"error": "User not found"}
-
-    result = await db.execute(select(Product).where(Product.id == product_id))
-    product = result.scalars().first()
-    if not product:
+    product_name = await add_cart_line(db, user.id, product_id, quantity)
+    if product_name is None:
         return {"error": "Product not found"}
 
-    result = await db.execute(select(Cart).where(Cart.user_id == user.id, Cart.product_id == product_id))
-    cart_item = result.scalars().first()
-
-    if cart_item:
-        cart_item.quantity += quantity
-    else:
-        new_cart_item = Cart(user_id=user.id, product_id=product_id, quantity=quantity)
-        db.add(new_cart_item)
-
     await db.commit()
-    return {"message": f"Product {product.name} added to cart"}
+    return {"message": f"Product {product_name} added to cart"}
 
 @router.get("/get_cart")
 async def get_cart(
     request: Request,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
-
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-    if not user:
-        return {"error": "User not found"}
-
     result = await db.execute(select(Cart).options(joinedload(Cart.product)).where(Cart.user_id == user.id))
     cart_items = result.scalars().all()
 
@@ -81,23 +102,17 @@ async def get_cart(
 async def delete_from_cart(
     request: Request,
     product_id: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
-
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-    if not user:
-        return {"error": "User not found"}
-
-    result = await db.execute(select(Cart).where(Cart.user_id == user.id, Cart.product_id == product_id))
-    cart_item = result.scalars().first()
-    if not cart_item:
+    result = await db.execute(
+        delete(Cart)
+        .where(Cart.user_id == user.id, Cart.product_id == product_id)
+        .returning(Cart.id)
+    )
+    if result.first() is None:
         return {"error": "Product not found in cart"}
 
-    await db.delete(cart_item)
     await db.commit()
     return {"message": f"Product with ID {product_id} removed from cart"}
 
@@ -105,100 +120,144 @@ async def delete_from_cart(
 async def increment_quantity(
     request: Request,
     product_id: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    return await add_to_cart(request=request, product_id=product_id, quantity=1, db=db)
+    return await add_to_cart(request=request, product_id=product_id, quantity=1, db=db, user=user)
 
 @router.post("/decrement_quantity")
 async def decrement_quantity(
     request: Request,
     product_id: int = Form(...),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
-
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-    if not user:
-        return {"error": "User not found"}
-
-    result = await db.execute(select(Cart).where(Cart.user_id == user.id, Cart.product_id == product_id))
-    cart_item = result.scalars().first()
-    if not cart_item:
-        return {"error": "Product not found in cart"}
-
-    if cart_item.quantity > 1:
-        cart_item.quantity -= 1
+    line = (Cart.user_id == user.id, Cart.product_id == product_id)
+    result = await db.execute(
+        update(Cart)
+        .where(*line, Cart.quantity > 1)
+        .values(quantity=Cart.quantity - 1)
+        .returning(Cart.id)
+    )
+    if result.first() is not None:
         await db.commit()
         return {"message": f"Quantity of product with ID {product_id} decremented by 1"}
-    else:
-        await db.delete(cart_item)
-        await db.commit()
-        return {"message": f"Product with ID {product_id} removed from cart"}
+
+    result = await db.execute(delete(Cart).where(*line, Cart.quantity <= 1).returning(Cart.id))
+    if result.first() is None:
+        return {"error": "Product not found in cart"}
+
+    await db.commit()
+    return {"message": f"Product with ID {product_id} removed from cart"}
+
+@router.post("/batch_update")
+async def batch_update(
+    lines: List[CartLine],
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
+):
+    if not lines:
+        return {"error": "No cart lines given"}
+
+    deltas = {}
+    for line in lines:
+        deltas[line.product_id] = deltas.get(line.product_id, 0) + line.delta
+
+    result = await db.execute(select(Product.id).where(Product.id.in_(list(deltas))))
+    missing = sorted(set(deltas) - set(result.scalars().all()))
+    if missing:
+        return {"error": "Product not found", "product_ids": missing}
+
+    result = await upsert_cart_lines(db, user.id, deltas)
+    quantities = dict(result.all())
+    await db.execute(
+        delete(Cart).where(
+            Cart.user_id == user.id,
+            Cart.product_id.in_(list(deltas)),
+            Cart.quantity <= 0,
+        )
+    )
+    await db.commit()
+
+    return {
+        "message": f"{len(deltas)} cart lines updated",
+        "cart": [
+            {"product_id": product_id, "quantity": quantity}
+            for product_id, quantity in quantities.items()
+            if quantity > 0
+        ],
+    }
 
 @router.get("/generate_receipt")
 async def generate_receipt(
     request: Request,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
 ):
-    username = request.session.get("user")
-    if not username:
-        return {"error": "User not logged in"}
+    result = await db.execute(
+        select(Cart.product_id, Product.name, Cart.quantity, Product.price)
+        .join(Product, Cart.product_id == Product.id)
+        .where(Cart.user_id == user.id)
+        .order_by(Cart.id)
+    )
+    lines = [tuple(row) for row in result.all()]
+    if not lines:
+        return {"error": "Cart is empty"}
 
-    result = await db.execute(select(User).where(User.username == username))
-    user = result.scalars().first()
-    if not user:
-        return {"error": "User not found"}
+    # the same cart maps to the same archived file for the rest of the day, dated when it was first generated
+    now = datetime.now()
+    path = await receipt_archive.get(
+        receipt_key("cart", user.id, f"{user.username}:{now.strftime('%Y-%m-%d')}", lines),
+        f"Receipt for {user.username}",
+        f"Date: {now.strftime('%Y-%m-%d %H:%M:%S')}",
+        lines,
+    )
 
-    result = await db.execute(select(Cart).options(joinedload(Cart.product)).where(Cart.user_id == user.id))
-    cart_items = result.scalars().all()
-    if not cart_items:
-        return {"error": "Cart is empty"}
+    file_name = f"receipt_{user.username}_{now.strftime('%Y-%m-%d')}.pdf"
+    return FileResponse(path, media_type="application/pdf", filename=file_name)
+
+@router.get("/order_receipts")
+async def order_receipts(
+    order_ids: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
+):
+    query = select(Order.id, Order.order_number).where(Order.user_id == user.id)
+    if order_ids:
+        query = query.where(Order.id.in_(order_ids))
+    result = await db.execute(query.order_by(Order.order_number).limit(MAX_BULK_RECEIPTS))
+    orders = result.all()
+    if not orders:
+        return {"error": "No orders found"}
+
+    result = await db.execute(
+        select(OrderProduct.order_id, Product.id, Product.name, OrderProduct.quantity, Product.price)
+        .join(Product, OrderProduct.product_id == Product.id)
+        .where(OrderProduct.order_id.in_([order.id for order in orders]))
+        .order_by(OrderProduct.order_id, OrderProduct.add_to_cart_order)
+    )
+    lines = defaultdict(list)
+    for order_id, *line in result.all():
+        lines[order_id].append(tuple(line))
 
-    buffer = BytesIO()
-    pdf = FPDF()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, f"Receipt for {user.username}", ln=True, align="C")
-    pdf.set_font("Arial", 'I', 12)
-    pdf.cell(200, 10, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True, align="C")
-    pdf.ln(10)
-    pdf.set_font("Arial", 'B', 12)
-    page_width = pdf.w - 2 * pdf.l_margin
-    col_widths = [page_width * 0.35, (page_width * 0.65) / 3, (page_width * 0.65) / 3, (page_width * 0.65) / 3]
-    pdf.cell(col_widths[0], 10, "Product Name", border=1, align="C")
-    pdf.cell(col_widths[1], 10, "Quantity", border=1, align="C")
-    pdf.cell(col_widths[2], 10, "Price", border=1, align="C")
-    pdf.cell(col_widths[3], 10, "Total", border=1, align="C")
-    pdf.ln()
-    pdf.set_font("Arial", size=12)
-    total_price = 0
-
-    for item in cart_items:
-        total_item_price = item.product.price * item.quantity
-        pdf.cell(col_widths[0], 10, item.product.name, border=1)
-        pdf.cell(col_widths[1], 10, str(item.quantity), border=1, align="C")
-        pdf.cell(col_widths[2], 10, f"${item.product.price:.2f}", border=1, align="C")
-        pdf.cell(col_widths[3], 10, f"${total_item_price:.2f}", border=1, align="C")
-        pdf.ln()
-        total_price += total_item_price
-
-    pdf.ln(5)
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(col_widths[0] + col_widths[1] + col_widths[2], 10, "Total Price" + "\t"*7, border=1, align="R")
-    pdf.cell(col_widths[3], 10, f"${total_price:.2f}", border=1, align="C")
-    pdf_output = pdf.output(dest='S').encode('latin1')
-
-    file_name = f"receipt_{user.username}_{datetime.now().strftime('%Y-%m-%d')}.pdf"
-    buffer.write(pdf_output)
-    buffer.seek(0)
+    # start every render now; the ZIP streams them in order as they finish
+    entries = [
+        (
+            f"receipt_order_{order.order_number}.pdf",
+            asyncio.ensure_future(receipt_archive.get(
+                receipt_key("order", user.id, str(order.id), lines[order.id]),
+                f"Receipt for {user.username}",
+                f"Order #{order.order_number}",
+                lines[order.id],
+            )),
+        )
+        for order in orders
+        if lines[order.id]
+    ]
 
+    file_name = f"receipts_{user.username}_{datetime.now().strftime('%Y-%m-%d')}.zip"
     return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
+        stream_zip(entries),
+        media_type="application/zip",
         headers={"Content-Disposition": f"attachment; filename={file_name}"}
-    )
\ No newline at end of file
+    )
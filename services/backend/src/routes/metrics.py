@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+
+from src.database.instrumentation import db_metrics
+from src.utils.performance import http_metrics, profiler
+from src.utils.sessions import SessionUser, get_admin_user
+
+router = APIRouter()
+
+@router.get("", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text exposition format."""
+    return PlainTextResponse(
+        "\n".join(http_metrics.prometheus() + db_metrics.prometheus()) + "\n",
+        media_type="text/plain; version=0.0.4",
+    )
+
+@router.get("/db")
+async def database_metrics(top: int = Query(20, ge=1, le=200)):
+    """Pool state and the statements with the most total time, for reading by hand."""
+    return db_metrics.snapshot(top)
+
+@router.get("/profile")
+async def profile_summary(user: SessionUser = Depends(get_admin_user)):
+    """Profiled requests and stack samples per route."""
+    return profiler.summary()
+
+@router.get("/profile/folded", response_class=PlainTextResponse)
+async def profile_folded(
+    route: str = Query(..., description="Route template, e.g. /user/purchase_history_{id}"),
+    user: SessionUser = Depends(get_admin_user),
+):
+    """Collapsed stacks for flamegraph.pl or speedscope."""
+    return PlainTextResponse(profiler.folded(route))
+
+@router.delete("/profile")
+async def reset_profile(user: SessionUser = Depends(get_admin_user)):
+    profiler.reset()
+    return {"message": "Profile samples cleared"}
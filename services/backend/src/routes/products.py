@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Request, Form, Depends
+from fastapi import APIRouter, Request, Form, Depends, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import text
+from typing import Optional
 
 from src.database.db_models import Product, Department, Aisle
 from src.database.db_init import get_db
-from src.routes.auth import get_user_from_session
+from src.utils.catalog import catalog_cache, catalog_query, etag_matches, export_ndjson, product_row
+from src.utils.search_index import get_search_index, index_product_added, index_product_removed
 
 router = APIRouter()
 
@@ -18,10 +21,6 @@ async def add_product(
     aisle: int = Form(...),
     db: AsyncSession = Depends(get_db),
 ):
-    user = await get_user_from_session(request, db)
-    if user is None:
-        return {"error": "User is not logged in"}
-
     department_obj = await db.execute(select(Department).where(Department.id == department))
     department_obj = department_obj.scalars().first()
 
@@ -41,6 +40,10 @@ async def add_product(
     )
     db.add(new_product)
     await db.commit()
+    catalog_cache.invalidate()
+    index_product_added(
+        new_product.id, name, price, aisle, aisle_obj.name, department, department_obj.name
+    )
 
     return {"message": f"Product '{name}' was added successfully"}
 
@@ -50,10 +53,6 @@ async def delete_product(
     product_id: int = Form(...),
     db: AsyncSession = Depends(get_db),
 ):
-    user = await get_user_from_session(request, db)
-    if user is None:
-        return {"error": "User is not logged in"}
-
     result = await db.execute(select(Product).where(Product.id == product_id))
     product = result.scalars().first()
 
@@ -62,25 +61,62 @@ async def delete_product(
 
     await db.delete(product)
     await db.commit()
+    catalog_cache.invalidate()
+    index_product_removed(product_id)
 
-    result = await db.execute(select(Product))
-    products = result.scalars().all()
-
-    return {
-        "message": f"Product '{product.name}' deleted",
-        "products": products,
-    }
+    return {"message": f"Product '{product.name}' deleted"}
 
 @router.get("/get_all_products")
-async def get_all_products(db: AsyncSession = Depends(get_db)):
+async def get_all_products(request: Request, db: AsyncSession = Depends(get_db)):
     try:
-        result = await db.execute(select(Product))
-        products = result.scalars().all()
+        snapshot = await catalog_cache.get(db)
 
-        if not products:
+        if not snapshot.count:
             return {"error": "No products found"}
 
-        return {"products": products}
+        headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+            return Response(status_code=304, headers=headers)
+
+        return Response(snapshot.body, media_type="application/json", headers=headers)
 
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@router.get("/list")
+async def list_products(
+    after_id: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    stmt = catalog_query(department_id, aisle_id).where(Product.id > after_id).limit(limit + 1)
+    result = await db.execute(stmt)
+    rows = result.all()
+
+    page = rows[:limit]
+    return {
+        "products": [product_row(row) for row in page],
+        "next_after_id": page[-1].id if len(rows) > limit else None,
+    }
+
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    index = await get_search_index(db)
+    return {"products": index.search(q, limit)}
+
+@router.get("/export")
+async def export_products(
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+):
+    return StreamingResponse(
+        export_ndjson(department_id, aisle_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=products.ndjson"},
+    )
@@ -1,75 +1,157 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, Form, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from src.database.db_models import Order, OrderProduct, Product
+from src.database.db_models import Cart, Product
 from src.database.db_init import get_db
+from src.utils.sessions import SessionUser, get_admin_user, get_current_user
 
 from src.utils.models import RecommendationModel
-from src.utils.data_processing import (
-    orders_to_df, orderproducts_to_df, products_to_df, extend_priors
-)
-from src.utils.features import (
-    get_product_features, get_user_features, get_userXproduct_features,
-    get_all_features, select_pairs_for_user
-)
+from src.utils.model_registry import ModelRegistryError, model_registry
+from src.utils.feature_store import FeatureStore, check_feature_store_later, current_feature_store, get_feature_store
+from src.utils.candidates import CANDIDATE_COUNT, get_popularity_lists
+from src.utils.cooccurrence import get_cooccurrence_index
+from src.utils.recommendation_cache import recommendation_cache
+from src.utils.recommendation_workers import RecommendationTimeout, recommendation_workers
 
 router = APIRouter()
 
-rec_model = RecommendationModel(model_path="./src/baseline.txt")
+async def recommend_for_user(
+    db: AsyncSession,
+    store: FeatureStore,
+    user_id: int,
+    candidates: int,
+    model: RecommendationModel,
+) -> dict:
+    cooccurrence = await get_cooccurrence_index(db)
+    product_ids, preds = await recommendation_workers.score(store, cooccurrence, model, user_id, candidates)
+    recommended_products = product_ids[np.argsort(-preds, kind="stable")[:10]].tolist()
+
+    return {
+        "user_id": user_id,
+        "recommended_products": await _names(db, recommended_products),
+    }
+
+async def _names(db: AsyncSession, product_ids) -> list:
+    result_product_names = await db.execute(
+        select(Product.id, Product.name).where(Product.id.in_(product_ids))
+    )
+    product_names = {row.id: row.name for row in result_product_names}
+
+    return [
+        {"product_id": product_id, "name": product_names.get(product_id, "Unknown")}
+        for product_id in product_ids
+    ]
 
 @router.get("/user_{user_id}")
 async def predict_recommendations(
     user_id: int,
+    response: Response,
+    candidates: int = Query(CANDIDATE_COUNT, ge=10, le=5000),
     db: AsyncSession = Depends(get_db)
 ):
-    result_orders = await db.execute(select(Order))
-    orders_list = result_orders.scalars().all()
-    df_orders = orders_to_df(orders_list)
+    # cache hits are served against the store in memory; new orders reach it (and invalidate
+    # their users' entries) through the background check, not a database round trip per request
+    store = current_feature_store()
+    if store is None:
+        store = await get_feature_store(db)
+    else:
+        check_feature_store_later()
+    model = await model_registry.current()
+    try:
+        payload, status = await recommendation_cache.get(
+            user_id,
+            str(candidates),
+            store,
+            model.version,
+            db,
+            lambda session: recommend_for_user(session, store, user_id, candidates, model),
+        )
+    except RecommendationTimeout:
+        popular = get_popularity_lists(store).overall[:10].tolist()
+        payload = {"user_id": user_id, "recommended_products": await _names(db, popular)}
+        status = "fallback"
+    response.headers["X-Cache"] = status
+    return payload
 
-    prior_orders_ids = df_orders[df_orders["eval_set"] == "prior"]["order_id"].unique().tolist()
-    result_op_prior = await db.execute(
-        select(OrderProduct).where(OrderProduct.order_id.in_(prior_orders_ids))
-    )
-    priors_list = result_op_prior.scalars().all()
-    df_priors = orderproducts_to_df(priors_list)
-
-    result_products = await db.execute(select(Product))
-    products_list = result_products.scalars().all()
-    df_products = products_to_df(products_list)
-
-    df_priors = extend_priors(df_priors, df_orders)
-    df_products = get_product_features(df_priors, df_products)
-    df_products.set_index("product_id", inplace=True, drop=False)
-    users_df = get_user_features(df_priors, df_orders)
-    userXproduct_df = get_userXproduct_features(df_priors)
-
-    df_pairs = select_pairs_for_user(user_id, df_products, top_n=1000)
-    df_features = get_all_features(
-        df_pairs.copy(),
-        df_orders,
-        userXproduct_df,
-        users_df,
-        df_products
-    )
+@router.get("/cache_stats")
+async def cache_stats():
+    return {**recommendation_cache.snapshot_stats(), "workers": recommendation_workers.snapshot_stats()}
 
-    preds = rec_model.predict(df_features)
-    df_pairs["preds"] = preds
-    df_pairs_sorted = df_pairs.sort_values("preds", ascending=False).head(10)
 
-    recommended_products = df_pairs_sorted["product_id"].tolist()
+async def _with_names(db: AsyncSession, product_ids, scores):
+    """Attach product names, dropping products that no longer exist."""
+    product_ids = [int(product_id) for product_id in product_ids]
+    result = await db.execute(select(Product.id, Product.name).where(Product.id.in_(product_ids)))
+    names = {row.id: row.name for row in result}
+    return [
+        {"product_id": product_id, "name": names[product_id], "score": round(float(score), 4)}
+        for product_id, score in zip(product_ids, scores)
+        if product_id in names
+    ]
 
-    result_product_names = await db.execute(
-        select(Product.id, Product.name).where(Product.id.in_(recommended_products))
+@router.get("/product_{product_id}")
+async def also_bought(
+    product_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+):
+    cooccurrence = await get_cooccurrence_index(db)
+    neighbours, counts = cooccurrence.lookup(product_id, limit)
+
+    return {
+        "product_id": product_id,
+        "recommended_products": await _with_names(db, neighbours, counts),
+    }
+
+@router.get("/cart")
+async def cart_suggestions(
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    user: SessionUser = Depends(get_current_user),
+):
+    result = await db.execute(select(Cart.product_id, Cart.quantity).where(Cart.user_id == user.id))
+    lines = result.all()
+    if not lines:
+        return {"recommended_products": []}
+
+    cooccurrence = await get_cooccurrence_index(db)
+    product_ids, scores = cooccurrence.suggest(
+        [line.product_id for line in lines],
+        [line.quantity for line in lines],
+        limit,
     )
-    product_names = {row.id: row.name for row in result_product_names}
 
-    recommended_products_with_names = [
-        {"product_id": product_id, "name": product_names.get(product_id, "Unknown")}
-        for product_id in recommended_products
-    ]
+    return {"recommended_products": await _with_names(db, product_ids, scores)}
 
-    return {
-        "user_id": user_id,
-        "recommended_products": recommended_products_with_names
-    }
\ No newline at end of file
+@router.get("/models")
+async def list_models(user: SessionUser = Depends(get_admin_user)):
+    await model_registry.current()
+    return model_registry.status()
+
+@router.post("/models/activate")
+async def activate_model(
+    version: str = Form(...),
+    user: SessionUser = Depends(get_admin_user),
+):
+    try:
+        await model_registry.activate(version)
+    except ModelRegistryError as exc:
+        return {"error": exc.message}
+    return {"message": f"Model '{version}' is live", "live": version}
+
+@router.post("/models/shadow")
+async def shadow_model(
+    version: Optional[str] = Form(None),
+    user: SessionUser = Depends(get_admin_user),
+):
+    try:
+        await model_registry.set_shadow(version)
+    except ModelRegistryError as exc:
+        return {"error": exc.message}
+    if version is None:
+        return {"message": "Shadow scoring disabled", "shadow": None}
+    return {"message": f"Model '{version}' is scored in shadow", "shadow": version}
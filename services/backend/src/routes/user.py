@@ -1,16 +1,21 @@
+from collections import defaultdict
 from datetime import datetime
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
-from src.database.db_init import get_db
+from src.database.db_init import async_session, get_db
 from src.database.db_models import User, Order, OrderProduct, Product
 
 router = APIRouter()
 
+MAX_HISTORY_PAGE_SIZE = 100
+EXPORT_BATCH_SIZE = 200
+
 class ProductInOrder(BaseModel):
     product_id: int
     name: str
@@ -19,69 +24,161 @@ class ProductInOrder(BaseModel):
 
 class OrderHistory(BaseModel):
     order_id: int
-    order_date: Optional[datetime]
+    # orders carry no timestamp; kept so existing clients still find the field
+    order_date: Optional[datetime] = None
+    order_number: int
     products: List[ProductInOrder]
 
+class OrderSummary(BaseModel):
+    order_id: int
+    order_number: int
+    lines: int
+    items: int
+    total: float
+
 class UserPurchaseHistory(BaseModel):
     user_id: int
     username: str
     purchase_history: List[OrderHistory]
+    next_after: Optional[int]
+
+class UserPurchaseSummary(BaseModel):
+    user_id: int
+    username: str
+    orders: List[OrderSummary]
+    next_after: Optional[int]
 
 class NoPurchaseHistoryMessage(BaseModel):
     message: str
 
-PurchaseHistoryResponse = Union[UserPurchaseHistory, NoPurchaseHistoryMessage]
+class ErrorMessage(BaseModel):
+    error: str
+
+PurchaseHistoryResponse = Union[UserPurchaseHistory, UserPurchaseSummary, NoPurchaseHistoryMessage, ErrorMessage]
+
+def order_products_query(order_ids: List[int]):
+    return (
+        select(OrderProduct.order_id, Product.id, Product.name, Product.price, OrderProduct.quantity)
+        .join(Product, OrderProduct.product_id == Product.id)
+        .where(OrderProduct.order_id.in_(order_ids))
+        .order_by(OrderProduct.order_id, OrderProduct.add_to_cart_order)
+    )
+
+def order_page_query(user_id: int, after: Optional[int], limit: Optional[int]):
+    query = select(Order.id, Order.order_number).where(Order.user_id == user_id)
+    if after is not None:
+        query = query.where(Order.order_number > after)
+    return query.order_by(Order.order_number).limit(limit)
+
+def order_summary_query(user_id: int, after: Optional[int], limit: Optional[int]):
+    query = (
+        select(
+            Order.id,
+            Order.order_number,
+            func.count(OrderProduct.id).label("lines"),
+            func.coalesce(func.sum(OrderProduct.quantity), 0).label("items"),
+            func.coalesce(func.sum(OrderProduct.quantity * Product.price), 0).label("total"),
+        )
+        .outerjoin(OrderProduct, OrderProduct.order_id == Order.id)
+        .outerjoin(Product, OrderProduct.product_id == Product.id)
+        .where(Order.user_id == user_id)
+        .group_by(Order.id, Order.order_number)
+    )
+    if after is not None:
+        query = query.where(Order.order_number > after)
+    return query.order_by(Order.order_number).limit(limit)
+
+async def _order_products(db: AsyncSession, order_ids: List[int]) -> Dict[int, List[ProductInOrder]]:
+    result = await db.execute(order_products_query(order_ids))
+    products = defaultdict(list)
+    for row in result.all():
+        products[row.order_id].append(
+            ProductInOrder(product_id=row.id, name=row.name, price=row.price, quantity=row.quantity)
+        )
+    return products
+
+async def _order_page(db: AsyncSession, user_id: int, after: Optional[int], limit: Optional[int]) -> List[OrderHistory]:
+    result = await db.execute(order_page_query(user_id, after, limit))
+    orders = result.all()
+    if not orders:
+        return []
+
+    products = await _order_products(db, [order.id for order in orders])
+    return [
+        OrderHistory(order_id=order.id, order_number=order.order_number, products=products[order.id])
+        for order in orders
+    ]
 
 @router.get("/purchase_history_{user_id}", response_model=PurchaseHistoryResponse)
 async def get_purchase_history(
     user_id: int,
+    after: Optional[int] = Query(None, description="order_number of the last order on the previous page"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE_SIZE, description="page size; all orders when omitted"),
+    summary: bool = False,
     db: AsyncSession = Depends(get_db)
 ):
-    result_user = await db.execute(select(User).where(User.id == user_id))
-    user = result_user.scalars().first()
+    """The user's orders, oldest first, or one page of them with ``limit``; pass ``next_after`` back as ``after`` for the next page."""
+    result_user = await db.execute(select(User.id, User.username).where(User.id == user_id))
+    user = result_user.first()
 
     if not user:
-        return {"error": "User not found"}
-
-    result_orders = await db.execute(
-        select(Order)
-        .where(Order.user_id == user_id)
-        .options(selectinload(Order.order_products).selectinload(OrderProduct.product))
-    )
-    orders = result_orders.scalars().all()
-
-    if not orders:
+        return ErrorMessage(error="User not found")
+
+    if summary:
+        result = await db.execute(order_summary_query(user_id, after, limit))
+        orders = [
+            OrderSummary(order_id=row.id, order_number=row.order_number, lines=row.lines, items=row.items, total=round(row.total, 2))
+            for row in result.all()
+        ]
+    else:
+        orders = await _order_page(db, user_id, after, limit)
+
+    if not orders and after is None:
         return NoPurchaseHistoryMessage(message="No purchase history")
 
-    purchase_history = []
-    for order in orders:
-        order_date = getattr(order, 'order_date', None)
-
-        products_in_order = []
-        for op in order.order_products:
-            product = op.product
-            if product:
-                products_in_order.append(
-                    ProductInOrder(
-                        product_id=product.id,
-                        name=product.name,
-                        price=product.price,
-                        quantity=op.quantity
-                    )
-                )
-
-        purchase_history.append(
-            OrderHistory(
-                order_id=order.id,
-                order_date=order_date,
-                products=products_in_order
-            )
-        )
+    next_after = orders[-1].order_number if limit is not None and len(orders) == limit else None
+    if summary:
+        return UserPurchaseSummary(user_id=user.id, username=user.username, orders=orders, next_after=next_after)
+    return UserPurchaseHistory(user_id=user.id, username=user.username, purchase_history=orders, next_after=next_after)
+
+@router.get("/purchase_history_{user_id}/order_{order_id}", response_model=Union[OrderHistory, ErrorMessage])
+async def get_order(
+    user_id: int,
+    order_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        select(Order.id, Order.order_number).where(Order.id == order_id, Order.user_id == user_id)
+    )
+    order = result.first()
+    if not order:
+        return ErrorMessage(error="Order not found")
+
+    products = await _order_products(db, [order.id])
+    return OrderHistory(order_id=order.id, order_number=order.order_number, products=products[order.id])
+
+@router.get("/purchase_history_{user_id}/export")
+async def export_purchase_history(user_id: int, db: AsyncSession = Depends(get_db)):
+    """Every order as one JSON object per line, read in keyset pages while the response streams."""
+    user_exists = await db.scalar(select(User.id).where(User.id == user_id))
+    if user_exists is None:
+        return {"error": "User not found"}
 
-    return UserPurchaseHistory(
-        user_id=user.id,
-        username=user.username,
-        purchase_history=purchase_history
+    async def lines():
+        # the request session is closed once the handler returns, so the stream opens its own
+        async with async_session() as session:
+            after = None
+            while True:
+                orders = await _order_page(session, user_id, after, EXPORT_BATCH_SIZE)
+                if not orders:
+                    break
+                yield "".join(order.model_dump_json() + "\n" for order in orders)
+                after = orders[-1].order_number
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=purchase_history_{user_id}.ndjson"}
     )
 
 @router.get("/get_all_users")
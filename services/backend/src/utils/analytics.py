@@ -0,0 +1,436 @@
+"""Seller analytics served from rollup tables.
+
+    python -m src.utils.analytics [refresh|rebuild|status]
+
+Three rollups are kept next to the fact tables:
+
+- ``product_rollup``: per product orders, reorders, quantity, cart-add
+  position and revenue, i.e. the product funnel;
+- ``sales_rollup``: items, reorders and revenue per order_dow x
+  order_hour_of_day x department x aisle, the cube behind the sales and
+  revenue breakdowns;
+- ``order_hour_rollup``: orders per order_dow x order_hour_of_day.
+
+A refresh folds the order_products and orders rows inserted after the
+watermarks in ``rollup_watermarks`` into the rollups with additive upserts,
+ANALYTICS_BATCH_ROWS ids at a time. Each batch moves its watermark and
+updates the rollups in one transaction, and the watermark only moves if it
+still holds the value the batch started from, so concurrent refreshes in
+several workers never count a row twice. As with the feature store, ids are
+assumed to be append-only. The seed job runs the first (full) refresh; the
+background refresher in the API workers only runs in the worker holding the
+refresh lock, see ``refresh_leader``. Revenue uses the product price at refresh time;
+``rebuild`` recomputes everything with the current prices.
+"""
+import argparse
+import asyncio
+import contextlib
+import fcntl
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import Float, and_, case, cast, delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import async_session, engine
+from src.database.db_models import (
+    Aisle, Cart, Department, Order, OrderHourRollup, OrderProduct, Product, ProductRollup, RollupWatermark,
+    SalesRollup,
+)
+from src.database.upsert import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BATCH_ROWS = int(os.getenv("ANALYTICS_BATCH_ROWS", "200000"))
+# 0 disables the background refresh; rollups then move only on demand
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+# PostgreSQL advisory lock key held by the worker running the background refresh
+ANALYTICS_LOCK_KEY = 7_260_025
+
+LINES_WATERMARK = "order_products"
+ORDERS_WATERMARK = "orders"
+
+FUNNEL_ORDERINGS = ("orders", "reorders", "reorder_rate", "revenue", "quantity")
+TIME_GROUPINGS = {
+    "dow": (SalesRollup.order_dow,),
+    "hour": (SalesRollup.order_hour_of_day,),
+    "dow_hour": (SalesRollup.order_dow, SalesRollup.order_hour_of_day),
+}
+
+_refresh_lock = asyncio.Lock()
+
+
+async def _upsert(db: AsyncSession, model, keys: List[str], rows: List[dict]):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = dialect_insert(db, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: table.c[column] + stmt.excluded[column] for column in rows[0] if column not in keys},
+    )
+    await db.execute(stmt, rows)
+
+
+async def _apply_lines(db: AsyncSession, lo: int, hi: int) -> int:
+    in_batch = and_(OrderProduct.id > lo, OrderProduct.id <= hi)
+    reordered = func.sum(case((OrderProduct.reordered, 1), else_=0))
+    revenue = func.sum(OrderProduct.quantity * Product.price)
+
+    result = await db.execute(
+        select(
+            OrderProduct.product_id,
+            func.count().label("orders"),
+            reordered.label("reorders"),
+            func.sum(OrderProduct.quantity).label("quantity"),
+            func.sum(OrderProduct.add_to_cart_order).label("sum_add_to_cart_order"),
+            func.sum(case((OrderProduct.add_to_cart_order == 1, 1), else_=0)).label("first_in_cart"),
+            revenue.label("revenue"),
+        )
+        .join(Product, Product.id == OrderProduct.product_id)
+        .where(in_batch)
+        .group_by(OrderProduct.product_id)
+    )
+    products = [row._asdict() for row in result]
+    await _upsert(db, ProductRollup, ["product_id"], products)
+
+    result = await db.execute(
+        select(
+            Order.order_dow,
+            Order.order_hour_of_day,
+            Product.department_id,
+            Product.aisle_id,
+            func.count().label("items"),
+            reordered.label("reorders"),
+            func.sum(OrderProduct.quantity).label("quantity"),
+            revenue.label("revenue"),
+        )
+        .join(Order, Order.id == OrderProduct.order_id)
+        .join(Product, Product.id == OrderProduct.product_id)
+        .where(in_batch)
+        .group_by(Order.order_dow, Order.order_hour_of_day, Product.department_id, Product.aisle_id)
+    )
+    await _upsert(
+        db, SalesRollup, ["order_dow", "order_hour_of_day", "department_id", "aisle_id"],
+        [row._asdict() for row in result],
+    )
+    return sum(product["orders"] for product in products)
+
+
+async def _apply_orders(db: AsyncSession, lo: int, hi: int) -> int:
+    result = await db.execute(
+        select(Order.order_dow, Order.order_hour_of_day, func.count().label("orders"))
+        .where(Order.id > lo, Order.id <= hi)
+        .group_by(Order.order_dow, Order.order_hour_of_day)
+    )
+    rows = [row._asdict() for row in result]
+    await _upsert(db, OrderHourRollup, ["order_dow", "order_hour_of_day"], rows)
+    return sum(row["orders"] for row in rows)
+
+
+SOURCES = {
+    LINES_WATERMARK: (OrderProduct.id, _apply_lines),
+    ORDERS_WATERMARK: (Order.id, _apply_orders),
+}
+
+
+async def _watermarks(db: AsyncSession) -> Dict[str, int]:
+    stmt = dialect_insert(db, RollupWatermark.__table__).values([{"name": name, "value": 0} for name in SOURCES])
+    await db.execute(stmt.on_conflict_do_nothing(index_elements=["name"]))
+    await db.commit()
+    result = await db.execute(select(RollupWatermark.name, RollupWatermark.value))
+    return dict(result.all())
+
+
+async def _refresh(db: AsyncSession, batch_rows: int) -> Dict[str, int]:
+    applied = {}
+    for name, (id_column, apply) in SOURCES.items():
+        applied[name] = 0
+        top = await db.scalar(select(func.max(id_column))) or 0
+        while True:
+            lo = await db.scalar(select(RollupWatermark.value).where(RollupWatermark.name == name))
+            if lo >= top:
+                break
+            hi = min(lo + batch_rows, top)
+            moved = await db.execute(
+                update(RollupWatermark)
+                .where(RollupWatermark.name == name, RollupWatermark.value == lo)
+                .values(value=hi)
+            )
+            if moved.rowcount != 1:
+                # another worker took this batch
+                await db.rollback()
+                continue
+            applied[name] += await apply(db, lo, hi)
+            await db.commit()
+    return applied
+
+
+async def refresh(db: AsyncSession, batch_rows: int = ANALYTICS_BATCH_ROWS) -> Dict[str, int]:
+    """Fold rows past the watermarks into the rollups; returns the rows applied per source."""
+    async with _refresh_lock:
+        await _watermarks(db)
+        return await _refresh(db, batch_rows)
+
+
+async def rebuild(db: AsyncSession, batch_rows: int = ANALYTICS_BATCH_ROWS) -> Dict[str, int]:
+    async with _refresh_lock:
+        await _watermarks(db)
+        for model in (ProductRollup, SalesRollup, OrderHourRollup):
+            await db.execute(delete(model))
+        await db.execute(update(RollupWatermark).values(value=0))
+        await db.commit()
+        return await _refresh(db, batch_rows)
+
+
+async def status(db: AsyncSession) -> dict:
+    watermarks = await _watermarks(db)
+    sources = {}
+    for name, (id_column, _) in SOURCES.items():
+        top = await db.scalar(select(func.max(id_column))) or 0
+        sources[name] = {"watermark": watermarks[name], "max_id": top, "behind": max(top - watermarks[name], 0)}
+    return sources
+
+
+def _product_stats(rollup: ProductRollup) -> dict:
+    return {
+        "orders": rollup.orders,
+        # reordered marks a repeat purchase, so the remaining orders are first purchases
+        "buyers": rollup.orders - rollup.reorders,
+        "reorders": rollup.reorders,
+        "reorder_rate": round(rollup.reorders / rollup.orders, 4) if rollup.orders else None,
+        "avg_add_to_cart_order": round(rollup.sum_add_to_cart_order / rollup.orders, 2) if rollup.orders else None,
+        "first_in_cart_rate": round(rollup.first_in_cart / rollup.orders, 4) if rollup.orders else None,
+        "quantity": rollup.quantity,
+        "revenue": round(rollup.revenue, 2),
+    }
+
+
+async def product_funnel(
+    db: AsyncSession,
+    order_by: str = "orders",
+    limit: int = 20,
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+    min_orders: int = 1,
+) -> List[dict]:
+    if order_by == "reorder_rate":
+        sort_key = cast(ProductRollup.reorders, Float) / ProductRollup.orders
+    else:
+        sort_key = getattr(ProductRollup, order_by)
+    query = (
+        select(ProductRollup, Product.name, Product.department_id, Product.aisle_id)
+        .join(Product, Product.id == ProductRollup.product_id)
+        .where(ProductRollup.orders >= min_orders)
+    )
+    if department_id is not None:
+        query = query.where(Product.department_id == department_id)
+    if aisle_id is not None:
+        query = query.where(Product.aisle_id == aisle_id)
+    result = await db.execute(query.order_by(sort_key.desc(), ProductRollup.product_id).limit(limit))
+
+    return [
+        {
+            "product_id": rollup.product_id,
+            "name": name,
+            "department_id": department,
+            "aisle_id": aisle,
+            **_product_stats(rollup),
+        }
+        for rollup, name, department, aisle in result.all()
+    ]
+
+
+async def product_detail(db: AsyncSession, product_id: int) -> Optional[dict]:
+    product = await db.get(Product, product_id)
+    if product is None:
+        return None
+    rollup = await db.get(ProductRollup, product_id) or ProductRollup(
+        product_id=product_id, orders=0, reorders=0, quantity=0, sum_add_to_cart_order=0, first_in_cart=0, revenue=0.0
+    )
+    # prospects: carts holding the product right now (cart.product_id is indexed)
+    carts, quantity = (await db.execute(
+        select(func.count(), func.coalesce(func.sum(Cart.quantity), 0)).where(Cart.product_id == product_id)
+    )).one()
+    return {
+        "product_id": product.id,
+        "name": product.name,
+        "price": product.price,
+        "department_id": product.department_id,
+        "aisle_id": product.aisle_id,
+        **_product_stats(rollup),
+        "in_carts": carts,
+        "in_carts_quantity": quantity,
+    }
+
+
+async def sales_by_time(
+    db: AsyncSession,
+    group_by: str = "dow_hour",
+    department_id: Optional[int] = None,
+    aisle_id: Optional[int] = None,
+) -> List[dict]:
+    columns = TIME_GROUPINGS[group_by]
+    query = select(
+        *columns,
+        func.sum(SalesRollup.items).label("items"),
+        func.sum(SalesRollup.reorders).label("reorders"),
+        func.sum(SalesRollup.revenue).label("revenue"),
+    )
+    if department_id is not None:
+        query = query.where(SalesRollup.department_id == department_id)
+    if aisle_id is not None:
+        query = query.where(SalesRollup.aisle_id == aisle_id)
+    result = await db.execute(query.group_by(*columns).order_by(*columns))
+    buckets = {tuple(row[:len(columns)]): row._asdict() for row in result}
+
+    # an order spans departments, so order counts exist only for the whole store
+    if department_id is None and aisle_id is None:
+        for bucket in buckets.values():
+            bucket["orders"] = 0
+        order_columns = [getattr(OrderHourRollup, column.key) for column in columns]
+        result = await db.execute(
+            select(*order_columns, func.sum(OrderHourRollup.orders)).group_by(*order_columns)
+        )
+        for *key, orders in result.all():
+            # orders without lines (the test set) still count
+            bucket = buckets.setdefault(
+                tuple(key), dict(zip([column.key for column in columns], key), items=0, reorders=0, revenue=0.0)
+            )
+            bucket["orders"] = orders
+
+    return [
+        {**bucket, "revenue": round(bucket["revenue"] or 0, 2)}
+        for _, bucket in sorted(buckets.items())
+    ]
+
+
+async def revenue_breakdown(
+    db: AsyncSession,
+    group_by: str = "department",
+    dow: Optional[List[int]] = None,
+    hour_from: int = 0,
+    hour_to: int = 23,
+) -> List[dict]:
+    if group_by == "aisle":
+        key, names = SalesRollup.aisle_id, Aisle
+    else:
+        key, names = SalesRollup.department_id, Department
+    query = select(
+        key,
+        names.name,
+        func.sum(SalesRollup.items).label("items"),
+        func.sum(SalesRollup.quantity).label("quantity"),
+        func.sum(SalesRollup.revenue).label("revenue"),
+    ).join(names, names.id == key).where(SalesRollup.order_hour_of_day.between(hour_from, hour_to))
+    if dow:
+        query = query.where(SalesRollup.order_dow.in_(dow))
+    result = await db.execute(query.group_by(key, names.name).order_by(func.sum(SalesRollup.revenue).desc()))
+    rows = result.all()
+
+    total = sum(row.revenue for row in rows) or 1
+    return [
+        {
+            f"{group_by}_id": row[0],
+            "name": row.name,
+            "items": row.items,
+            "quantity": row.quantity,
+            "revenue": round(row.revenue, 2),
+            "share": round(row.revenue / total, 4),
+        }
+        for row in rows
+    ]
+
+
+@contextlib.asynccontextmanager
+async def refresh_leader():
+    """Yields whether this process may run the background refresh now.
+
+    Every API worker starts a refresher; only the one holding the lock (a
+    PostgreSQL advisory lock, or a file lock next to a SQLite database) does
+    the work, the others skip the tick.
+    """
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as conn:
+            leader = await conn.scalar(select(func.pg_try_advisory_lock(ANALYTICS_LOCK_KEY)))
+            try:
+                yield leader
+            finally:
+                if leader:
+                    await conn.scalar(select(func.pg_advisory_unlock(ANALYTICS_LOCK_KEY)))
+        return
+
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        yield True
+        return
+
+    with open(f"{database}.analytics.lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class AnalyticsRefresher:
+    """Runs ``refresh`` every ``interval`` seconds in the background, in one worker at a time."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with refresh_leader() as leader:
+                    applied = {}
+                    if leader:
+                        async with async_session() as db:
+                            start = time.perf_counter()
+                            applied = await refresh(db)
+                if any(applied.values()):
+                    logger.info("analytics rollups: applied %s in %.1f s", applied, time.perf_counter() - start)
+            except Exception:
+                logger.exception("analytics refresh failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+analytics_refresher = AnalyticsRefresher(ANALYTICS_REFRESH_SECONDS)
+
+
+async def main(command: str, batch_rows: int):
+    async with async_session() as db:
+        if command == "status":
+            for name, source in (await status(db)).items():
+                print(f"{name:<15} watermark {source['watermark']:>10}  max id {source['max_id']:>10}  behind {source['behind']}")
+            return
+        start = time.perf_counter()
+        applied = await (rebuild if command == "rebuild" else refresh)(db, batch_rows)
+        print(f"applied {applied} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["refresh", "rebuild", "status"])
+    parser.add_argument("--batch-rows", type=int, default=ANALYTICS_BATCH_ROWS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main(args.command, args.batch_rows))
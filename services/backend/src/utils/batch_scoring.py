@@ -0,0 +1,245 @@
+"""Score top-K recommendations for every user in one job.
+
+    python -m src.utils.batch_scoring [--workers N] [--users-per-shard 2000] [--top-k 10] [--restart]
+
+Users are split into fixed user id ranges (shards). A worker builds the
+candidate features of a whole shard as one frame and scores it with a single
+multi-threaded ``Booster.predict`` call. Each finished shard is written
+atomically to its own file, so an interrupted run resumes at the first
+missing shard. Results are Parquet when pyarrow is installed, CSV otherwise.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.database.db_init import async_session
+from src.utils.candidates import CANDIDATE_COUNT, generate_candidates
+from src.utils.cooccurrence import CooccurrenceIndex, get_cooccurrence_index
+from src.utils.feature_store import FEATURE_STORE_DIR, FeatureStore, get_feature_store, save_feature_store
+from src.utils.features import get_all_features
+from src.utils.models import RecommendationModel
+from src.utils.model_registry import ensure_baseline, live_model_path
+
+try:
+    import pyarrow  # noqa: F401
+    RESULT_FORMAT = "parquet"
+except ImportError:
+    RESULT_FORMAT = "csv"
+
+logger = logging.getLogger(__name__)
+
+BATCH_SCORES_DIR = os.getenv("BATCH_SCORES_DIR", os.path.join(FEATURE_STORE_DIR, "batch_scores"))
+USERS_PER_SHARD = 2000
+MANIFEST = "run.json"
+
+# store and co-occurrence index, set in the parent before the pool forks so
+# workers share them copy-on-write; the model is loaded per worker
+_state = None
+_model = None
+_num_threads = 0
+
+
+def score_users(
+    store: FeatureStore,
+    model: RecommendationModel,
+    first_user_id: int,
+    end_user_id: int,
+    cooccurrence: Optional[CooccurrenceIndex] = None,
+    top_k: int = 10,
+    candidates: int = CANDIDATE_COUNT,
+    num_threads: int = 0,
+) -> pd.DataFrame:
+    """Top-K (user_id, rank, product_id, score) rows for users in ``[first_user_id, end_user_id)``."""
+    orders, users, userXproduct = store.users_slice(first_user_id, end_user_id)
+    if users.empty:
+        return pd.DataFrame({
+            "user_id": pd.Series(dtype=np.int32),
+            "rank": pd.Series(dtype=np.int16),
+            "product_id": pd.Series(dtype=np.int32),
+            "score": pd.Series(dtype=np.float32),
+        })
+
+    pairs = pd.concat(
+        [generate_candidates(user_id, store, cooccurrence, candidates) for user_id in users.index],
+        ignore_index=True,
+    )
+    features = get_all_features(pairs.copy(), orders, userXproduct, users, store.products)
+    scores = model.predict(features, num_threads=num_threads)
+
+    order = np.lexsort((-scores, pairs["user_id"].to_numpy()))
+    ranked = pd.DataFrame({
+        "user_id": pairs["user_id"].to_numpy(np.int32)[order],
+        "product_id": pairs["product_id"].to_numpy(np.int32)[order],
+        "score": scores[order].astype(np.float32),
+    })
+    ranked.insert(1, "rank", (ranked.groupby("user_id").cumcount() + 1).astype(np.int16))
+    return ranked[ranked["rank"] <= top_k].reset_index(drop=True)
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f"shard-{shard:05d}.{RESULT_FORMAT}")
+
+
+def write_shard(df: pd.DataFrame, path: str):
+    tmp_path = f"{path}.tmp"
+    if RESULT_FORMAT == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def load_results(directory: str = BATCH_SCORES_DIR) -> pd.DataFrame:
+    """All finished shards of a run as one frame."""
+    paths = sorted(glob.glob(os.path.join(directory, f"shard-*.{RESULT_FORMAT}")))
+    read = pd.read_parquet if RESULT_FORMAT == "parquet" else pd.read_csv
+    frames = [read(path) for path in paths]
+    if not frames:
+        return pd.DataFrame(columns=["user_id", "rank", "product_id", "score"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _init_worker(model_path: str, num_threads: int):
+    global _state, _model, _num_threads
+    if _state is None:
+        _state = (FeatureStore.load(), CooccurrenceIndex.load())
+    _model = RecommendationModel(model_path)
+    _num_threads = num_threads
+
+
+def _score_shard(directory: str, shard: int, users_per_shard: int, top_k: int, candidates: int):
+    store, cooccurrence = _state
+    start = time.perf_counter()
+    first_user_id = shard * users_per_shard
+    df = score_users(
+        store, _model, first_user_id, first_user_id + users_per_shard,
+        cooccurrence, top_k, candidates, _num_threads,
+    )
+    write_shard(df, shard_path(directory, shard))
+    return shard, df["user_id"].nunique(), time.perf_counter() - start
+
+
+def _prepare_run(directory: str, manifest: dict, restart: bool) -> Optional[str]:
+    """Create or reuse the output directory; returns why it cannot be used, if it cannot."""
+    path = os.path.join(directory, MANIFEST)
+    if os.path.exists(path):
+        if not restart:
+            with open(path) as file:
+                previous = json.load(file)
+            keys = ("model", "top_k", "candidates", "users_per_shard", "format", "feature_store_version")
+            changed = [key for key in keys if previous.get(key) != manifest[key]]
+            if changed:
+                return f"{directory} holds a run with different {', '.join(changed)}, use --restart to start over"
+            return None
+        # only this job's files: the directory may hold anything else
+        for pattern in ("shard-*.parquet", "shard-*.csv", "shard-*.tmp"):
+            for shard in glob.glob(os.path.join(directory, pattern)):
+                os.remove(shard)
+        os.remove(path)
+    elif os.path.isdir(directory) and os.listdir(directory):
+        return f"{directory} is not empty and holds no {MANIFEST}, refusing to write scores into it"
+
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(manifest, file, indent=2)
+    return None
+
+
+async def run(
+    directory: str,
+    workers: int,
+    num_threads: int,
+    users_per_shard: int,
+    top_k: int,
+    candidates: int,
+    model_path: Optional[str] = None,
+    restart: bool = False,
+):
+    global _state
+
+    async with async_session() as db:
+        store = await get_feature_store(db)
+        cooccurrence = await get_cooccurrence_index(db)
+    # workers load the snapshot from disk; this also waits for a save get_feature_store queued
+    await save_feature_store(store)
+    if model_path is None:
+        ensure_baseline()
+        model_path = live_model_path()
+
+    manifest = {
+        "model": os.path.abspath(model_path),
+        "top_k": top_k,
+        "candidates": candidates,
+        "users_per_shard": users_per_shard,
+        "format": RESULT_FORMAT,
+        "feature_store_version": store.version,
+    }
+    error = _prepare_run(directory, manifest, restart)
+    if error:
+        logger.error(error)
+        return
+
+    user_ids = store.users.index.to_numpy()
+    shards = np.unique(user_ids // users_per_shard)
+    pending = [int(shard) for shard in shards if not os.path.exists(shard_path(directory, shard))]
+    logger.info(
+        "%d users in %d shards, %d already scored, %d to go",
+        len(user_ids), len(shards), len(shards) - len(pending), len(pending),
+    )
+    if not pending:
+        return
+
+    _state = (store, cooccurrence)
+    start = time.perf_counter()
+    scored = 0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_path, num_threads),
+    ) as pool:
+        futures = [
+            pool.submit(_score_shard, directory, shard, users_per_shard, top_k, candidates)
+            for shard in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            shard, users, seconds = future.result()
+            scored += users
+            logger.info(
+                "shard %d: %d users in %.1f s (%d/%d, %.0f users/s overall)",
+                shard, users, seconds, done, len(pending), scored / (time.perf_counter() - start),
+            )
+
+
+if __name__ == "__main__":
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=BATCH_SCORES_DIR)
+    parser.add_argument("--workers", type=int, default=cpus)
+    parser.add_argument("--threads", type=int, default=0, help="LightGBM threads per worker (default: cpus / workers)")
+    parser.add_argument("--users-per-shard", type=int, default=USERS_PER_SHARD)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=CANDIDATE_COUNT)
+    parser.add_argument("--model", help="model file (default: the live version in the model registry)")
+    parser.add_argument("--restart", action="store_true", help="discard finished shards and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(run(
+        args.output,
+        args.workers,
+        args.threads or max(1, cpus // args.workers),
+        args.users_per_shard,
+        args.top_k,
+        args.candidates,
+        args.model,
+        args.restart,
+    ))
@@ -0,0 +1,141 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.cooccurrence import CooccurrenceIndex
+from src.utils.feature_store import USER_PRODUCT_KEY, FeatureStore
+
+CANDIDATE_COUNT = int(os.getenv("CANDIDATE_COUNT", "300"))
+# share of the slots left after the user's own products that co-purchase neighbours may take
+NEIGHBOUR_SHARE = 0.6
+NEIGHBOUR_SEEDS = 20
+NEIGHBOURS_PER_SEED = 20
+CATEGORY_TOP_N = 100
+
+
+class PopularityLists:
+    """Products ranked by number of prior orders: overall, per aisle and per department.
+
+    Also keeps the catalog columns candidate generation reads as plain arrays,
+    addressed through ``positions``.
+    """
+
+    def __init__(self, products: pd.DataFrame):
+        ranked = products.dropna(subset=["orders"]).sort_values("orders", ascending=False, kind="stable")
+        self.overall = ranked["product_id"].to_numpy()
+        self.by_aisle = self._top(ranked, "aisle_id")
+        self.by_department = self._top(ranked, "department_id")
+
+        self.catalog = products.index
+        self.orders = products["orders"].to_numpy(np.float64)
+        self.aisle_ids = products["aisle_id"].to_numpy()
+        self.department_ids = products["department_id"].to_numpy()
+
+    @staticmethod
+    def _top(ranked: pd.DataFrame, column: str) -> Dict[int, np.ndarray]:
+        return {
+            int(key): group.to_numpy()[:CATEGORY_TOP_N]
+            for key, group in ranked.groupby(column, sort=False)["product_id"]
+        }
+
+    def positions(self, product_ids: np.ndarray) -> np.ndarray:
+        """Row of each product in the catalog arrays, -1 for unknown products."""
+        return self.catalog.get_indexer(product_ids)
+
+
+_popularity = (None, None)
+
+
+def get_popularity_lists(store: FeatureStore) -> PopularityLists:
+    global _popularity
+    version, lists = _popularity
+    if version != store.version:
+        lists = PopularityLists(store.products)
+        _popularity = (store.version, lists)
+    return lists
+
+
+class _Selection:
+    def __init__(self, count: int):
+        self.count = count
+        self.ids: List[int] = []
+        self._seen = set()
+
+    @property
+    def remaining(self) -> int:
+        return self.count - len(self.ids)
+
+    def extend(self, product_ids, limit: Optional[int] = None):
+        limit = self.remaining if limit is None else min(limit, self.remaining)
+        for product_id in product_ids:
+            if limit <= 0:
+                break
+            product_id = int(product_id)
+            if product_id not in self._seen:
+                self._seen.add(product_id)
+                self.ids.append(product_id)
+                limit -= 1
+
+
+def _ranked_sums(keys: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct keys with their summed weights, heaviest first, ties by key."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights)
+    order = np.argsort(-sums, kind="stable")
+    return keys[order], sums[order]
+
+
+def _quota(sums: np.ndarray, slots: int) -> np.ndarray:
+    return np.ceil(sums / sums.sum() * slots).astype(int)
+
+
+def generate_candidates(
+    user_id: int,
+    store: FeatureStore,
+    cooccurrence: Optional[CooccurrenceIndex] = None,
+    count: int = CANDIDATE_COUNT,
+) -> pd.DataFrame:
+    """Up to ``count`` (user_id, product_id) pairs worth scoring for ``user_id``.
+
+    Sources, in order: products the user bought before (most often first),
+    products co-purchased with the user's favourites, the most popular
+    products of the user's aisles and departments, then overall popularity.
+    """
+    _, _, userXproduct = store.user_slice(user_id)
+    popularity = get_popularity_lists(store)
+    selection = _Selection(count)
+
+    own_ids = userXproduct.index.to_numpy() % USER_PRODUCT_KEY
+    own_orders = userXproduct["nb_orders"].to_numpy()
+    order = np.lexsort((-userXproduct["last_order_number"].to_numpy(), -own_orders))
+    own_ids, own_orders = own_ids[order], own_orders[order]
+    own_positions = popularity.positions(own_ids)
+    known = own_positions >= 0
+    own_ids, own_orders, own_positions = own_ids[known], own_orders[known], own_positions[known]
+    selection.extend(own_ids)
+
+    if cooccurrence is not None and selection.remaining and len(own_ids):
+        # co-purchase count relative to how often the seed sells, times how often the user buys it
+        seed_weights = own_orders[:NEIGHBOUR_SEEDS] / popularity.orders[own_positions[:NEIGHBOUR_SEEDS]]
+        neighbours, scores = [], []
+        for seed, weight in zip(own_ids[:NEIGHBOUR_SEEDS], seed_weights):
+            ids, counts = cooccurrence.lookup(seed, NEIGHBOURS_PER_SEED)
+            neighbours.append(ids)
+            scores.append(counts * weight)
+        ranked, _ = _ranked_sums(np.concatenate(neighbours), np.concatenate(scores))
+        ranked = ranked[popularity.positions(ranked) >= 0]
+        selection.extend(ranked, limit=int(np.ceil(selection.remaining * NEIGHBOUR_SHARE)))
+
+    if selection.remaining and len(own_ids):
+        for column, lists in (
+            (popularity.aisle_ids, popularity.by_aisle),
+            (popularity.department_ids, popularity.by_department),
+        ):
+            keys, sums = _ranked_sums(column[own_positions], own_orders.astype(np.float64))
+            for key, quota in zip(keys, _quota(sums, selection.remaining)):
+                selection.extend(lists.get(int(key), ()), limit=quota)
+
+    selection.extend(popularity.overall)
+    return pd.DataFrame({"user_id": user_id, "product_id": selection.ids})
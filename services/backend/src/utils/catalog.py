@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import AsyncIterator, NamedTuple, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import async_session
+from src.database.db_models import Product
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "60"))
+EXPORT_CHUNK_SIZE = 5000
+
+CATALOG_COLUMNS = (Product.id, Product.name, Product.price, Product.department_id, Product.aisle_id)
+
+
+def product_row(row) -> dict:
+    return {
+        "id": row.id,
+        "name": row.name,
+        "price": row.price,
+        "department_id": row.department_id,
+        "aisle_id": row.aisle_id,
+    }
+
+
+def dump_json(content) -> bytes:
+    # same encoding as fastapi's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def catalog_query(department_id: Optional[int] = None, aisle_id: Optional[int] = None):
+    stmt = select(*CATALOG_COLUMNS).order_by(Product.id)
+    if department_id is not None:
+        stmt = stmt.where(Product.department_id == department_id)
+    if aisle_id is not None:
+        stmt = stmt.where(Product.aisle_id == aisle_id)
+    return stmt
+
+
+class CatalogSnapshot(NamedTuple):
+    version: int
+    count: int
+    etag: str
+    body: bytes
+    built_at: float
+
+
+class CatalogCache:
+    """Serialized full-catalog response, rebuilt when the version changes.
+
+    ``invalidate`` bumps the version; other worker processes only see the
+    change once their snapshot is older than ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, snapshot: Optional[CatalogSnapshot]) -> bool:
+        return (
+            snapshot is not None
+            and snapshot.version == self.version
+            and time.monotonic() - snapshot.built_at < self.ttl
+        )
+
+    def invalidate(self):
+        self.version += 1
+        self._snapshot = None
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        if self._fresh(self._snapshot):
+            return self._snapshot
+
+        async with self._lock:
+            if self._fresh(self._snapshot):
+                return self._snapshot
+
+            version = self.version
+            result = await db.execute(catalog_query())
+            products = [product_row(row) for row in result.all()]
+            body = dump_json({"products": products})
+            snapshot = CatalogSnapshot(
+                version=version,
+                count=len(products),
+                etag=f'"{hashlib.sha1(body).hexdigest()}"',
+                body=body,
+                built_at=time.monotonic(),
+            )
+            if version == self.version:
+                self._snapshot = snapshot
+            return snapshot
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+async def export_ndjson(department_id: Optional[int] = None, aisle_id: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Stream the catalog as one JSON object per line.
+
+    Uses its own session, since the response body outlives the request's one.
+    """
+    stmt = catalog_query(department_id, aisle_id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    async with async_session() as session:
+        result = await session.stream(stmt)
+        async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+            yield b"".join(dump_json(product_row(row)) + b"\n" for row in rows)
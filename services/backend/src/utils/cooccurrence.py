@@ -0,0 +1,354 @@
+"""Item-to-item co-purchase neighbours mined from prior order products.
+
+    python -m src.utils.cooccurrence [--workers N] [--top-k K] [--force]
+
+The job counts product pairs bought in the same order, keeps the top-K
+neighbours of every product and saves them as ``.npy`` arrays that the app
+memory-maps, so every uvicorn worker shares one copy through the page cache.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db_init import async_session
+from src.utils.data_processing import load_baskets_df
+from src.utils.feature_store import FEATURE_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+COOCCURRENCE_DIR = os.path.join(FEATURE_STORE_DIR, "cooccurrence")
+COOCCURRENCE_TOP_K = int(os.getenv("COOCCURRENCE_TOP_K", "50"))
+COOCCURRENCE_RELOAD_INTERVAL = float(os.getenv("COOCCURRENCE_RELOAD_INTERVAL", "60"))
+ORDERS_PER_CHUNK = 200000
+
+ARRAYS = ("product_ids", "indptr", "neighbours", "counts")
+
+
+def basket_pairs(
+    order_ids: np.ndarray,
+    products: np.ndarray,
+    shard: int = 0,
+    shards: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Ordered (a, b) product pairs bought in the same order, for ``a % shards == shard``.
+
+    Input must be sorted by order_id. Row ``i`` pairs with row ``i + offset``
+    only while both are in the same order, so the candidate rows shrink with
+    every offset and the work is proportional to the number of pairs.
+    """
+    left, right = [], []
+    active = np.arange(len(order_ids) - 1)
+    offset = 1
+    while len(active):
+        active = active[order_ids[active + offset] == order_ids[active]]
+        a, b = products[active], products[active + offset]
+        for first, second in ((a, b), (b, a)):
+            mine = first % shards == shard if shards > 1 else slice(None)
+            left.append(first[mine])
+            right.append(second[mine])
+        offset += 1
+        active = active[active + offset < len(order_ids)]
+
+    if not left:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    return np.concatenate(left), np.concatenate(right)
+
+
+def count_pairs(keys: np.ndarray, weights: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    if weights is None:
+        counts = np.diff(starts, append=len(keys))
+    else:
+        counts = np.add.reduceat(weights[order], starts)
+    return keys[starts], counts.astype(np.int32)
+
+
+def top_k_pairs(rows: np.ndarray, columns: np.ndarray, counts: np.ndarray, top_k: int):
+    """Keep the ``top_k`` strongest columns of every row, sorted by row then strength."""
+    order = np.lexsort((columns, -counts, rows))
+    rows, columns, counts = rows[order], columns[order], counts[order]
+
+    starts = np.flatnonzero(np.diff(rows, prepend=-1))
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(starts, append=len(rows)))
+    keep = rank < top_k
+    return rows[keep], columns[keep], counts[keep]
+
+
+def _chunk_cuts(order_ids: np.ndarray, orders_per_chunk: int) -> np.ndarray:
+    boundaries = np.flatnonzero(np.diff(order_ids, prepend=order_ids[:1] - 1))
+    return np.append(boundaries[::orders_per_chunk], len(order_ids))
+
+
+def _count_shard(order_ids, positions, size: int, shard: int, shards: int, top_k: int, orders_per_chunk: int):
+    """Top-K pairs for the rows of one shard; arrays may be paths to ``.npy`` files."""
+    if isinstance(order_ids, str):
+        order_ids = np.load(order_ids, mmap_mode="r")
+        positions = np.load(positions, mmap_mode="r")
+
+    keys, counts = np.empty(0, np.int64), np.empty(0, np.int32)
+    pending = []
+    cuts = _chunk_cuts(np.asarray(order_ids), orders_per_chunk)
+    for start, end in zip(cuts[:-1], cuts[1:]):
+        left, right = basket_pairs(np.asarray(order_ids[start:end]), np.asarray(positions[start:end]), shard, shards)
+        pending.append(count_pairs(left * size + right))
+
+        # merge once the unmerged chunks outgrow the merged counts: amortized linear
+        if sum(len(chunk_keys) for chunk_keys, _ in pending) > len(keys):
+            keys, counts = count_pairs(
+                np.concatenate([keys] + [chunk_keys for chunk_keys, _ in pending]),
+                np.concatenate([counts] + [chunk_counts for _, chunk_counts in pending]),
+            )
+            pending = []
+
+    if pending:
+        keys, counts = count_pairs(
+            np.concatenate([keys] + [chunk_keys for chunk_keys, _ in pending]),
+            np.concatenate([counts] + [chunk_counts for _, chunk_counts in pending]),
+        )
+    return top_k_pairs(keys // size, keys % size, counts, top_k)
+
+
+def current_build(directory: str = COOCCURRENCE_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, "CURRENT")) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class CooccurrenceIndex:
+    """Top-K co-purchase neighbours per product, stored as CSR arrays.
+
+    For the product at position ``i`` of the sorted ``product_ids``,
+    ``neighbours[indptr[i]:indptr[i + 1]]`` are the product ids most often
+    bought in the same order, strongest first, with their order counts in
+    ``counts``.
+    """
+
+    def __init__(self, product_ids: np.ndarray, indptr: np.ndarray, neighbours: np.ndarray, counts: np.ndarray):
+        self.product_ids = product_ids
+        self.indptr = indptr
+        self.neighbours = neighbours
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def lookup(self, product_id: int, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        position = np.searchsorted(self.product_ids, product_id)
+        if position == len(self.product_ids) or self.product_ids[position] != product_id:
+            return self.neighbours[:0], self.counts[:0]
+        start, end = self.indptr[position], self.indptr[position + 1]
+        if k is not None:
+            end = min(end, start + k)
+        return self.neighbours[start:end], self.counts[start:end]
+
+    def suggest(
+        self,
+        product_ids: Iterable[int],
+        weights: Iterable[float],
+        limit: int = 10,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Neighbours of a basket, each seed's counts normalized to sum to its weight.
+
+        The seeds themselves are never suggested.
+        """
+        product_ids = list(product_ids)
+        neighbours, scores = [], []
+        for product_id, weight in zip(product_ids, weights):
+            ids, counts = self.lookup(product_id)
+            if len(ids):
+                neighbours.append(ids)
+                scores.append(counts * (weight / counts.sum()))
+        if not neighbours:
+            return np.empty(0, np.int32), np.empty(0)
+
+        ids, inverse = np.unique(np.concatenate(neighbours), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        keep = ~np.isin(ids, product_ids)
+        ids, totals = ids[keep], totals[keep]
+        top = np.lexsort((ids, -totals))[:limit]
+        return ids[top], totals[top]
+
+    @classmethod
+    def build(
+        cls,
+        order_ids: np.ndarray,
+        product_ids: np.ndarray,
+        top_k: int = COOCCURRENCE_TOP_K,
+        workers: int = 1,
+        orders_per_chunk: int = ORDERS_PER_CHUNK,
+    ) -> "CooccurrenceIndex":
+        """Count same-order product pairs ``orders_per_chunk`` orders at a time.
+
+        With several workers each process owns the pairs whose first product
+        falls in its shard, so shards never need merging and per-process
+        memory shrinks with the worker count. Workers read the sorted input
+        from memory-mapped temporary files.
+        """
+        order = np.argsort(order_ids, kind="stable")
+        order_ids, product_ids = np.ascontiguousarray(order_ids[order]), product_ids[order]
+
+        catalog = np.unique(product_ids)
+        size = len(catalog)
+        positions = np.searchsorted(catalog, product_ids).astype(np.int64)
+
+        if workers <= 1:
+            parts = [_count_shard(order_ids, positions, size, 0, 1, top_k, orders_per_chunk)]
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                orders_path = os.path.join(tmp, "order_ids.npy")
+                positions_path = os.path.join(tmp, "positions.npy")
+                np.save(orders_path, order_ids)
+                np.save(positions_path, positions)
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    parts = list(pool.map(
+                        _count_shard,
+                        [orders_path] * workers,
+                        [positions_path] * workers,
+                        [size] * workers,
+                        range(workers),
+                        [workers] * workers,
+                        [top_k] * workers,
+                        [orders_per_chunk] * workers,
+                    ))
+
+        rows, columns, counts = (np.concatenate(arrays) for arrays in zip(*parts))
+        return cls.from_pairs(catalog, rows, columns, counts, top_k)
+
+    @classmethod
+    def from_pairs(
+        cls,
+        catalog: np.ndarray,
+        rows: np.ndarray,
+        columns: np.ndarray,
+        counts: np.ndarray,
+        top_k: int,
+    ) -> "CooccurrenceIndex":
+        rows, columns, counts = top_k_pairs(rows, columns, counts, top_k)
+        indptr = np.zeros(len(catalog) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(rows, minlength=len(catalog)))
+        return cls(
+            catalog.astype(np.int32),
+            indptr,
+            catalog[columns].astype(np.int32),
+            counts.astype(np.int32),
+        )
+
+    def save(self, directory: str = COOCCURRENCE_DIR) -> str:
+        """Write a new build and switch ``CURRENT`` to it atomically.
+
+        Older builds except the previous one are removed; processes still
+        mapping a removed build keep reading it until they reload.
+        """
+        previous = current_build(directory)
+        build = f"build-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+        os.makedirs(os.path.join(directory, build))
+        for name in ARRAYS:
+            np.save(os.path.join(directory, build, f"{name}.npy"), getattr(self, name))
+
+        pointer = os.path.join(directory, "CURRENT")
+        with open(f"{pointer}.tmp", "w") as file:
+            file.write(build)
+        os.replace(f"{pointer}.tmp", pointer)
+
+        for name in os.listdir(directory):
+            if name.startswith("build-") and name not in (build, previous):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        return build
+
+    @classmethod
+    def load(cls, directory: str = COOCCURRENCE_DIR, build: Optional[str] = None) -> Optional["CooccurrenceIndex"]:
+        build = build or current_build(directory)
+        if build is None:
+            return None
+        try:
+            return cls(*(np.load(os.path.join(directory, build, f"{name}.npy"), mmap_mode="r") for name in ARRAYS))
+        except FileNotFoundError:
+            return None
+
+
+_index = None
+_index_build = None
+_checked_at = 0.0
+_index_lock = asyncio.Lock()
+
+
+async def get_cooccurrence_index(db: AsyncSession) -> CooccurrenceIndex:
+    """The memory-mapped current build, re-checked every COOCCURRENCE_RELOAD_INTERVAL seconds.
+
+    If the job has never run, the index is mined in-process on first use.
+    """
+    global _index, _index_build, _checked_at
+
+    if _index is not None and time.monotonic() - _checked_at < COOCCURRENCE_RELOAD_INTERVAL:
+        return _index
+
+    async with _index_lock:
+        if _index is not None and time.monotonic() - _checked_at < COOCCURRENCE_RELOAD_INTERVAL:
+            return _index
+
+        build = current_build()
+        if build is not None and build != _index_build:
+            index = CooccurrenceIndex.load(build=build)
+            if index is not None:
+                _index, _index_build = index, build
+        elif build is None and _index is None:
+            priors = await load_baskets_df(db)
+            index = await asyncio.to_thread(
+                CooccurrenceIndex.build,
+                priors["order_id"].to_numpy(),
+                priors["product_id"].to_numpy(),
+            )
+            _index_build = index.save()
+            _index = CooccurrenceIndex.load(build=_index_build) or index
+        _checked_at = time.monotonic()
+
+    return _index
+
+
+async def build_from_db(workers: int, top_k: int, orders_per_chunk: int, force: bool = False):
+    if current_build() is not None and not force:
+        logger.info("co-occurrence index already built, skipping (use --force to rebuild)")
+        return
+
+    start = time.perf_counter()
+    async with async_session() as db:
+        priors = await load_baskets_df(db)
+    logger.info("loaded %d prior rows in %.1f s", len(priors), time.perf_counter() - start)
+
+    index = CooccurrenceIndex.build(
+        priors["order_id"].to_numpy(),
+        priors["product_id"].to_numpy(),
+        top_k=top_k,
+        workers=workers,
+        orders_per_chunk=orders_per_chunk,
+    )
+    build = index.save()
+    logger.info(
+        "built %s: %d products, %d neighbour links in %.1f s",
+        build, len(index), len(index.neighbours), time.perf_counter() - start,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--top-k", type=int, default=COOCCURRENCE_TOP_K)
+    parser.add_argument("--orders-per-chunk", type=int, default=ORDERS_PER_CHUNK)
+    parser.add_argument("--force", action="store_true", help="rebuild even if a build exists")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(build_from_db(args.workers, args.top_k, args.orders_per_chunk, args.force))
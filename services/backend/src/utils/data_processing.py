@@ -1,55 +1,147 @@
+import asyncio
+import io
+from typing import AsyncIterator, Dict
+
+import numpy as np
 import pandas as pd
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
 
 from src.database.db_models import Order, OrderProduct, Product
 
-def orders_to_df(orders_list: List[Order]) -> pd.DataFrame:
-    data = [
-        [
-            o.id,
-            o.user_id,
-            o.eval_set,
-            o.order_number,
-            o.order_dow,
-            o.order_hour_of_day,
-            o.days_since_prior_order,
-        ]
-        for o in orders_list
-    ]
-    return pd.DataFrame(
-        data,
-        columns=[
-            "order_id",
-            "user_id",
-            "eval_set",
-            "order_number",
-            "order_dow",
-            "order_hour_of_day",
-            "days_since_prior_order",
-        ],
-    )
+ORDER_COLUMNS = {
+    "order_id": (Order.id, np.int32),
+    "user_id": (Order.user_id, np.int32),
+    "eval_set": (Order.eval_set, "category"),
+    "order_number": (Order.order_number, np.int16),
+    "order_dow": (Order.order_dow, np.int8),
+    "order_hour_of_day": (Order.order_hour_of_day, np.int8),
+    "days_since_prior_order": (Order.days_since_prior_order, np.float32),
+}
+
+PRIOR_COLUMNS = {
+    "order_id": (OrderProduct.order_id, np.int32),
+    "product_id": (OrderProduct.product_id, np.int32),
+    "add_to_cart_order": (OrderProduct.add_to_cart_order, np.int16),
+    "reordered": (OrderProduct.reordered, bool),
+}
+
+EXTENDED_PRIOR_COLUMNS = {
+    **PRIOR_COLUMNS,
+    "order_number": (Order.order_number, np.int16),
+    "user_id": (Order.user_id, np.int32),
+}
+
+BASKET_COLUMNS = {
+    "order_id": (OrderProduct.order_id, np.int32),
+    "product_id": (OrderProduct.product_id, np.int32),
+}
+
+PRODUCT_COLUMNS = {
+    "product_id": (Product.id, np.int32),
+    "aisle_id": (Product.aisle_id, np.int16),
+    "department_id": (Product.department_id, np.int16),
+}
+
+DEFAULT_CHUNK_SIZE = 200000
 
-def orderproducts_to_df(op_list: List[OrderProduct]) -> pd.DataFrame:
-    data = [
-        [op.order_id, op.product_id, op.add_to_cart_order, op.reordered]
-        for op in op_list
-    ]
-    return pd.DataFrame(
-        data,
-        columns=["order_id", "product_id", "add_to_cart_order", "reordered"]
-    )
 
-def products_to_df(prod_list: List[Product]) -> pd.DataFrame:
-    data = [
-        [p.id, p.aisle_id, p.department_id]
-        for p in prod_list
-    ]
-    return pd.DataFrame(
-        data,
-        columns=["product_id", "aisle_id", "department_id"]
+def select_columns(columns: Dict[str, tuple]) -> Select:
+    return select(*(column.label(name) for name, (column, _) in columns.items()))
+
+
+def rows_to_df(rows, dtypes: Dict[str, object]) -> pd.DataFrame:
+    values = list(zip(*rows)) or [()] * len(dtypes)
+    return pd.DataFrame({
+        name: pd.Series(column, dtype=dtype)
+        for (name, dtype), column in zip(dtypes.items(), values)
+    })
+
+
+async def _copy_to_df(db: AsyncSession, stmt: Select, dtypes: Dict[str, object]) -> pd.DataFrame:
+    conn = await db.connection()
+    raw_conn = await conn.get_raw_connection()
+    query = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+    buffer = io.BytesIO()
+
+    async def write(data: bytes):
+        buffer.write(data)
+
+    await raw_conn.driver_connection.copy_from_query(query, output=write, format="csv")
+    buffer.seek(0)
+    # parsing a large table takes seconds; keep it off the event loop
+    return await asyncio.to_thread(
+        pd.read_csv,
+        buffer,
+        names=list(dtypes),
+        dtype=dtypes,
+        true_values=["t"],
+        false_values=["f"],
     )
 
+
+async def iter_dfs(
+    db: AsyncSession,
+    columns: Dict[str, tuple],
+    *criteria,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    stmt: Select = None,
+) -> AsyncIterator[pd.DataFrame]:
+    """Stream a query as typed DataFrames of at most ``chunk_size`` rows."""
+    dtypes = {name: dtype for name, (_, dtype) in columns.items()}
+    stmt = (stmt if stmt is not None else select_columns(columns)).where(*criteria)
+
+    result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+    async for rows in result.partitions(chunk_size):
+        yield rows_to_df(rows, dtypes)
+
+
+async def load_df(
+    db: AsyncSession,
+    columns: Dict[str, tuple],
+    *criteria,
+    stmt: Select = None,
+) -> pd.DataFrame:
+    """Load only the requested columns straight into a typed DataFrame.
+
+    On PostgreSQL the rows are pulled with ``COPY ... TO STDOUT``; elsewhere
+    they are streamed in chunks of raw row tuples.
+    """
+    dtypes = {name: dtype for name, (_, dtype) in columns.items()}
+    stmt = (stmt if stmt is not None else select_columns(columns)).where(*criteria)
+
+    if db.bind.dialect.name == "postgresql":
+        return await _copy_to_df(db, stmt, dtypes)
+
+    chunks = [chunk async for chunk in iter_dfs(db, columns, stmt=stmt)]
+    if not chunks:
+        return rows_to_df([], dtypes)
+    return pd.concat(chunks, ignore_index=True)
+
+
+async def load_orders_df(db: AsyncSession, *criteria) -> pd.DataFrame:
+    return await load_df(db, ORDER_COLUMNS, *criteria)
+
+
+async def load_priors_df(db: AsyncSession, *criteria, extended: bool = False) -> pd.DataFrame:
+    columns = EXTENDED_PRIOR_COLUMNS if extended else PRIOR_COLUMNS
+    stmt = select_columns(columns).join(Order, Order.id == OrderProduct.order_id)
+    return await load_df(db, columns, Order.eval_set == "prior", *criteria, stmt=stmt)
+
+
+async def load_baskets_df(db: AsyncSession, *criteria) -> pd.DataFrame:
+    """(order_id, product_id) of prior order products only."""
+    stmt = select_columns(BASKET_COLUMNS).join(Order, Order.id == OrderProduct.order_id)
+    return await load_df(db, BASKET_COLUMNS, Order.eval_set == "prior", *criteria, stmt=stmt)
+
+
+async def load_products_df(db: AsyncSession, *criteria) -> pd.DataFrame:
+    return await load_df(db, PRODUCT_COLUMNS, *criteria)
+
+
 def extend_priors(priors: pd.DataFrame, orders: pd.DataFrame) -> pd.DataFrame:
     orders_indexed = orders.set_index("order_id")[["order_number", "user_id"]]
     priors = priors.join(orders_indexed, on="order_id")
-    return priors
\ No newline at end of file
+    return priors
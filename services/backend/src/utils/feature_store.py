@@ -0,0 +1,466 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import async_session
+from src.database.db_models import Order, OrderProduct, Product
+from src.utils.data_processing import (
+    load_orders_df, load_priors_df, load_products_df, extend_priors
+)
+from src.utils.features import get_product_features, get_userXproduct_features
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "./src/feature_store")
+FEATURE_STORE_SAVE_EVERY = int(os.getenv("FEATURE_STORE_SAVE_EVERY", "100000"))
+# counting orders and order_products scans them, so it runs at most this often rather than per request
+FEATURE_STORE_RECOUNT_SECONDS = float(os.getenv("FEATURE_STORE_RECOUNT_SECONDS", "30"))
+# how often check_feature_store_later looks for new rows on behalf of readers of current_feature_store
+FEATURE_STORE_CHECK_SECONDS = float(os.getenv("FEATURE_STORE_CHECK_SECONDS", "1"))
+USER_PRODUCT_KEY = 100000
+
+
+class DataMarker(NamedTuple):
+    max_order_id: int
+    max_order_product_id: int
+    max_product_id: int
+    product_count: int
+    # row counts catch deletions below the max ids and rows committed after the watermark
+    # passed their id; -1 means not counted
+    order_count: int = -1
+    order_product_count: int = -1
+
+    @property
+    def counted(self) -> bool:
+        return self.order_count >= 0
+
+    def matches(self, current: "DataMarker") -> bool:
+        """Whether a store built at this marker is up to date with ``current``."""
+        if current.counted:
+            return self == current
+        return self[:4] == current[:4]
+
+
+def _derive_users(prior_stats: pd.DataFrame, user_orders: pd.DataFrame) -> pd.DataFrame:
+    users = pd.DataFrame(index=prior_stats.index.rename("user_id"))
+    users["total_items"] = prior_stats["total_items"].astype(np.int16)
+    users["total_distinct_items"] = prior_stats["total_distinct_items"].astype(np.int16)
+
+    user_orders = user_orders.reindex(users.index)
+    users["average_days_between_orders"] = (
+        user_orders["days_sum"] / user_orders["days_count"]
+    ).astype(np.float32)
+    users["nb_orders"] = user_orders["nb_orders"].astype(np.int16)
+    users["average_basket"] = (users["total_items"] / users["nb_orders"]).astype(np.float32)
+    return users
+
+
+def _order_keys(orders: pd.DataFrame) -> np.ndarray:
+    """(user_id, order_id) packed into one int64, the sort order of ``FeatureStore.orders``."""
+    return (orders["user_id"].to_numpy(np.int64) << 32) | orders["order_id"].to_numpy(np.int64)
+
+
+def _insert_sorted(frame: pd.DataFrame, keys: np.ndarray, rows: pd.DataFrame, row_keys: np.ndarray) -> pd.DataFrame:
+    """``frame``, sorted by ``keys``, with ``rows`` inserted at their sorted positions.
+
+    Only the new rows are sorted; the existing ones are copied once in order.
+    """
+    order = np.argsort(row_keys, kind="stable")
+    positions = np.searchsorted(keys, row_keys[order], side="right")
+    rows = rows.iloc[order]
+    columns = {
+        column: np.insert(frame[column].to_numpy(), positions, rows[column].to_numpy())
+        for column in frame.columns
+    }
+    if isinstance(frame.index, pd.RangeIndex):
+        return pd.DataFrame(columns)
+    index = pd.Index(np.insert(frame.index.to_numpy(), positions, rows.index.to_numpy()), name=frame.index.name)
+    return pd.DataFrame(columns, index=index)
+
+
+def _user_order_stats(orders: pd.DataFrame) -> pd.DataFrame:
+    grouped = orders.groupby("user_id")
+    return pd.DataFrame({
+        "nb_orders": grouped.size(),
+        "days_sum": grouped["days_since_prior_order"].sum(),
+        "days_count": grouped["days_since_prior_order"].count(),
+    }).astype(np.float64)
+
+
+class FeatureStore:
+    """Precomputed product, user and user x product feature tables.
+
+    Built once and then kept current by applying the orders and order products
+    inserted after its watermark (``marker``); ids are assumed to be append-only.
+    A recommendation request only slices the rows of a single user out of it.
+    """
+
+    def __init__(
+        self,
+        marker: DataMarker,
+        orders: pd.DataFrame,
+        products: pd.DataFrame,
+        users: pd.DataFrame,
+        user_orders: pd.DataFrame,
+        userXproduct: pd.DataFrame,
+        snapshot: Optional[str] = None,
+    ):
+        self.marker = marker
+        self.version = hashlib.sha1("-".join(map(str, marker)).encode()).hexdigest()[:16]
+        # version of the last full build; deltas keep it
+        self.snapshot = snapshot or self.version
+        # users touched by the delta that produced this store, None after a full build
+        self.changed_users: Optional[np.ndarray] = None
+        self.orders = orders
+        self.products = products
+        self.users = users
+        self.user_orders = user_orders
+        self.userXproduct = userXproduct
+        self.unsaved_rows = 0
+
+        self.products_by_reorder_rate = products.dropna(subset=["reorder_rate"]).sort_values(
+            "reorder_rate", ascending=False, kind="stable"
+        )
+        self._order_user_ids = orders["user_id"].to_numpy()
+        self._userXproduct_keys = userXproduct.index.to_numpy()
+
+    @classmethod
+    def build(
+        cls,
+        marker: DataMarker,
+        orders: pd.DataFrame,
+        priors: pd.DataFrame,
+        products: pd.DataFrame,
+    ) -> "FeatureStore":
+        priors = extend_priors(priors, orders)
+        products = get_product_features(priors, products)
+        products.set_index("product_id", inplace=True, drop=False)
+
+        userXproduct = get_userXproduct_features(priors)
+        order_numbers = orders.set_index("order_id")["order_number"]
+        userXproduct["last_order_number"] = userXproduct["last_order_id"].map(order_numbers).astype(np.int16)
+        userXproduct.sort_index(inplace=True)
+
+        user_orders = _user_order_stats(orders)
+        prior_stats = pd.DataFrame({
+            "total_items": priors.groupby("user_id").size(),
+            "total_distinct_items": pd.Series(userXproduct.index // USER_PRODUCT_KEY).value_counts(),
+        })
+        users = _derive_users(prior_stats, user_orders)
+
+        orders = orders[["order_id", "user_id", "order_number"]].sort_values(
+            ["user_id", "order_id"], kind="stable"
+        ).reset_index(drop=True)
+        return cls(marker, orders, products, users, user_orders, userXproduct)
+
+    def apply_delta(
+        self,
+        marker: DataMarker,
+        new_orders: pd.DataFrame,
+        new_priors: pd.DataFrame,
+        new_products: pd.DataFrame,
+    ) -> "FeatureStore":
+        """Return a new store with freshly inserted rows folded into the aggregates.
+
+        ``new_priors`` must already carry ``user_id`` and ``order_number``.
+        """
+        orders = self.orders
+        user_orders = self.user_orders
+        if len(new_orders):
+            orders = _insert_sorted(orders, _order_keys(orders), new_orders, _order_keys(new_orders))
+            user_orders = user_orders.add(_user_order_stats(new_orders), fill_value=0)
+
+        products = self.products.copy()
+        if len(new_products):
+            new_products = new_products.set_index("product_id", drop=False)
+            products = pd.concat([products, new_products])
+
+        userXproduct = self.userXproduct
+        prior_stats = self.users[["total_items", "total_distinct_items"]]
+        if len(new_priors):
+            grouped = new_priors.groupby("product_id")
+            touched = grouped.size().index.intersection(products.index)
+            added_orders = grouped.size().reindex(touched)
+            added_reorders = grouped["reordered"].sum().reindex(touched)
+            products.loc[touched, "orders"] = products.loc[touched, "orders"].fillna(0) + added_orders
+            products.loc[touched, "reorders"] = products.loc[touched, "reorders"].fillna(0) + added_reorders
+            products.loc[touched, "reorder_rate"] = (
+                products.loc[touched, "reorders"] / products.loc[touched, "orders"]
+            ).astype(np.float32)
+
+            delta = get_userXproduct_features(new_priors.copy())
+            delta["last_order_number"] = delta["last_order_id"].map(
+                new_priors.drop_duplicates("order_id").set_index("order_id")["order_number"]
+            )
+            # userXproduct is sorted by key: find the delta's rows by binary search
+            keys = delta.index.to_numpy()
+            positions = np.searchsorted(self._userXproduct_keys, keys)
+            existing = positions < len(self._userXproduct_keys)
+            existing[existing] = self._userXproduct_keys[positions[existing]] == keys[existing]
+            at = positions[existing]
+            update = delta[existing]
+
+            columns = {column: userXproduct[column].to_numpy().copy() for column in userXproduct.columns}
+            current_number, current_id = columns["last_order_number"][at], columns["last_order_id"][at]
+            update_number, update_id = update["last_order_number"].to_numpy(), update["last_order_id"].to_numpy()
+            newer = (update_number > current_number) | ((update_number == current_number) & (update_id > current_id))
+            columns["nb_orders"][at] += update["nb_orders"].to_numpy()
+            columns["sum_pos_in_cart"][at] += update["sum_pos_in_cart"].to_numpy()
+            columns["last_order_id"][at] = np.where(newer, update_id, current_id)
+            columns["last_order_number"][at] = np.where(newer, update_number, current_number)
+            userXproduct = _insert_sorted(
+                pd.DataFrame(columns, index=userXproduct.index), self._userXproduct_keys, delta[~existing], keys[~existing]
+            )
+
+            prior_stats = prior_stats.add(pd.DataFrame({
+                "total_items": new_priors.groupby("user_id").size(),
+                "total_distinct_items": pd.Series(delta.index[~existing] // USER_PRODUCT_KEY).value_counts(),
+            }), fill_value=0)
+
+        users = _derive_users(prior_stats, user_orders)
+
+        store = FeatureStore(marker, orders, products, users, user_orders, userXproduct, self.snapshot)
+        store.unsaved_rows = self.unsaved_rows + len(new_orders) + len(new_priors)
+        store.changed_users = np.union1d(
+            new_orders["user_id"].to_numpy() if len(new_orders) else [],
+            new_priors["user_id"].to_numpy() if len(new_priors) else [],
+        ).astype(np.int64)
+        return store
+
+    def user_slice(self, user_id: int):
+        orders, _, userXproduct = self.users_slice(user_id, user_id + 1)
+        users = self.users.reindex([user_id])
+        return orders, users, userXproduct
+
+    def users_slice(self, first_user_id: int, end_user_id: int):
+        """Rows of the users with ``first_user_id <= user_id < end_user_id``."""
+        lo, hi = np.searchsorted(self._order_user_ids, [first_user_id, end_user_id])
+        orders = self.orders.iloc[lo:hi]
+
+        lo, hi = np.searchsorted(
+            self._userXproduct_keys,
+            [first_user_id * USER_PRODUCT_KEY, end_user_id * USER_PRODUCT_KEY],
+        )
+        userXproduct = self.userXproduct.iloc[lo:hi]
+
+        user_ids = self.users.index
+        users = self.users[(user_ids >= first_user_id) & (user_ids < end_user_id)]
+        return orders, users, userXproduct
+
+    def user_stamp(self, user_id: int) -> str:
+        """Changes whenever rows of ``user_id`` are added: latest order id and item count."""
+        lo, hi = np.searchsorted(self._order_user_ids, [user_id, user_id + 1])
+        last_order_id = int(self.orders["order_id"].iat[hi - 1]) if hi > lo else 0
+        total_items = self.users["total_items"].get(user_id, 0)
+        return f"{last_order_id}:{int(total_items)}"
+
+    def save(self):
+        os.makedirs(FEATURE_STORE_DIR, exist_ok=True)
+        path = os.path.join(FEATURE_STORE_DIR, "features.pkl")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(
+                (
+                    self.marker, self.orders, self.products, self.users,
+                    self.user_orders, self.userXproduct, self.snapshot,
+                ),
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, path)
+        self.unsaved_rows = 0
+
+    @classmethod
+    def load(cls) -> Optional["FeatureStore"]:
+        path = os.path.join(FEATURE_STORE_DIR, "features.pkl")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as file:
+            return cls(*pickle.load(file))
+
+
+async def get_data_marker(db: AsyncSession, counted: bool = True) -> DataMarker:
+    columns = [
+        select(func.max(Order.id)).scalar_subquery(),
+        select(func.max(OrderProduct.id)).scalar_subquery(),
+        select(func.max(Product.id)).scalar_subquery(),
+        select(func.count(Product.id)).scalar_subquery(),
+    ]
+    if counted:
+        columns += [
+            select(func.count(Order.id)).scalar_subquery(),
+            select(func.count(OrderProduct.id)).scalar_subquery(),
+        ]
+    result = await db.execute(select(*columns))
+    return DataMarker(*(value or 0 for value in result.one()))
+
+
+async def build_feature_store(db: AsyncSession, marker: DataMarker) -> FeatureStore:
+    if not marker.counted:
+        marker = await get_data_marker(db)
+    # bounded by the marker, so rows inserted meanwhile are left for the next delta
+    df_orders = await load_orders_df(db, Order.id <= marker.max_order_id)
+    df_priors = await load_priors_df(db, OrderProduct.id <= marker.max_order_product_id)
+    df_products = await load_products_df(db, Product.id <= marker.max_product_id)
+    return await asyncio.to_thread(FeatureStore.build, marker, df_orders, df_priors, df_products)
+
+
+async def update_feature_store(
+    db: AsyncSession,
+    store: FeatureStore,
+    marker: DataMarker,
+) -> Optional[FeatureStore]:
+    """Apply rows inserted after the store's watermark, or None if a full rebuild is needed.
+
+    A rebuild is needed when a max id went down, or when the row counts differ
+    from the store's counts plus the delta: rows were deleted, or a row whose
+    id is below the watermark was committed after it. Without counts in
+    ``marker`` the store carries the counts it expects, and the next counted
+    marker checks them.
+    """
+    old = store.marker
+    if marker.max_order_id < old.max_order_id or marker.max_order_product_id < old.max_order_product_id:
+        return None
+
+    new_products = await load_products_df(
+        db, Product.id > old.max_product_id, Product.id <= marker.max_product_id
+    )
+    if marker.product_count - old.product_count != len(new_products):
+        return None
+
+    new_lines = await db.scalar(
+        select(func.count(OrderProduct.id)).where(
+            OrderProduct.id > old.max_order_product_id, OrderProduct.id <= marker.max_order_product_id
+        )
+    )
+    new_order_count = await db.scalar(
+        select(func.count(Order.id)).where(Order.id > old.max_order_id, Order.id <= marker.max_order_id)
+    )
+    if not old.counted:
+        expected = (-1, -1)
+    else:
+        expected = (old.order_count + new_order_count, old.order_product_count + new_lines)
+    if marker.counted and (marker.order_count, marker.order_product_count) != expected:
+        return None
+    marker = marker._replace(order_count=expected[0], order_product_count=expected[1])
+
+    new_orders = await load_orders_df(db, Order.id > old.max_order_id, Order.id <= marker.max_order_id)
+    new_priors = await load_priors_df(
+        db,
+        OrderProduct.id > old.max_order_product_id,
+        OrderProduct.id <= marker.max_order_product_id,
+        extended=True,
+    )
+    return await asyncio.to_thread(store.apply_delta, marker, new_orders, new_priors, new_products)
+
+
+_store = None
+_store_lock = asyncio.Lock()
+_counted_at = 0.0
+_checked_at = 0.0
+_check_task = None
+# one thread, so snapshots are written one at a time and in order
+_save_executor = ThreadPoolExecutor(1, thread_name_prefix="feature-store-save")
+_update_listeners: List[Callable[[FeatureStore], None]] = []
+
+
+def _save(store: FeatureStore):
+    try:
+        store.save()
+    except Exception:
+        logger.exception("saving the feature store snapshot failed")
+
+
+def _save_if_unsaved(store: FeatureStore):
+    if store.unsaved_rows:
+        store.save()
+
+
+async def save_feature_store(store: FeatureStore):
+    """Wait for the snapshots already queued, then save ``store`` if it still has unsaved rows."""
+    await asyncio.wrap_future(_save_executor.submit(_save_if_unsaved, store))
+
+
+def add_update_listener(listener: Callable[[FeatureStore], None]):
+    """Call ``listener(store)`` whenever a new store replaces the current one.
+
+    After a delta ``store.changed_users`` lists the users whose rows changed;
+    a new ``store.snapshot`` means everything may have changed.
+    """
+    _update_listeners.append(listener)
+
+
+async def get_feature_store(db: AsyncSession) -> FeatureStore:
+    global _store, _counted_at
+
+    counted = time.monotonic() - _counted_at >= FEATURE_STORE_RECOUNT_SECONDS
+    marker = await get_data_marker(db, counted)
+    if _store is not None and _store.marker.matches(marker):
+        if counted:
+            _counted_at = time.monotonic()
+        return _store
+
+    async with _store_lock:
+        if _store is not None and _store.marker.matches(marker):
+            return _store
+
+        store = _store if _store is not None else await asyncio.to_thread(FeatureStore.load)
+        save = False
+        if store is not None and not store.marker.matches(marker):
+            store = await update_feature_store(db, store, marker)
+            save = store is not None and store.unsaved_rows >= FEATURE_STORE_SAVE_EVERY
+
+        if store is None:
+            store = await build_feature_store(db, marker)
+            save = True
+        _store = store
+        if save:
+            # deltas build new frames instead of modifying these, so pickling them off the loop is safe
+            _save_executor.submit(_save, store)
+        if counted:
+            _counted_at = time.monotonic()
+
+        for listener in _update_listeners:
+            listener(store)
+
+    return _store
+
+
+def current_feature_store() -> Optional[FeatureStore]:
+    """The store as last built or updated, without checking the database for new rows."""
+    return _store
+
+
+def check_feature_store_later():
+    """Bring the store up to date in a background task, at most every FEATURE_STORE_CHECK_SECONDS.
+
+    For readers that serve ``current_feature_store()`` instead of awaiting
+    ``get_feature_store`` on every request.
+    """
+    global _check_task
+    if _check_task is not None or time.monotonic() - _checked_at < FEATURE_STORE_CHECK_SECONDS:
+        return
+
+    async def check():
+        global _check_task, _checked_at
+        try:
+            async with async_session() as db:
+                await get_feature_store(db)
+        except Exception:
+            logger.exception("checking the feature store for new rows failed")
+        finally:
+            _checked_at = time.monotonic()
+            _check_task = None
+
+    _check_task = asyncio.get_running_loop().create_task(check())
@@ -1,6 +1,24 @@
 import pandas as pd
 import numpy as np
 
+FEATURE_COLUMNS = [
+    "user_total_orders",
+    "user_total_items",
+    "total_distinct_items",
+    "user_average_days_between_orders",
+    "user_average_basket",
+    "aisle_id",
+    "department_id",
+    "product_orders",
+    "product_reorders",
+    "product_reorder_rate",
+    "UP_orders",
+    "UP_orders_ratio",
+    "UP_average_pos_in_cart",
+    "UP_orders_since_last",
+    "UP_reorder_rate",
+]
+
 def get_product_features(priors: pd.DataFrame, products: pd.DataFrame) -> pd.DataFrame:
     prods = pd.DataFrame()
     prods["orders"] = priors.groupby("product_id").size().astype(np.int32)
@@ -27,26 +45,29 @@ def get_user_features(priors: pd.DataFrame, orders: pd.DataFrame) -> pd.DataFram
     return users
 
 def get_userXproduct_features(priors: pd.DataFrame) -> pd.DataFrame:
-    priors["user_product"] = priors["product_id"] + priors["user_id"] * 100000
-    d = {}
-    for row in priors.itertuples():
-        key = row.user_product
-        if key not in d:
-            d[key] = (1, (row.order_number, row.order_id), row.add_to_cart_order)
-        else:
-            old_val = d[key]
-            new_count = old_val[0] + 1
-            new_last = max(old_val[1], (row.order_number, row.order_id))
-            new_pos_sum = old_val[2] + row.add_to_cart_order
-            d[key] = (new_count, new_last, new_pos_sum)
-
-    userXproduct = pd.DataFrame.from_dict(d, orient="index")
-    userXproduct.columns = ["nb_orders", "last_order_tuple", "sum_pos_in_cart"]
-    userXproduct["nb_orders"] = userXproduct["nb_orders"].astype(np.int16)
-    userXproduct["last_order_id"] = userXproduct["last_order_tuple"].map(lambda x: x[1]).astype(np.int32)
-    userXproduct["sum_pos_in_cart"] = userXproduct["sum_pos_in_cart"].astype(np.int16)
-    userXproduct.drop("last_order_tuple", axis=1, inplace=True)
-    return userXproduct
+    keys = priors["product_id"].to_numpy(np.int64) + priors["user_id"].to_numpy(np.int64) * 100000
+    priors["user_product"] = keys
+
+    # (order_number, order_id) packed into one int64 so the latest order is a plain max
+    last_order = (priors["order_number"].to_numpy(np.int64) << 32) | priors["order_id"].to_numpy(np.int64)
+    positions = priors["add_to_cart_order"].to_numpy(np.int64)
+
+    sort_idx = np.argsort(keys)
+    keys = keys[sort_idx]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+
+    nb_orders = np.diff(starts, append=len(keys))
+    sum_pos_in_cart = np.add.reduceat(positions[sort_idx], starts)
+    last_order_id = np.maximum.reduceat(last_order[sort_idx], starts) & 0xFFFFFFFF
+
+    return pd.DataFrame(
+        {
+            "nb_orders": nb_orders.astype(np.int16),
+            "sum_pos_in_cart": sum_pos_in_cart.astype(np.int16),
+            "last_order_id": last_order_id.astype(np.int32),
+        },
+        index=pd.Index(keys[starts], dtype=np.int64),
+    )
 
 def get_all_features(
     df: pd.DataFrame,
@@ -81,24 +102,24 @@ def get_all_features(
 
     df.drop(["z", "UP_last_order_id"], axis=1, inplace=True)
 
-    f_to_use = [
-        "user_total_orders",
-        "user_total_items",
-        "total_distinct_items",
-        "user_average_days_between_orders",
-        "user_average_basket",
-        "aisle_id",
-        "department_id",
-        "product_orders",
-        "product_reorders",
-        "product_reorder_rate",
-        "UP_orders",
-        "UP_orders_ratio",
-        "UP_average_pos_in_cart",
-        "UP_orders_since_last",
-        "UP_reorder_rate",
-    ]
-    return df[f_to_use]
+    return df[FEATURE_COLUMNS]
+
+def feature_matrix(features: pd.DataFrame) -> np.ndarray:
+    """Features as a C-contiguous float32 matrix in ``FEATURE_COLUMNS`` order."""
+    matrix = np.empty((len(features), len(FEATURE_COLUMNS)), np.float32)
+    for i, column in enumerate(FEATURE_COLUMNS):
+        matrix[:, i] = features[column].to_numpy()
+    return matrix
+
+def build_feature_matrix(
+    pairs: pd.DataFrame,
+    orders: pd.DataFrame,
+    userXproduct: pd.DataFrame,
+    users: pd.DataFrame,
+    products: pd.DataFrame,
+) -> np.ndarray:
+    """get_all_features + feature_matrix; a top-level function so worker processes can run it."""
+    return feature_matrix(get_all_features(pairs, orders, userXproduct, users, products))
 
 def select_pairs_for_user(user_id: int, products_df: pd.DataFrame, top_n: int = 1000) -> pd.DataFrame:
     products_sorted = products_df.dropna(subset=["reorder_rate"]).sort_values("reorder_rate", ascending=False)
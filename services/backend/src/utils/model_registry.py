@@ -0,0 +1,423 @@
+"""Versioned recommendation models with hot-swap and shadow scoring.
+
+    python -m src.utils.model_registry register path/to/model.txt [--version V] [--activate | --shadow]
+    python -m src.utils.model_registry activate VERSION
+    python -m src.utils.model_registry shadow [VERSION]
+    python -m src.utils.model_registry list
+
+Every version lives in ``MODEL_REGISTRY_DIR/<version>/`` as ``model.txt`` plus
+``meta.json``. The ``LIVE`` and ``SHADOW`` files name the serving and shadow
+versions. Workers re-read them at most every MODEL_RELOAD_INTERVAL seconds,
+load the new booster next to the old one and swap the reference, so requests
+already running finish on the model they started with.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from src.utils.features import FEATURE_COLUMNS, feature_matrix
+from src.utils.models import MODEL_INFERENCE, RecommendationModel
+from src.utils.tree_inference import TreeEnsemble, probe_matrix
+
+logger = logging.getLogger(__name__)
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "./src/models")
+BASELINE_MODEL_PATH = "./src/baseline.txt"
+BASELINE_VERSION = "baseline"
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+# share of live predictions that are also scored by the shadow model; a sample is
+# dropped while the previous one is still being scored
+MODEL_SHADOW_SAMPLE = float(os.getenv("MODEL_SHADOW_SAMPLE", "0.1"))
+LATENCY_WINDOW = 2048
+SHADOW_TOP_K = 10
+# largest score difference between NumPy and LightGBM inference a model may show at registration
+PARITY_TOLERANCE = 1e-9
+# versions become directory names; no separators and no leading dot (".", "..", hidden temp dirs)
+VERSION_PATTERN = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9._-]*")
+
+
+class ModelRegistryError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+def _version_dir(version: str, directory: str) -> str:
+    if not VERSION_PATTERN.fullmatch(version):
+        raise ModelRegistryError(f"Invalid model version '{version}': use letters, digits, '.', '_' and '-'")
+    return os.path.join(directory, version)
+
+
+def _meta_path(version: str, directory: str) -> str:
+    return os.path.join(_version_dir(version, directory), "meta.json")
+
+
+def model_path(version: str, directory: str = MODEL_REGISTRY_DIR) -> str:
+    return os.path.join(_version_dir(version, directory), "model.txt")
+
+
+def read_meta(version: str, directory: str = MODEL_REGISTRY_DIR) -> dict:
+    try:
+        with open(_meta_path(version, directory)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        raise ModelRegistryError(f"Model version '{version}' not found")
+
+
+def list_versions(directory: str = MODEL_REGISTRY_DIR) -> List[dict]:
+    if not os.path.isdir(directory):
+        return []
+    versions = [
+        read_meta(name, directory)
+        for name in os.listdir(directory)
+        if VERSION_PATTERN.fullmatch(name) and os.path.exists(_meta_path(name, directory))
+    ]
+    return sorted(versions, key=lambda meta: meta["created_at"])
+
+
+def read_pointer(name: str, directory: str = MODEL_REGISTRY_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, name)) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(name: str, version: Optional[str], directory: str = MODEL_REGISTRY_DIR):
+    if version is not None:
+        read_meta(version, directory)
+    pointer = os.path.join(directory, name)
+    tmp = f"{pointer}.tmp-{os.getpid()}"
+    with open(tmp, "w") as file:
+        file.write(version or "")
+    os.replace(tmp, pointer)
+
+
+def register_model(
+    path: str,
+    version: Optional[str] = None,
+    description: str = "",
+    directory: str = MODEL_REGISTRY_DIR,
+    reorder_features: bool = False,
+) -> dict:
+    """Copy a LightGBM text model into the registry after checking its features.
+
+    Feature matrices are built in ``FEATURE_COLUMNS`` order, so by default
+    the model must use exactly those features in that order. A model with the
+    same features in another order is rejected unless ``reorder_features``
+    is set; RecommendationModel then permutes the columns by name.
+    """
+    with open(path, "rb") as file:
+        sha1 = hashlib.sha1(file.read()).hexdigest()
+    booster = lgb.Booster(model_file=path)
+    booster_features = booster.feature_name()
+    if sorted(booster_features) != sorted(FEATURE_COLUMNS):
+        raise ModelRegistryError(
+            f"Model features {booster_features} do not match get_all_features columns {FEATURE_COLUMNS}"
+        )
+    if booster_features != FEATURE_COLUMNS and not reorder_features:
+        raise ModelRegistryError(
+            f"Model features {booster_features} are in a different order than FEATURE_COLUMNS {FEATURE_COLUMNS}; "
+            "register with --reorder-features to score it with the columns permuted by name"
+        )
+    if MODEL_INFERENCE == "numpy":
+        try:
+            ensemble = TreeEnsemble(booster)
+        except ValueError as exc:
+            raise ModelRegistryError(str(exc))
+        probe = probe_matrix(ensemble)
+        diff = float(np.abs(ensemble.predict(probe) - booster.predict(probe)).max())
+        if diff > PARITY_TOLERANCE:
+            raise ModelRegistryError(f"NumPy inference differs from LightGBM by up to {diff:.2e} on this model")
+
+    version = version or f"{time.strftime('%Y%m%d-%H%M%S')}-{sha1[:8]}"
+    target = _version_dir(version, directory)
+    if os.path.exists(target):
+        return _existing_version(version, sha1, directory)
+
+    meta = {
+        "version": version,
+        "sha1": sha1,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "description": description,
+        "source": os.path.abspath(path),
+        "num_trees": booster.num_trees(),
+        "feature_names": list(FEATURE_COLUMNS),
+        "booster_feature_names": booster_features,
+    }
+    tmp = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(tmp)
+    shutil.copyfile(path, os.path.join(tmp, "model.txt"))
+    with open(os.path.join(tmp, "meta.json"), "w") as file:
+        json.dump(meta, file, indent=2)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # another worker registered the same version first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(target):
+            raise
+        return _existing_version(version, sha1, directory)
+    return meta
+
+
+def _existing_version(version: str, sha1: str, directory: str) -> dict:
+    """Re-registering the same file under the same version is a no-op; a different file is an error."""
+    try:
+        meta = read_meta(version, directory)
+    except ModelRegistryError:
+        meta = None
+    if meta is None or meta["sha1"] != sha1:
+        raise ModelRegistryError(f"Model version '{version}' already exists")
+    return meta
+
+
+def activate_version(version: str, directory: str = MODEL_REGISTRY_DIR):
+    write_pointer("LIVE", version, directory)
+    if read_pointer("SHADOW", directory) == version:
+        write_pointer("SHADOW", None, directory)
+
+
+def ensure_baseline(directory: str = MODEL_REGISTRY_DIR):
+    """Register the bundled baseline and make it live on an empty registry."""
+    if read_pointer("LIVE", directory) is not None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    if not os.path.exists(_meta_path(BASELINE_VERSION, directory)):
+        # the baseline was trained with UP_reorder_rate before UP_orders_since_last
+        register_model(BASELINE_MODEL_PATH, BASELINE_VERSION, "bundled baseline", directory, reorder_features=True)
+    write_pointer("LIVE", BASELINE_VERSION, directory)
+
+
+def live_model_path(directory: str = MODEL_REGISTRY_DIR) -> str:
+    version = read_pointer("LIVE", directory)
+    return model_path(version, directory) if version else BASELINE_MODEL_PATH
+
+
+class LatencyStats:
+    """Prediction count, errors and latency percentiles over the last ``window`` calls."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self._samples.append(seconds * 1000)
+
+    def summary(self) -> dict:
+        summary = {"count": self.count, "errors": self.errors}
+        if self._samples:
+            samples = np.fromiter(self._samples, np.float64)
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            summary.update(
+                mean_ms=round(float(samples.mean()), 3),
+                p50_ms=round(float(p50), 3),
+                p95_ms=round(float(p95), 3),
+                p99_ms=round(float(p99), 3),
+            )
+        return summary
+
+
+class ShadowStats:
+    """How the shadow model's ranking compares with the live one on the same candidates."""
+
+    def __init__(self):
+        self.comparisons = 0
+        self.overlap_sum = 0.0
+        self.score_diff_sum = 0.0
+
+    def record(self, live: np.ndarray, shadow: np.ndarray):
+        k = min(SHADOW_TOP_K, len(live))
+        if not k:
+            return
+        live_top = set(np.argpartition(-live, k - 1)[:k].tolist())
+        shadow_top = set(np.argpartition(-shadow, k - 1)[:k].tolist())
+        self.comparisons += 1
+        self.overlap_sum += len(live_top & shadow_top) / k
+        self.score_diff_sum += float(np.abs(live - shadow).mean())
+
+    def summary(self) -> dict:
+        if not self.comparisons:
+            return {"comparisons": 0}
+        return {
+            "comparisons": self.comparisons,
+            f"top{SHADOW_TOP_K}_overlap": round(self.overlap_sum / self.comparisons, 4),
+            "mean_abs_score_diff": round(self.score_diff_sum / self.comparisons, 6),
+        }
+
+
+class ModelRegistry:
+    def __init__(self, directory: str = MODEL_REGISTRY_DIR):
+        self.directory = directory
+        self.live: Optional[RecommendationModel] = None
+        self.shadow: Optional[RecommendationModel] = None
+        self.latency: Dict[str, LatencyStats] = {}
+        self.shadow_stats: Dict[str, ShadowStats] = {}
+        self.shadow_skipped = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        # one thread: shadow scoring must never compete with live requests for more than a core
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-model")
+        # at most one shadow job queued or running, so the executor queue cannot grow under load
+        self._shadow_slot = threading.Semaphore(1)
+
+    def _load(self, version: Optional[str], current: Optional[RecommendationModel]) -> Optional[RecommendationModel]:
+        if version is None:
+            return None
+        if current is not None and current.version == version:
+            return current
+        model = RecommendationModel(model_path(version, self.directory), version=version)
+        self.latency.setdefault(version, LatencyStats())
+        return model
+
+    def _sync(self):
+        ensure_baseline(self.directory)
+        live = self._load(read_pointer("LIVE", self.directory), self.live)
+        shadow = self._load(read_pointer("SHADOW", self.directory), self.shadow)
+        if shadow is not None and shadow.version == live.version:
+            shadow = None
+
+        if self.live is not None and live is not self.live:
+            logger.info("model %s is live, replacing %s", live.version, self.live.version)
+        # plain reference swaps: requests holding the previous model keep using it
+        self.live, self.shadow = live, shadow
+        self._checked_at = time.monotonic()
+
+    async def current(self) -> RecommendationModel:
+        """The live model, re-reading the registry pointers every MODEL_RELOAD_INTERVAL seconds."""
+        if self.live is not None and time.monotonic() - self._checked_at < MODEL_RELOAD_INTERVAL:
+            return self.live
+
+        async with self._lock:
+            if self.live is None or time.monotonic() - self._checked_at >= MODEL_RELOAD_INTERVAL:
+                await asyncio.to_thread(self._sync)
+        return self.live
+
+    async def activate(self, version: str):
+        activate_version(version, self.directory)
+        async with self._lock:
+            await asyncio.to_thread(self._sync)
+
+    async def set_shadow(self, version: Optional[str]):
+        write_pointer("SHADOW", version, self.directory)
+        async with self._lock:
+            await asyncio.to_thread(self._sync)
+
+    def predict(self, model: RecommendationModel, features: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """Score with ``model``, record its latency and hand the same rows to the shadow model.
+
+        Safe to call from worker threads.
+        """
+        stats = self.latency.setdefault(model.version, LatencyStats())
+        start = time.perf_counter()
+        try:
+            if isinstance(features, pd.DataFrame):
+                features = feature_matrix(features)
+            preds = model.predict(features)
+        except Exception:
+            stats.errors += 1
+            raise
+        stats.record(time.perf_counter() - start)
+
+        shadow = self.shadow
+        if shadow is not None and shadow is not model and random.random() < MODEL_SHADOW_SAMPLE:
+            if self._shadow_slot.acquire(blocking=False):
+                self._shadow_executor.submit(self._score_shadow, shadow, features, preds)
+            else:
+                self.shadow_skipped += 1
+        return preds
+
+    def _score_shadow(self, shadow: RecommendationModel, features: np.ndarray, live_preds: np.ndarray):
+        try:
+            self._compare_shadow(shadow, features, live_preds)
+        finally:
+            self._shadow_slot.release()
+
+    def _compare_shadow(self, shadow: RecommendationModel, features: np.ndarray, live_preds: np.ndarray):
+        stats = self.latency.setdefault(shadow.version, LatencyStats())
+        start = time.perf_counter()
+        try:
+            preds = shadow.predict(features)
+        except Exception:
+            stats.errors += 1
+            logger.exception("shadow model %s failed", shadow.version)
+            return
+        stats.record(time.perf_counter() - start)
+        self.shadow_stats.setdefault(shadow.version, ShadowStats()).record(live_preds, preds)
+
+    def status(self) -> dict:
+        live = self.live.version if self.live else read_pointer("LIVE", self.directory)
+        shadow = self.shadow.version if self.shadow else read_pointer("SHADOW", self.directory)
+        return {
+            "live": live,
+            "shadow": shadow,
+            "shadow_skipped": self.shadow_skipped,
+            "versions": [
+                {
+                    **meta,
+                    "latency": self.latency[meta["version"]].summary() if meta["version"] in self.latency else None,
+                    "shadow_comparison": (
+                        self.shadow_stats[meta["version"]].summary() if meta["version"] in self.shadow_stats else None
+                    ),
+                }
+                for meta in list_versions(self.directory)
+            ],
+        }
+
+
+model_registry = ModelRegistry()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register")
+    register.add_argument("path")
+    register.add_argument("--version")
+    register.add_argument("--description", default="")
+    register.add_argument("--reorder-features", action="store_true")
+    target = register.add_mutually_exclusive_group()
+    target.add_argument("--activate", action="store_true")
+    target.add_argument("--shadow", action="store_true")
+    commands.add_parser("activate").add_argument("version")
+    commands.add_parser("shadow").add_argument("version", nargs="?")
+    commands.add_parser("list")
+    args = parser.parse_args()
+
+    try:
+        ensure_baseline()
+        if args.command == "register":
+            meta = register_model(args.path, args.version, args.description, reorder_features=args.reorder_features)
+            print(f"registered {meta['version']}")
+            if args.activate:
+                activate_version(meta["version"])
+            elif args.shadow:
+                write_pointer("SHADOW", meta["version"])
+        elif args.command == "activate":
+            activate_version(args.version)
+        elif args.command == "shadow":
+            write_pointer("SHADOW", args.version)
+        else:
+            live, shadow = read_pointer("LIVE"), read_pointer("SHADOW")
+            for meta in list_versions():
+                role = "live" if meta["version"] == live else "shadow" if meta["version"] == shadow else ""
+                print(f"{meta['version']:<28} {role:<7} {meta['created_at']}  {meta['description']}")
+    except ModelRegistryError as exc:
+        parser.exit(1, f"error: {exc.message}\n")
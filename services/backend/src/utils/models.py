@@ -1,10 +1,49 @@
+import hashlib
+import os
+from typing import Optional, Union
+
 import lightgbm as lgb
+import numpy as np
 import pandas as pd
 
+from src.utils.features import FEATURE_COLUMNS, feature_matrix
+from src.utils.tree_inference import TreeEnsemble
+
+# "lightgbm" or "numpy" (vectorized traversal of the dumped trees)
+MODEL_INFERENCE = os.getenv("MODEL_INFERENCE", "lightgbm")
+# batches below this size run on one thread: OpenMP fan-out costs more than it saves
+SMALL_BATCH_ROWS = int(os.getenv("MODEL_SMALL_BATCH_ROWS", "2000"))
+PREDICT_THREADS = int(os.getenv("MODEL_PREDICT_THREADS", str(os.cpu_count() or 1)))
+
 class RecommendationModel:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, version: Optional[str] = None, inference: str = MODEL_INFERENCE):
         self.clf_model = lgb.Booster(model_file=model_path)
+        self.model_path = model_path
+        if version is None:
+            with open(model_path, "rb") as file:
+                version = hashlib.sha1(file.read()).hexdigest()[:12]
+        self.version = version
+        self.trees = TreeEnsemble(self.clf_model) if inference == "numpy" else None
+        # matrices arrive in FEATURE_COLUMNS order; a model trained on the same columns in
+        # another order (the bundled baseline) gets them permuted to its own order by name
+        names = self.clf_model.feature_name()
+        if names != FEATURE_COLUMNS and sorted(names) == sorted(FEATURE_COLUMNS):
+            self.columns = np.array([FEATURE_COLUMNS.index(name) for name in names])
+        else:
+            self.columns = None
+
+        # pay for predictor and thread pool setup here rather than on the first request
+        self.predict(np.zeros((1, self.clf_model.num_feature()), np.float32))
+
+    def predict(self, features: Union[pd.DataFrame, np.ndarray], top_k: int = 10, num_threads: int = 0):
+        matrix = feature_matrix(features) if isinstance(features, pd.DataFrame) else features
+        if self.columns is not None:
+            matrix = matrix[:, self.columns]
+        if self.trees is not None:
+            return self.trees.predict(matrix)
 
-    def predict(self, features: pd.DataFrame, top_k: int = 10):
-        preds = self.clf_model.predict(features)
-        return preds
\ No newline at end of file
+        # always explicit: LightGBM keeps the last thread count for the whole process
+        if num_threads <= 0:
+            num_threads = 1 if len(matrix) < SMALL_BATCH_ROWS else PREDICT_THREADS
+        preds = self.clf_model.predict(matrix, num_threads=num_threads)
+        return preds
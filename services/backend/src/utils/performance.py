@@ -0,0 +1,237 @@
+"""Request latency, response size and event-loop lag metrics, plus an opt-in profiler.
+
+PerformanceMiddleware is plain ASGI (no BaseHTTPMiddleware task per
+request): per request it does two dict lookups and two histogram updates,
+labelled by the matched route template rather than the raw path.
+
+The sampling profiler is off unless PROFILE_SAMPLE_RATE (profile 1 in N
+requests) or PROFILE_HEADER (honour ``X-Profile: 1``) is set. While a
+profiled request is in flight a background thread samples the event loop
+thread's stack every PROFILE_INTERVAL_MS and keeps the samples taken while
+that request's task was running, per route, in the folded format
+flamegraph.pl and speedscope read. Code the request hands to thread or
+process pools is not sampled.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Tuple
+
+from src.utils.metrics import Histogram, format_histograms, format_metric
+
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "0") == "1"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "5000"))
+PROFILE_MAX_DEPTH = 64
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def route_of(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class HttpMetrics:
+    def __init__(self):
+        self.durations: Dict[Tuple[str, str, str], Histogram] = {}
+        self.sizes: Dict[Tuple[str, str], Histogram] = {}
+        self.in_flight = 0
+        self.loop_lag = Histogram(LAG_BUCKETS)
+        self.loop_lag_max = 0.0
+
+    def observe(self, method: str, route: str, status: int, elapsed: float, size: int):
+        key = (method, route, f"{status // 100}xx")
+        histogram = self.durations.get(key)
+        if histogram is None:
+            histogram = self.durations[key] = Histogram()
+        histogram.observe(elapsed)
+
+        histogram = self.sizes.get(key[:2])
+        if histogram is None:
+            histogram = self.sizes[key[:2]] = Histogram(SIZE_BUCKETS)
+        histogram.observe(size)
+
+    def prometheus(self) -> list:
+        lines = format_histograms(
+            "http_request_duration_seconds",
+            "Time from request start to the last response byte, by route template.",
+            {(("method", method), ("route", route), ("status", status)): histogram
+             for (method, route, status), histogram in self.durations.items()},
+        )
+        lines += format_histograms(
+            "http_response_size_bytes",
+            "Response body size, by route template.",
+            {(("method", method), ("route", route)): histogram for (method, route), histogram in self.sizes.items()},
+        )
+        lines += format_metric("http_requests_in_flight", "gauge", "Requests being handled.", [((), self.in_flight)])
+        lines += format_histograms("event_loop_lag_seconds", "How late the event loop ran a timer.", {(): self.loop_lag})
+        lines += format_metric("event_loop_lag_max_seconds", "gauge", "Largest event loop lag seen.", [((), self.loop_lag_max)])
+        return lines
+
+
+class LoopLagMonitor:
+    """Sleeps ``interval`` in a loop and records how much later than asked it woke up."""
+
+    def __init__(self, metrics: HttpMetrics, interval: float):
+        self.metrics = metrics
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - start - self.interval, 0.0)
+            self.metrics.loop_lag.observe(lag)
+            if lag > self.metrics.loop_lag_max:
+                self.metrics.loop_lag_max = lag
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class SamplingProfiler:
+    def __init__(self, sample_rate: int, header: bool, interval_ms: float, max_stacks: int):
+        self.sample_rate = sample_rate
+        self.header = header
+        self.interval = interval_ms / 1000
+        self.max_stacks = max_stacks
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)
+        self.requests: Counter = Counter()
+        # task -> ASGI scope of the profiled request it runs
+        self._profiled: Dict[asyncio.Task, dict] = {}
+        self._active = threading.Event()
+        # the sampler thread writes stacks while endpoints read them
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.header
+
+    def wants(self, scope: dict) -> bool:
+        if self.sample_rate > 0 and random.randrange(self.sample_rate) == 0:
+            return True
+        if self.header:
+            return any(name == b"x-profile" and value == b"1" for name, value in scope.get("headers", ()))
+        return False
+
+    def begin(self, scope: dict) -> Optional[asyncio.Task]:
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+            self._thread.start()
+        self._profiled[task] = scope
+        self._active.set()
+        return task
+
+    def end(self, task: asyncio.Task):
+        scope = self._profiled.pop(task, None)
+        if scope is not None:
+            self.requests[route_of(scope)] += 1
+        if not self._profiled:
+            self._active.clear()
+
+    def _sample(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            # reading the loop's current task from here is racy, but a stale read only misattributes one sample
+            task = asyncio.current_task(self._loop)
+            scope = self._profiled.get(task)
+            frame = sys._current_frames().get(self._loop_thread)
+            if scope is None or frame is None:
+                continue
+
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            folded = ";".join(reversed(stack))
+
+            with self._lock:
+                counts = self.stacks[route_of(scope)]
+                if folded in counts or len(counts) < self.max_stacks:
+                    counts[folded] += 1
+
+    def folded(self, route: str) -> str:
+        with self._lock:
+            stacks = self.stacks.get(route, Counter()).most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "header": self.header,
+                "interval_ms": self.interval * 1000,
+                "routes": {
+                    route: {"requests": self.requests[route], "samples": sum(counts.values()), "stacks": len(counts)}
+                    for route, counts in self.stacks.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.requests.clear()
+
+
+class PerformanceMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        task = profiler.begin(scope) if profiler.enabled and profiler.wants(scope) else None
+        http_metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_metrics.in_flight -= 1
+            if task is not None:
+                profiler.end(task)
+            http_metrics.observe(scope["method"], route_of(scope), status, time.perf_counter() - start, size)
+
+
+http_metrics = HttpMetrics()
+loop_lag_monitor = LoopLagMonitor(http_metrics, LOOP_LAG_INTERVAL)
+profiler = SamplingProfiler(PROFILE_SAMPLE_RATE, PROFILE_HEADER, PROFILE_INTERVAL_MS, PROFILE_MAX_STACKS)
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+from fpdf import FPDF
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_ARCHIVE_DIR = os.getenv("RECEIPT_ARCHIVE_DIR", "./src/receipts")
+# FPDF is pure Python and holds the GIL, so receipts are rendered in processes
+RECEIPT_WORKERS = int(os.getenv("RECEIPT_WORKERS", str(min(2, os.cpu_count() or 1))))
+# the archive is pruned to receipts used within this many days, oldest first beyond the size cap
+RECEIPT_ARCHIVE_MAX_AGE_DAYS = float(os.getenv("RECEIPT_ARCHIVE_MAX_AGE_DAYS", "30"))
+RECEIPT_ARCHIVE_MAX_MB = float(os.getenv("RECEIPT_ARCHIVE_MAX_MB", "512"))
+RECEIPT_ARCHIVE_PRUNE_SECONDS = float(os.getenv("RECEIPT_ARCHIVE_PRUNE_SECONDS", "600"))
+# files used this recently are kept, so a response still being sent never loses its file
+PRUNE_GRACE_SECONDS = 300
+
+# (product_id, name, quantity, price)
+ReceiptLine = Tuple[int, str, int, float]
+
+
+def receipt_key(kind: str, user_id: int, reference: str, lines: Iterable[ReceiptLine]) -> str:
+    """Content address of a receipt: the same owner and lines always map to the same file."""
+    payload = json.dumps([kind, user_id, reference, [list(line) for line in lines]], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_receipt(title: str, subtitle: str, lines: List[ReceiptLine]) -> bytes:
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, title, ln=True, align="C")
+    pdf.set_font("Arial", 'I', 12)
+    pdf.cell(200, 10, subtitle, ln=True, align="C")
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', 12)
+    page_width = pdf.w - 2 * pdf.l_margin
+    col_widths = [page_width * 0.35, (page_width * 0.65) / 3, (page_width * 0.65) / 3, (page_width * 0.65) / 3]
+    pdf.cell(col_widths[0], 10, "Product Name", border=1, align="C")
+    pdf.cell(col_widths[1], 10, "Quantity", border=1, align="C")
+    pdf.cell(col_widths[2], 10, "Price", border=1, align="C")
+    pdf.cell(col_widths[3], 10, "Total", border=1, align="C")
+    pdf.ln()
+    pdf.set_font("Arial", size=12)
+    total_price = 0
+
+    for _, name, quantity, price in lines:
+        total_item_price = price * quantity
+        pdf.cell(col_widths[0], 10, name, border=1)
+        pdf.cell(col_widths[1], 10, str(quantity), border=1, align="C")
+        pdf.cell(col_widths[2], 10, f"${price:.2f}", border=1, align="C")
+        pdf.cell(col_widths[3], 10, f"${total_item_price:.2f}", border=1, align="C")
+        pdf.ln()
+        total_price += total_item_price
+
+    pdf.ln(5)
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(col_widths[0] + col_widths[1] + col_widths[2], 10, "Total Price" + "\t"*7, border=1, align="R")
+    pdf.cell(col_widths[3], 10, f"${total_price:.2f}", border=1, align="C")
+    return pdf.output(dest='S').encode('latin1')
+
+
+def _render_to(path: str, title: str, subtitle: str, lines: List[ReceiptLine]) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(render_receipt(title, subtitle, lines))
+    os.replace(tmp_path, path)
+    return path
+
+
+def prune_archive(directory: str, max_bytes: int, max_age: float) -> int:
+    """Delete receipts unused for ``max_age`` seconds, then the least recently used beyond ``max_bytes``."""
+    now = time.time()
+    files = []
+    try:
+        shards = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for shard in shards:
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if mtime > now - PRUNE_GRACE_SECONDS or (mtime > now - max_age and total <= max_bytes):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+class ReceiptArchive:
+    """Rendered receipts on disk, addressed by ``receipt_key``.
+
+    A receipt is rendered once on a process pool and then served from its
+    file; concurrent requests for a receipt that is still rendering wait for
+    the same render. Serving a file bumps its mtime, and every
+    RECEIPT_ARCHIVE_PRUNE_SECONDS a background prune drops the files least
+    recently used.
+    """
+
+    def __init__(self, directory: str, workers: int, max_bytes: int, max_age: float):
+        self.directory = directory
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._rendering: Dict[str, asyncio.Future] = {}
+        self._pruning: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+        self.stats = dict.fromkeys(("hits", "rendered", "errors", "pruned"), 0)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pdf")
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def _render(self, key: str, title: str, subtitle: str, lines: List[ReceiptLine]) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            path = await loop.run_in_executor(self._executor(), _render_to, self.path(key), title, subtitle, lines)
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+        self.stats["rendered"] += 1
+        return path
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._rendering.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.error("rendering receipt %s failed", key, exc_info=task.exception())
+
+    async def _prune(self):
+        try:
+            self.stats["pruned"] += await asyncio.to_thread(prune_archive, self.directory, self.max_bytes, self.max_age)
+        except Exception:
+            logger.exception("pruning the receipt archive failed")
+        finally:
+            self._pruning = None
+
+    def _prune_later(self):
+        if self._pruning is None and time.monotonic() - self._pruned_at >= RECEIPT_ARCHIVE_PRUNE_SECONDS:
+            self._pruned_at = time.monotonic()
+            self._pruning = asyncio.get_running_loop().create_task(self._prune())
+
+    async def get(self, key: str, title: str, subtitle: str, lines: List[ReceiptLine]) -> str:
+        """Path of the archived receipt, rendering it first if needed."""
+        self._prune_later()
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            self.stats["hits"] += 1
+            return path
+
+        task = self._rendering.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(key, title, subtitle, lines))
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._rendering[key] = task
+        return await asyncio.shield(task)
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "rendering": len(self._rendering)}
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _ZipSink:
+    """Unseekable file object that hands out whatever ZipFile wrote since the last drain."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _add_to_zip(archive: zipfile.ZipFile, sink: _ZipSink, name: str, path: str) -> bytes:
+    archive.write(path, name)
+    return sink.drain()
+
+
+async def stream_zip(entries: List[Tuple[str, Awaitable[str]]]) -> AsyncIterator[bytes]:
+    """ZIP of the files ``entries`` resolve to, yielded entry by entry in order.
+
+    Nothing is buffered beyond the entry being written, so the download
+    starts as soon as the first file is ready.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+        for name, pending in entries:
+            path = await pending
+            yield await asyncio.to_thread(_add_to_zip, archive, sink, name, path)
+    # closing wrote the central directory
+    yield sink.drain()
+
+
+receipt_archive = ReceiptArchive(
+    RECEIPT_ARCHIVE_DIR,
+    RECEIPT_WORKERS,
+    int(RECEIPT_ARCHIVE_MAX_MB * 1024 * 1024),
+    RECEIPT_ARCHIVE_MAX_AGE_DAYS * 86400,
+)
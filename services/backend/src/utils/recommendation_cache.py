@@ -0,0 +1,250 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.db_init import async_session
+from src.utils.feature_store import FeatureStore, add_update_listener
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", "50000"))
+RECOMMENDATION_CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+# how long past the TTL, or past a model / snapshot change, an entry may still be served while it is recomputed
+RECOMMENDATION_CACHE_STALE_TTL = float(os.getenv("RECOMMENDATION_CACHE_STALE_TTL", "3600"))
+# optional SQLite file shared by all workers on the host
+RECOMMENDATION_CACHE_DB = os.getenv("RECOMMENDATION_CACHE_DB")
+
+Compute = Callable[[AsyncSession], Awaitable[dict]]
+
+
+class CachedRecommendations(NamedTuple):
+    payload: dict
+    model_version: str
+    snapshot: str
+    # FeatureStore.user_stamp at compute time; a new order of the user changes it
+    stamp: str
+    computed_at: float
+
+
+class SqliteRecommendationStore:
+    """Entries shared between processes through one SQLite file (WAL mode)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations ("
+                " key TEXT PRIMARY KEY, user_id INTEGER NOT NULL, payload TEXT NOT NULL,"
+                " model_version TEXT NOT NULL, snapshot TEXT NOT NULL, stamp TEXT NOT NULL,"
+                " computed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS recommendations_user_id ON recommendations (user_id)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[CachedRecommendations]:
+        row = self._connection().execute(
+            "SELECT payload, model_version, snapshot, stamp, computed_at FROM recommendations WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        return CachedRecommendations(json.loads(row[0]), *row[1:])
+
+    def put(self, key: str, user_id: int, entry: CachedRecommendations):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, user_id, json.dumps(entry.payload), *entry[1:]),
+        )
+
+    def delete_users(self, user_ids: Iterable[int]):
+        conn = self._connection()
+        user_ids = [int(user_id) for user_id in user_ids]
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            conn.execute(
+                f"DELETE FROM recommendations WHERE user_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+
+
+class RecommendationCache:
+    """Per-user recommendation responses: in-process LRU, optionally backed by a shared store.
+
+    An entry is fresh for ``ttl`` seconds. After that, or once the model or
+    the feature store snapshot changed, it is stale: still returned for up to
+    ``stale_ttl`` seconds while a background task recomputes it. New orders
+    of the user drop the entry outright.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float,
+        shared: Optional[SqliteRecommendationStore] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[int, CachedRecommendations]]" = OrderedDict()
+        self._user_keys: Dict[int, Set[str]] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._deleting: Set[asyncio.Task] = set()
+        self.stats = dict.fromkeys(
+            ("hits", "stale_hits", "shared_hits", "misses", "invalidations", "refreshes", "refresh_errors"), 0
+        )
+
+    @staticmethod
+    def key(user_id: int, variant: str) -> str:
+        return f"{user_id}:{variant}"
+
+    def _lookup(self, key: str) -> Optional[CachedRecommendations]:
+        cached = self._entries.get(key)
+        if cached is None:
+            return None
+        self._entries.move_to_end(key)
+        return cached[1]
+
+    def _store(self, key: str, user_id: int, entry: CachedRecommendations):
+        self._entries[key] = (user_id, entry)
+        self._entries.move_to_end(key)
+        self._user_keys.setdefault(user_id, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            evicted, (evicted_user, _) = self._entries.popitem(last=False)
+            self._discard_key(evicted_user, evicted)
+
+    def _discard_key(self, user_id: int, key: str):
+        keys = self._user_keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[user_id]
+
+    def _state(self, entry: CachedRecommendations, store: FeatureStore, model_version: str, stamp: str) -> str:
+        if entry.stamp != stamp:
+            return "invalid"
+        age = time.time() - entry.computed_at
+        if age > self.ttl + self.stale_ttl:
+            return "invalid"
+        if age > self.ttl or entry.model_version != model_version or entry.snapshot != store.snapshot:
+            return "stale"
+        return "fresh"
+
+    async def get(
+        self,
+        user_id: int,
+        variant: str,
+        store: FeatureStore,
+        model_version: str,
+        db: AsyncSession,
+        compute: Compute,
+    ) -> Tuple[dict, str]:
+        """Cached payload and how it was served: ``hit``, ``stale`` or ``miss``."""
+        key = self.key(user_id, variant)
+        stamp = store.user_stamp(user_id)
+
+        entry, source = self._lookup(key), "hits"
+        if entry is None and self.shared is not None:
+            entry, source = await asyncio.to_thread(self.shared.get, key), "shared_hits"
+
+        state = self._state(entry, store, model_version, stamp) if entry is not None else "invalid"
+        if state == "fresh":
+            self.stats[source] += 1
+            if source == "shared_hits":
+                self._store(key, user_id, entry)
+            return entry.payload, "hit"
+
+        if state == "stale":
+            self.stats["stale_hits"] += 1
+            self._refresh_later(key, user_id, store, model_version, stamp, compute)
+            return entry.payload, "stale"
+
+        self.stats["misses"] += 1
+        payload = await compute(db)
+        await self._put(key, user_id, CachedRecommendations(payload, model_version, store.snapshot, stamp, time.time()))
+        return payload, "miss"
+
+    async def _put(self, key: str, user_id: int, entry: CachedRecommendations):
+        self._store(key, user_id, entry)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.put, key, user_id, entry)
+
+    def _refresh_later(self, key: str, user_id: int, store: FeatureStore, model_version: str, stamp: str, compute: Compute):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                async with async_session() as db:
+                    payload = await compute(db)
+                await self._put(key, user_id, CachedRecommendations(payload, model_version, store.snapshot, stamp, time.time()))
+                self.stats["refreshes"] += 1
+            except Exception:
+                self.stats["refresh_errors"] += 1
+                logger.exception("refreshing cached recommendations for %s failed", key)
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def invalidate_users(self, user_ids: Iterable[int]):
+        user_ids = {int(user_id) for user_id in user_ids}
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            for key in self._user_keys.pop(user_id, ()):
+                del self._entries[key]
+                self.stats["invalidations"] += 1
+        if self.shared is not None:
+            # runs under the feature store lock, so the SQLite delete goes to a thread; until it
+            # lands, the shared entries are already rejected by their user stamp
+            task = asyncio.get_running_loop().create_task(self._delete_shared(user_ids))
+            self._deleting.add(task)
+            task.add_done_callback(self._deleting.discard)
+
+    async def _delete_shared(self, user_ids: Set[int]):
+        try:
+            await asyncio.to_thread(self.shared.delete_users, user_ids)
+        except Exception:
+            logger.exception("dropping %d users from the shared recommendation cache failed", len(user_ids))
+
+    def on_store_update(self, store: FeatureStore):
+        # a new snapshot only makes entries stale, which _state sees by itself
+        if store.changed_users is not None:
+            self.invalidate_users(store.changed_users)
+
+    def snapshot_stats(self) -> dict:
+        lookups = sum(self.stats[name] for name in ("hits", "stale_hits", "shared_hits", "misses"))
+        served = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "refreshing": len(self._refreshing),
+            "hit_rate": round(served / lookups, 4) if lookups else None,
+        }
+
+
+recommendation_cache = RecommendationCache(
+    RECOMMENDATION_CACHE_SIZE,
+    RECOMMENDATION_CACHE_TTL,
+    RECOMMENDATION_CACHE_STALE_TTL,
+    SqliteRecommendationStore(RECOMMENDATION_CACHE_DB) if RECOMMENDATION_CACHE_DB else None,
+)
+add_update_listener(recommendation_cache.on_store_update)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from src.utils.candidates import generate_candidates
+from src.utils.cooccurrence import CooccurrenceIndex
+from src.utils.feature_store import FeatureStore
+from src.utils.features import build_feature_matrix
+from src.utils.model_registry import model_registry
+from src.utils.models import RecommendationModel
+
+logger = logging.getLogger(__name__)
+
+# processes building feature matrices; 0 builds them on the thread pool instead
+RECOMMENDATION_FEATURE_WORKERS = int(os.getenv("RECOMMENDATION_FEATURE_WORKERS", str(min(4, os.cpu_count() or 1))))
+RECOMMENDATION_THREADS = int(os.getenv("RECOMMENDATION_THREADS", "4"))
+# seconds a request waits for its recommendations before falling back to popular products
+RECOMMENDATION_TIMEOUT = float(os.getenv("RECOMMENDATION_TIMEOUT", "2.0"))
+
+PRODUCT_FEATURE_COLUMNS = ["aisle_id", "department_id", "orders", "reorders", "reorder_rate"]
+
+
+class RecommendationTimeout(Exception):
+    pass
+
+
+def prepare_features(
+    store: FeatureStore,
+    cooccurrence: Optional[CooccurrenceIndex],
+    user_id: int,
+    candidates: int,
+) -> Tuple[np.ndarray, tuple]:
+    """Candidate product ids and the small frames build_feature_matrix needs for them.
+
+    Only the user's rows and the candidates' product rows are passed on, so
+    shipping them to a worker process costs about a millisecond.
+    """
+    orders, users, userXproduct = store.user_slice(user_id)
+    pairs = generate_candidates(user_id, store, cooccurrence, count=candidates)
+    products = store.products.reindex(pairs["product_id"])[PRODUCT_FEATURE_COLUMNS]
+    return pairs["product_id"].to_numpy(), (pairs, orders, userXproduct, users, products)
+
+
+class RecommendationWorkers:
+    """Runs recommendation scoring off the event loop.
+
+    Candidate generation and booster predict run on a thread pool (LightGBM
+    releases the GIL), the pandas feature building on a process pool.
+    Concurrent requests for the same user, model and store version share one
+    computation; each caller waits at most ``timeout`` seconds for it.
+    """
+
+    def __init__(self, feature_workers: int, threads: int, timeout: float):
+        self.feature_workers = feature_workers
+        self.timeout = timeout
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="recommendations")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+        self.stats = dict.fromkeys(("computed", "coalesced", "timeouts", "errors"), 0)
+
+    def _feature_executor(self):
+        if self.feature_workers <= 0:
+            return self._threads
+        if self._processes is None:
+            # spawn: forking a process that runs an event loop and thread pools is not safe
+            self._processes = ProcessPoolExecutor(
+                max_workers=self.feature_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._processes
+
+    async def _compute(
+        self,
+        store: FeatureStore,
+        cooccurrence: Optional[CooccurrenceIndex],
+        model: RecommendationModel,
+        user_id: int,
+        candidates: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        loop = asyncio.get_running_loop()
+        product_ids, frames = await loop.run_in_executor(
+            self._threads, prepare_features, store, cooccurrence, user_id, candidates
+        )
+        try:
+            matrix = await loop.run_in_executor(self._feature_executor(), build_feature_matrix, *frames)
+        except BrokenProcessPool:
+            self._processes = None
+            raise
+        preds = await loop.run_in_executor(self._threads, model_registry.predict, model, matrix)
+        return product_ids, preds
+
+    def _finished(self, key: tuple, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["errors"] += 1
+            logger.error("recommendations for user %s failed", key[0], exc_info=task.exception())
+
+    async def score(
+        self,
+        store: FeatureStore,
+        cooccurrence: Optional[CooccurrenceIndex],
+        model: RecommendationModel,
+        user_id: int,
+        candidates: int,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Candidate product ids and their scores; raises RecommendationTimeout."""
+        key = (user_id, candidates, model.version, store.version)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._compute(store, cooccurrence, model, user_id, candidates))
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self._in_flight[key] = task
+            self.stats["computed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        try:
+            # shield: a caller timing out must not cancel the work others are waiting on
+            return await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise RecommendationTimeout()
+
+    def snapshot_stats(self) -> dict:
+        return {**self.stats, "in_flight": len(self._in_flight)}
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+
+recommendation_workers = RecommendationWorkers(
+    RECOMMENDATION_FEATURE_WORKERS,
+    RECOMMENDATION_THREADS,
+    RECOMMENDATION_TIMEOUT,
+)
@@ -0,0 +1,490 @@
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import async_session
+from src.database.db_models import Aisle, Department, Product, ProductRollup
+from src.utils.feature_store import current_feature_store
+
+logger = logging.getLogger(__name__)
+
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "600"))
+
+NAME_WEIGHT = 1.0
+CATEGORY_WEIGHT = 0.5
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+PREFIX_EXPANSIONS = 50
+FUZZY_EXPANSIONS = 10
+FUZZY_MIN_SIMILARITY = 0.4
+DENSE_RATIO = 8
+# ranking key: match score dominates, popularity (order count) breaks ties
+RANK_SCALE = 1e9
+# popularity_version of order counts taken from the analytics rollup
+ROLLUP_POPULARITY = "rollup"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _append(view: np.ndarray, buffers: dict, key, value) -> np.ndarray:
+    """``view`` with ``value`` appended, as a prefix of a buffer kept in ``buffers[key]``.
+
+    The buffer doubles when full, so repeated appends cost amortized O(1)
+    instead of a copy of the whole array each.
+    """
+    size = len(view)
+    buffer = buffers.get(key)
+    if buffer is None or view.base is not buffer or len(buffer) == size:
+        buffer = np.empty(max(16, 2 * size), dtype=view.dtype)
+        buffer[:size] = view
+        buffers[key] = buffer
+    buffer[size] = value
+    return buffer[:size + 1]
+
+
+def _group(keys, values) -> Dict[int, np.ndarray]:
+    """Group ``values`` by ``keys``; each group keeps the input order of its values."""
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int32)
+    if not len(keys):
+        return {}
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    starts = np.flatnonzero(np.diff(keys, prepend=-1))
+    ends = np.append(starts[1:], len(keys))
+    return {int(keys[start]): values[start:end] for start, end in zip(starts, ends)}
+
+
+class ProductSearchIndex:
+    """In-memory inverted index over product names and their aisle/department names.
+
+    Name tokens and category tokens have separate posting lists (sorted arrays
+    of document positions). A query term matches vocabulary tokens exactly, by
+    prefix (last term only, for autocomplete) or, failing both, through a
+    trigram index over the vocabulary. Documents must match every term and are
+    ranked by match score, then by popularity.
+    """
+
+    def __init__(self):
+        self.built_at = time.monotonic()
+        self.popularity_version = None
+
+        self._ids = np.empty(0, dtype=np.int32)
+        self._names: List[str] = []
+        self._prices = np.empty(0, dtype=np.float64)
+        self._aisle_ids = np.empty(0, dtype=np.int32)
+        self._department_ids = np.empty(0, dtype=np.int32)
+        self._alive = np.empty(0, dtype=bool)
+        self._popularity = np.empty(0, dtype=np.float64)
+        self._positions: Dict[int, int] = {}
+        self._aisle_names: Dict[int, str] = {}
+        self._department_names: Dict[int, str] = {}
+
+        self._token_ids: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._name_postings: List[np.ndarray] = []
+        self._category_postings: List[np.ndarray] = []
+        self._df = np.empty(0, dtype=np.int64)
+        self._sorted_tokens: List[str] = []
+        self._sorted_ids = np.empty(0, dtype=np.int32)
+        self._trigram_tokens: Dict[str, np.ndarray] = {}
+        self._trigram_counts = np.empty(0, dtype=np.int16)
+        # spare capacity behind the arrays that add() appends to
+        self._buffers: dict = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    @classmethod
+    def build(
+        cls,
+        products: Sequence[tuple],
+        aisles: Dict[int, str],
+        departments: Dict[int, str],
+    ) -> "ProductSearchIndex":
+        """``products`` rows are ``(id, name, price, aisle_id, department_id)``."""
+        index = cls()
+        index._aisle_names = dict(aisles)
+        index._department_names = dict(departments)
+
+        ids, names, prices, aisle_ids, department_ids = (
+            map(list, zip(*products)) if len(products) else ([], [], [], [], [])
+        )
+        index._ids = np.array(ids, dtype=np.int32)
+        index._names = names
+        index._prices = np.array(prices, dtype=np.float64)
+        index._aisle_ids = np.array(aisle_ids, dtype=np.int32)
+        index._department_ids = np.array(department_ids, dtype=np.int32)
+        index._alive = np.ones(len(ids), dtype=bool)
+        index._popularity = np.zeros(len(ids), dtype=np.float64)
+        index._positions = dict(zip(ids, range(len(ids))))
+
+        token_ids, docs = [], []
+        for doc, name in enumerate(names):
+            for token in set(tokenize(name)):
+                token_ids.append(index._intern(token))
+                docs.append(doc)
+        for token_id, postings in _group(token_ids, docs).items():
+            index._name_postings[token_id] = postings
+
+        # a category token points at every product of the aisles/departments named with it
+        parts = defaultdict(list)
+        for group_names, group_ids in ((aisles, index._aisle_ids), (departments, index._department_ids)):
+            docs_by_group = _group(group_ids, np.arange(len(ids)))
+            for group_id, group_name in group_names.items():
+                if group_id not in docs_by_group:
+                    continue
+                for token in set(tokenize(group_name)):
+                    parts[index._intern(token)].append(docs_by_group[group_id])
+        for token_id, postings in parts.items():
+            index._category_postings[token_id] = np.unique(np.concatenate(postings))
+
+        index._index_vocabulary()
+        return index
+
+    def _intern(self, token: str) -> int:
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            token_id = len(self._tokens)
+            self._token_ids[token] = token_id
+            self._tokens.append(token)
+            self._name_postings.append(_EMPTY)
+            self._category_postings.append(_EMPTY)
+        return token_id
+
+    def _index_vocabulary(self):
+        order = sorted(range(len(self._tokens)), key=self._tokens.__getitem__)
+        self._sorted_tokens = [self._tokens[token_id] for token_id in order]
+        self._sorted_ids = np.array(order, dtype=np.int32)
+        self._df = np.array(
+            [len(name) + len(category) for name, category in zip(self._name_postings, self._category_postings)],
+            dtype=np.int64,
+        )
+
+        grams, token_ids, counts = [], [], []
+        for token_id, token in enumerate(self._tokens):
+            token_grams = trigrams(token)
+            counts.append(len(token_grams))
+            grams.extend(token_grams)
+            token_ids.extend([token_id] * len(token_grams))
+        self._trigram_counts = np.array(counts, dtype=np.int16)
+
+        gram_codes = {gram: code for code, gram in enumerate(set(grams))}
+        by_code = _group([gram_codes[gram] for gram in grams], token_ids)
+        self._trigram_tokens = {gram: by_code[code] for gram, code in gram_codes.items()}
+
+    def _add_token(self, token: str) -> int:
+        token_id = self._token_ids.get(token)
+        if token_id is not None:
+            return token_id
+
+        token_id = self._intern(token)
+        position = bisect.bisect_left(self._sorted_tokens, token)
+        self._sorted_tokens.insert(position, token)
+        self._sorted_ids = np.insert(self._sorted_ids, position, token_id)
+        self._df = np.append(self._df, 0)
+
+        token_grams = trigrams(token)
+        self._trigram_counts = np.append(self._trigram_counts, len(token_grams))
+        for gram in token_grams:
+            self._trigram_tokens[gram] = np.append(self._trigram_tokens.get(gram, _EMPTY), token_id)
+        return token_id
+
+    def add(
+        self,
+        product_id: int,
+        name: str,
+        price: float,
+        aisle_id: int,
+        aisle_name: str,
+        department_id: int,
+        department_name: str,
+    ):
+        self.remove(product_id)
+
+        doc = len(self._names)
+        self._positions[product_id] = doc
+        for attr, value in (
+            ("_ids", product_id),
+            ("_prices", price),
+            ("_aisle_ids", aisle_id),
+            ("_department_ids", department_id),
+            ("_alive", True),
+            ("_popularity", 0.0),
+        ):
+            setattr(self, attr, _append(getattr(self, attr), self._buffers, attr, value))
+        self._names.append(name)
+        self._aisle_names[aisle_id] = aisle_name
+        self._department_names[department_id] = department_name
+
+        for token in set(tokenize(name)):
+            token_id = self._add_token(token)
+            self._name_postings[token_id] = _append(self._name_postings[token_id], self._buffers, ("name", token_id), doc)
+            self._df[token_id] += 1
+        for token in set(tokenize(aisle_name)) | set(tokenize(department_name)):
+            token_id = self._add_token(token)
+            self._category_postings[token_id] = _append(
+                self._category_postings[token_id], self._buffers, ("category", token_id), doc
+            )
+            self._df[token_id] += 1
+
+    def remove(self, product_id: int) -> bool:
+        doc = self._positions.pop(product_id, None)
+        if doc is None:
+            return False
+        self._alive[doc] = False
+        return True
+
+    def set_popularity(self, orders: pd.Series, version: Optional[str] = None):
+        """Rank by ``orders`` (product_id -> number of prior orders)."""
+        popularity = orders.reindex(self._ids).fillna(0).to_numpy(dtype=np.float64)
+        self._popularity = np.minimum(popularity, RANK_SCALE - 1)
+        self.popularity_version = version
+
+    def _fuzzy(self, term: str) -> List[Tuple[int, float]]:
+        term_grams = trigrams(term)
+        lists = [self._trigram_tokens[gram] for gram in term_grams if gram in self._trigram_tokens]
+        if not lists:
+            return []
+
+        candidates, common = np.unique(np.concatenate(lists), return_counts=True)
+        similarity = 2 * common / (len(term_grams) + self._trigram_counts[candidates])
+        keep = similarity >= FUZZY_MIN_SIMILARITY
+        candidates, similarity = candidates[keep], similarity[keep]
+        if len(candidates) > FUZZY_EXPANSIONS:
+            top = np.argpartition(-similarity, FUZZY_EXPANSIONS)[:FUZZY_EXPANSIONS]
+            candidates, similarity = candidates[top], similarity[top]
+        return list(zip(candidates.tolist(), similarity.tolist()))
+
+    def _match(self, term: str, prefix: bool) -> Dict[int, float]:
+        """Vocabulary tokens matched by ``term``, with their match weight."""
+        matches = {}
+        token_id = self._token_ids.get(term)
+        if token_id is not None:
+            matches[token_id] = 1.0
+
+        if prefix:
+            lo = bisect.bisect_left(self._sorted_tokens, term)
+            hi = bisect.bisect_left(self._sorted_tokens, term + "\x7f", lo)
+            candidates = self._sorted_ids[lo:hi]
+            if len(candidates) > PREFIX_EXPANSIONS:
+                top = np.argpartition(-self._df[candidates], PREFIX_EXPANSIONS)[:PREFIX_EXPANSIONS]
+                candidates = candidates[top]
+            for candidate in candidates.tolist():
+                matches.setdefault(candidate, PREFIX_WEIGHT)
+
+        if not matches and len(term) >= 3:
+            for candidate, similarity in self._fuzzy(term):
+                matches[candidate] = FUZZY_WEIGHT * similarity
+        return matches
+
+    def _postings(self, matches: Dict[int, float]) -> List[Tuple[np.ndarray, float]]:
+        lists = []
+        for token_id, weight in matches.items():
+            for postings, field_weight in (
+                (self._name_postings[token_id], NAME_WEIGHT),
+                (self._category_postings[token_id], CATEGORY_WEIGHT),
+            ):
+                if len(postings):
+                    lists.append((postings, weight * field_weight))
+        return lists
+
+    def _dense(self, lists: List[Tuple[np.ndarray, float]]) -> np.ndarray:
+        """Best weight per document position (0 where no list has it)."""
+        dense = np.zeros(len(self._names), dtype=np.float32)
+        for postings, weight in lists:
+            dense[postings] = np.maximum(dense[postings], weight)
+        return dense
+
+    def _union(self, lists: List[Tuple[np.ndarray, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Documents in any of the posting lists, each with its best weight."""
+        if len(lists) == 1:
+            postings, weight = lists[0]
+            return postings, np.full(len(postings), weight)
+
+        docs = np.concatenate([postings for postings, _ in lists])
+        weights = np.concatenate([np.full(len(postings), weight) for postings, weight in lists])
+        order = np.lexsort((-weights, docs))
+        docs, weights = docs[order], weights[order]
+        first = np.flatnonzero(np.diff(docs, prepend=-1))
+        return docs[first], weights[first]
+
+    @staticmethod
+    def _restrict(docs: np.ndarray, lists: List[Tuple[np.ndarray, float]]) -> np.ndarray:
+        """Best weight of each of ``docs`` in the posting lists (0 if in none)."""
+        weights = np.zeros(len(docs))
+        for postings, weight in lists:
+            # binary-search the shorter array in the longer one
+            if len(postings) < len(docs):
+                positions = np.searchsorted(docs, postings).clip(max=len(docs) - 1)
+                positions = positions[docs[positions] == postings]
+            else:
+                found = np.searchsorted(postings, docs).clip(max=len(postings) - 1)
+                positions = np.flatnonzero(postings[found] == docs)
+            weights[positions] = np.maximum(weights[positions], weight)
+        return weights
+
+    def _candidates(self, term_lists) -> Tuple[np.ndarray, np.ndarray]:
+        """Live documents matching every term, with their summed weights."""
+        # materialize the most selective term, then filter its documents by the others
+        term_lists = sorted(term_lists, key=lambda lists: sum(len(postings) for postings, _ in lists))
+        if sum(len(postings) for postings, _ in term_lists[0]) * DENSE_RATIO > len(self._names):
+            # every term is unselective: whole-catalog arrays beat sorting and searching
+            scores = self._dense(term_lists[0])
+            scores[~self._alive] = 0
+            for lists in term_lists[1:]:
+                weights = self._dense(lists)
+                scores = np.where(weights > 0, scores + weights, 0)
+            docs = np.flatnonzero(scores)
+            return docs, scores[docs].astype(np.float64)
+
+        docs, scores = self._union(term_lists[0])
+        alive = self._alive[docs]
+        docs, scores = docs[alive], scores[alive]
+        for lists in term_lists[1:]:
+            if not len(docs):
+                break
+            weights = self._restrict(docs, lists)
+            found = weights > 0
+            docs, scores = docs[found], scores[found] + weights[found]
+        return docs, scores
+
+    def search(self, query: str, limit: int = 20) -> List[dict]:
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        term_lists = [
+            self._postings(self._match(term, prefix=position == len(terms) - 1))
+            for position, term in enumerate(terms)
+        ]
+        if not all(term_lists):
+            return []
+
+        docs, scores = self._candidates(term_lists)
+        rank = np.round(scores, 3) * RANK_SCALE + self._popularity[docs]
+        top = np.argpartition(-rank, limit)[:limit] if len(docs) > limit else np.arange(len(docs))
+        top = top[np.argsort(-rank[top], kind="stable")]
+
+        return [
+            {
+                "id": int(self._ids[doc]),
+                "name": self._names[doc],
+                "price": float(self._prices[doc]),
+                "aisle": self._aisle_names.get(int(self._aisle_ids[doc])),
+                "department": self._department_names.get(int(self._department_ids[doc])),
+                "orders": int(self._popularity[doc]),
+                "score": round(float(score), 3),
+            }
+            for doc, score in zip(docs[top].tolist(), scores[top].tolist())
+        ]
+
+
+async def build_search_index(db: AsyncSession) -> ProductSearchIndex:
+    result = await db.execute(
+        select(Product.id, Product.name, Product.price, Product.aisle_id, Product.department_id)
+        .order_by(Product.id)
+    )
+    products = result.all()
+    aisles = dict((await db.execute(select(Aisle.id, Aisle.name))).all())
+    departments = dict((await db.execute(select(Department.id, Department.name))).all())
+    index = await asyncio.to_thread(ProductSearchIndex.build, products, aisles, departments)
+
+    # until a feature store exists (fresh deployments), rank by the analytics rollup's order counts
+    if current_feature_store() is None:
+        orders = dict((await db.execute(select(ProductRollup.product_id, ProductRollup.orders))).all())
+        if orders:
+            index.set_popularity(pd.Series(orders), ROLLUP_POPULARITY)
+    return index
+
+
+_index: Optional[ProductSearchIndex] = None
+_index_lock = asyncio.Lock()
+_rebuild_task = None
+# changes made while a rebuild is running, replayed onto the rebuilt index
+_pending = []
+
+
+def _refresh_popularity(index: ProductSearchIndex):
+    store = current_feature_store()
+    if store is not None and store.version != index.popularity_version:
+        index.set_popularity(store.products["orders"], store.version)
+
+
+async def _rebuild():
+    global _index
+    try:
+        async with async_session() as session:
+            index = await build_search_index(session)
+    except Exception:
+        logger.exception("search index rebuild failed")
+        return
+
+    for method, args in _pending:
+        getattr(index, method)(*args)
+    _pending.clear()
+    _index = index
+
+
+async def get_search_index(db: AsyncSession) -> ProductSearchIndex:
+    """The shared index; built on first use and rebuilt in the background every SEARCH_INDEX_TTL seconds."""
+    global _index, _rebuild_task
+
+    if _index is None:
+        async with _index_lock:
+            if _index is None:
+                # popularity comes from the feature store once one exists, see _refresh_popularity;
+                # before that every build reads it from the analytics rollup
+                _index = await build_search_index(db)
+    elif time.monotonic() - _index.built_at > SEARCH_INDEX_TTL:
+        if _rebuild_task is None or _rebuild_task.done():
+            _pending.clear()
+            _rebuild_task = asyncio.create_task(_rebuild())
+
+    _refresh_popularity(_index)
+    return _index
+
+
+def _apply(method: str, *args):
+    if _index is not None:
+        getattr(_index, method)(*args)
+    if _rebuild_task is not None and not _rebuild_task.done():
+        _pending.append((method, args))
+
+
+def index_product_added(
+    product_id: int,
+    name: str,
+    price: float,
+    aisle_id: int,
+    aisle_name: str,
+    department_id: int,
+    department_name: str,
+):
+    _apply("add", product_id, name, price, aisle_id, aisle_name, department_id, department_name)
+
+
+def index_product_removed(product_id: int):
+    _apply("remove", product_id)
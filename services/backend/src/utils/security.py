@@ -0,0 +1,111 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from passlib.context import CryptContext
+
+# full-strength hashing for real accounts (registration, admin)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# synthetic seed accounts: "full" uses pwd_context, "fast" a cheap bcrypt cost
+# (hashes still verify through pwd_context), "shared" one precomputed hash of
+# SEED_SHARED_PASSWORD for every account
+SEED_PASSWORD_MODE = os.getenv("SEED_PASSWORD_MODE", "fast")
+SEED_BCRYPT_ROUNDS = int(os.getenv("SEED_BCRYPT_ROUNDS", "4"))
+SEED_SHARED_PASSWORD = os.getenv("SEED_SHARED_PASSWORD", "user")
+HASH_BATCH_SIZE = 500
+
+seed_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=SEED_BCRYPT_ROUNDS)
+
+# request-path hashing: bcrypt releases the GIL, so a thread pool runs it in parallel
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "64"))
+
+
+def _hash_batch(passwords: List[str], mode: str) -> List[str]:
+    context = pwd_context if mode == "full" else seed_pwd_context
+    return [context.hash(password) for password in passwords]
+
+
+def seed_hash_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Process pool for hash_seed_passwords; create one per seed run and pass it to every call."""
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+async def hash_seed_passwords(
+    passwords: List[str],
+    mode: str = SEED_PASSWORD_MODE,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> List[str]:
+    """Hash many seed-account passwords on all cores without blocking the event loop.
+
+    Without ``pool`` a pool is started for this call alone.
+    """
+    if mode == "shared":
+        hashed = pwd_context.hash(SEED_SHARED_PASSWORD)
+        return [hashed] * len(passwords)
+    if mode not in ("full", "fast"):
+        raise ValueError(f"Unknown SEED_PASSWORD_MODE: {mode}")
+
+    if pool is None:
+        with seed_hash_pool() as pool:
+            return await hash_seed_passwords(passwords, mode, pool)
+
+    loop = asyncio.get_running_loop()
+    batches = [passwords[i:i + HASH_BATCH_SIZE] for i in range(0, len(passwords), HASH_BATCH_SIZE)]
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, _hash_batch, batch, mode) for batch in batches)
+    )
+    return [hashed for batch in results for hashed in batch]
+
+
+class PasswordPoolSaturated(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt hash/verify on a bounded thread pool off the event loop.
+
+    At most ``workers`` calls run at once and ``queue_limit`` more may wait;
+    beyond that calls fail fast with PasswordPoolSaturated (served as 429).
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+
+    async def _run(self, fn, *args):
+        if self.in_flight >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PasswordPoolSaturated()
+
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.in_flight,
+            "queued": max(self.in_flight - self.workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher(PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT)
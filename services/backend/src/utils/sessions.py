@@ -0,0 +1,111 @@
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from src.database.db_init import get_db
+from src.database.db_models import User
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+
+class SessionUser(NamedTuple):
+    id: int
+    username: str
+    is_admin: bool
+
+
+class SessionUserError(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class UserCache:
+    """LRU cache of username -> SessionUser with a per-entry TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, username: str) -> Optional[SessionUser]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+
+        user, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            return None
+
+        self._entries.move_to_end(username)
+        return user
+
+    def put(self, user: SessionUser):
+        self._entries[user.username] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user.username)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def remember_user(request: Request, user: SessionUser):
+    request.session["user"] = user.username
+    request.session["user_id"] = user.id
+    request.session["is_admin"] = user.is_admin
+    user_cache.put(user)
+
+
+def forget_user(request: Request) -> Optional[str]:
+    username = request.session.pop("user", None)
+    request.session.pop("user_id", None)
+    request.session.pop("is_admin", None)
+    if username:
+        user_cache.invalidate(username)
+    return username
+
+
+async def get_current_user(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+) -> SessionUser:
+    """Resolve the logged-in user without a users query where possible.
+
+    Sessions created at login carry the id and admin flag; older sessions fall
+    back to the in-process cache and then to the database.
+    """
+    username = request.session.get("user")
+    if not username:
+        raise SessionUserError("User not logged in")
+
+    user_id = request.session.get("user_id")
+    if user_id is not None:
+        return SessionUser(user_id, username, bool(request.session.get("is_admin")))
+
+    user = user_cache.get(username)
+    if user is None:
+        result = await db.execute(select(User.id, User.username, User.is_admin).where(User.username == username))
+        row = result.first()
+        if row is None:
+            raise SessionUserError("User not found")
+        user = SessionUser(row.id, row.username, bool(row.is_admin))
+
+    remember_user(request, user)
+    return user
+
+
+async def get_admin_user(user: SessionUser = Depends(get_current_user)) -> SessionUser:
+    if not user.is_admin:
+        raise SessionUserError("Admin access required")
+    return user
@@ -0,0 +1,149 @@
+from typing import List
+
+import lightgbm as lgb
+import numpy as np
+
+# LightGBM's kZeroThreshold (the float 1e-35f): inputs with |x| <= it are read as exactly 0
+ZERO_THRESHOLD = float(np.float32(1e-35))
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+
+class TreeEnsemble:
+    """A LightGBM booster flattened into arrays and evaluated with vectorized NumPy.
+
+    Every internal node of every tree gets a row in the node arrays; a child
+    ``c >= 0`` is another node, ``c < 0`` is leaf ``~c``. Categorical splits
+    look the category up in a boolean table with one row per split. Rows of
+    all trees are walked together, one tree level per step.
+    """
+
+    def __init__(self, booster: lgb.Booster):
+        model = booster.dump_model()
+        if model["num_class"] != 1 or model.get("average_output"):
+            raise ValueError("only single-output boosted models are supported")
+        objective = model["objective"].split()
+        if objective[0] == "binary":
+            self.sigmoid = float(objective[1].split(":")[1])
+        elif objective[0] == "regression":
+            self.sigmoid = None
+        else:
+            raise ValueError(f"objective {objective[0]} is not supported")
+        self.num_features = model["max_feature_idx"] + 1
+
+        features, thresholds, lefts, rights = [], [], [], []
+        default_left, missing_types, category_rows = [], [], []
+        categories: List[List[int]] = []
+        leaf_values, roots = [], []
+
+        def add(node) -> int:
+            if "leaf_index" in node or "leaf_value" in node:
+                leaf_values.append(node["leaf_value"])
+                return ~(len(leaf_values) - 1)
+
+            index = len(features)
+            features.append(node["split_feature"])
+            default_left.append(node["default_left"])
+            missing_types.append(MISSING_TYPES[node["missing_type"]])
+            if node["decision_type"] == "==":
+                categories.append([int(value) for value in str(node["threshold"]).split("||")])
+                category_rows.append(len(categories) - 1)
+                thresholds.append(0.0)
+            else:
+                category_rows.append(-1)
+                thresholds.append(node["threshold"])
+            lefts.append(0)
+            rights.append(0)
+            lefts[index] = add(node["left_child"])
+            rights[index] = add(node["right_child"])
+            return index
+
+        for tree in model["tree_info"]:
+            roots.append(add(tree["tree_structure"]))
+
+        self.features = np.array(features, np.int64)
+        self.thresholds = np.array(thresholds, np.float64)
+        self.lefts = np.array(lefts, np.int64)
+        self.rights = np.array(rights, np.int64)
+        self.default_left = np.array(default_left, bool)
+        self.missing_types = np.array(missing_types, np.int8)
+        self.category_rows = np.array(category_rows, np.int64)
+        self.leaf_values = np.array(leaf_values, np.float64)
+        self.roots = np.array(roots, np.int64)
+
+        width = max((max(values) for values in categories), default=-1) + 1
+        self.category_table = np.zeros((max(len(categories), 1), max(width, 1)), bool)
+        for row, values in enumerate(categories):
+            self.category_table[row, values] = True
+
+    def _go_left(self, x: np.ndarray, nodes: np.ndarray) -> np.ndarray:
+        nan = np.isnan(x)
+        missing_types = self.missing_types[nodes]
+
+        # numerical: NaN counts as 0 unless NaN is the missing value
+        value = np.where(nan & (missing_types != MISSING_NAN), 0.0, x)
+        missing = ((missing_types == MISSING_ZERO) & (np.abs(value) <= ZERO_THRESHOLD)) | (
+            (missing_types == MISSING_NAN) & nan
+        )
+        left = np.where(missing, self.default_left[nodes], value <= self.thresholds[nodes])
+
+        category_rows = self.category_rows[nodes]
+        categorical = category_rows >= 0
+        if categorical.any():
+            # LightGBM 3.x (Tree::CategoricalDecision) sends NaN right whatever the missing type,
+            # unlike numerical splits; other values are cast to int, so -0.5 is category 0, and
+            # negative categories and categories the split never saw go right
+            value = np.trunc(x[categorical])
+            valid = ~np.isnan(value) & (value >= 0) & (value < self.category_table.shape[1])
+            codes = np.where(valid, value, 0).astype(np.int64)
+            left[categorical] = valid & self.category_table[category_rows[categorical], codes]
+        return left
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.num_features:
+            raise ValueError(f"expected a (rows, {self.num_features}) matrix, got {X.shape}")
+        # LightGBM drops these from the row before any split sees it, so e.g. -1e-35 compares as 0
+        X = np.where(np.abs(X) <= ZERO_THRESHOLD, 0.0, X)
+
+        rows = np.repeat(np.arange(len(X)), len(self.roots))
+        nodes = np.tile(self.roots, len(X))
+        leaves = np.zeros(len(nodes), np.int64)
+        position = np.arange(len(nodes))
+
+        done = nodes < 0
+        leaves[position[done]] = ~nodes[done]
+        rows, nodes, position = rows[~done], nodes[~done], position[~done]
+        while len(nodes):
+            left = self._go_left(X[rows, self.features[nodes]], nodes)
+            nodes = np.where(left, self.lefts[nodes], self.rights[nodes])
+            done = nodes < 0
+            leaves[position[done]] = ~nodes[done]
+            rows, nodes, position = rows[~done], nodes[~done], position[~done]
+
+        return self.leaf_values[leaves].reshape(len(X), len(self.roots)).sum(axis=1)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        raw = self.predict_raw(X)
+        if self.sigmoid is None:
+            return raw
+        return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+
+
+def probe_matrix(ensemble: TreeEnsemble, rows: int = 2000, seed: int = 0) -> np.ndarray:
+    """Rows mixing every split threshold and category with NaN, zero and negative values, for parity checks."""
+    rng = np.random.default_rng(seed)
+    X = np.empty((rows, ensemble.num_features))
+    for feature in range(ensemble.num_features):
+        nodes = ensemble.features == feature
+        thresholds = ensemble.thresholds[nodes & (ensemble.category_rows < 0)]
+        category_rows = ensemble.category_rows[nodes & (ensemble.category_rows >= 0)]
+        categories = np.flatnonzero(ensemble.category_table[category_rows].any(axis=0))
+        values = np.concatenate([
+            [np.nan, 0.0, -0.5, -1.0, 0.5, 1.0, ensemble.category_table.shape[1]],
+            thresholds,
+            np.nextafter(thresholds, np.inf),
+            categories,
+        ])
+        X[:, feature] = rng.choice(values, rows)
+    return X